@@ -1,6 +1,9 @@
 import hmac
 import hashlib
 import json
+import threading
+import time
+from collections import OrderedDict
 from urllib.parse import parse_qsl
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Tuple
@@ -14,6 +17,19 @@ load_dotenv()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
 JWT_SECRET = os.getenv("JWT_SECRET", "your-secret-key-change-in-production")
 
+# Секретный ключ проверки initData зависит только от токена бота - считаем один раз
+_WEBAPP_SECRET_KEY = hmac.new(b'WebAppData', TELEGRAM_BOT_TOKEN.encode(), hashlib.sha256).digest()
+
+# Кэш проверенных JWT: токен -> (user_id, exp). Повторная проверка того же токена
+# не декодирует его и не считает HMAC заново; exp по-прежнему соблюдается
+JWT_CACHE_ENABLED = os.getenv("JWT_CACHE_ENABLED", "true").lower() == "true"
+JWT_CACHE_MAX_ENTRIES = int(os.getenv("JWT_CACHE_MAX_ENTRIES", "10000"))
+JWT_CACHE_TTL_SECONDS = float(os.getenv("JWT_CACHE_TTL_SECONDS", "300"))
+
+_token_cache: "OrderedDict[str, Tuple[str, float, float]]" = OrderedDict()
+_token_stats = {"hits": 0, "misses": 0}
+_token_lock = threading.Lock()
+
 class TelegramAuthError(Exception):
     pass
 
@@ -36,22 +52,16 @@ def validate_init_data(init_data_str: str) -> Dict:
         f"{k}={v}" for k, v in sorted(parsed_data.items())
     )
     
-    # Генерируем секретный ключ из токена бота
-    secret_key = hmac.new(
-        b'WebAppData',
-        TELEGRAM_BOT_TOKEN.encode(),
-        hashlib.sha256
-    ).digest()
-    
-    # Вычисляем ожидаемый хеш
+    # Вычисляем ожидаемый хеш (секретный ключ из токена бота посчитан заранее)
     calculated_hash = hmac.new(
-        secret_key,
+        _WEBAPP_SECRET_KEY,
         data_check_string.encode(),
         hashlib.sha256
     ).hexdigest()
     
-    # Сравниваем хеши
-    if calculated_hash != received_hash:
+    # Сравниваем хеши (за постоянное время). Байты, а не str: compare_digest
+    # не принимает строки с не-ASCII символами, а hash приходит от клиента
+    if not hmac.compare_digest(calculated_hash.encode(), received_hash.encode()):
         raise TelegramAuthError("Invalid hash - data tampered")
     
     # Проверяем свежесть данных (не старше 5 минут)
@@ -82,13 +92,54 @@ def generate_jwt_token(user_id: str) -> str:
     }
     return jwt.encode(payload, JWT_SECRET, algorithm='HS256')
 
+def _cached_user_id(token: str) -> Optional[str]:
+    now = time.time()
+    with _token_lock:
+        entry = _token_cache.get(token)
+        if entry is None:
+            _token_stats["misses"] += 1
+            return None
+        user_id, exp, cached_until = entry
+        if now >= exp:
+            del _token_cache[token]
+            raise TelegramAuthError("Token expired")
+        if now >= cached_until:
+            del _token_cache[token]
+            _token_stats["misses"] += 1
+            return None
+        _token_cache.move_to_end(token)
+        _token_stats["hits"] += 1
+        return user_id
+
+def _cache_token(token: str, user_id: str, exp: float):
+    with _token_lock:
+        _token_cache[token] = (user_id, exp, time.time() + JWT_CACHE_TTL_SECONDS)
+        _token_cache.move_to_end(token)
+        while len(_token_cache) > JWT_CACHE_MAX_ENTRIES:
+            _token_cache.popitem(last=False)
+
 def verify_jwt_token(token: str) -> str:
-    """Проверяет JWT токен"""
+    """Проверяет JWT токен (повторные проверки - из кэша проверенных токенов)"""
+    if JWT_CACHE_ENABLED:
+        user_id = _cached_user_id(token)
+        if user_id is not None:
+            return user_id
     try:
         payload = jwt.decode(token, JWT_SECRET, algorithms=['HS256'])
-        return payload['user_id']
     except jwt.ExpiredSignatureError:
         raise TelegramAuthError("Token expired")
     except jwt.InvalidTokenError:
         raise TelegramAuthError("Invalid token")
+    if JWT_CACHE_ENABLED and 'exp' in payload:
+        _cache_token(token, payload['user_id'], payload['exp'])
+    return payload['user_id']
+
+def get_token_cache_stats() -> dict:
+    with _token_lock:
+        return {
+            "enabled": JWT_CACHE_ENABLED,
+            "entries": len(_token_cache),
+            "max_entries": JWT_CACHE_MAX_ENTRIES,
+            **_token_stats,
+        }
 
@@ -1,13 +1,26 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, exc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from fastapi import HTTPException, Request
+import asyncio
 import os
+from contextlib import asynccontextmanager
+import random
+import threading
+import time
+from typing import Optional
 from dotenv import load_dotenv
 
 # Загружаем переменные из .env файла (только для локальной разработки)
 # В production (Koyeb) переменные окружения устанавливаются через панель управления
 load_dotenv()
 
+# После load_dotenv: db_pool читает настройки пулов из окружения при импорте
+from app import db_pool
+from app.auth import TelegramAuthError, verify_jwt_token
+
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise ValueError("DATABASE_URL environment variable is required")
@@ -26,25 +39,304 @@ if "neon.tech" in DATABASE_URL or "sslmode=require" in DATABASE_URL:
         # Pooler уже настроен в connection string
         pass
 
-# Создаем engine с connection pooling для Neon
-# pool_size и max_overflow оптимизированы для serverless окружения
+# Создаем engine с connection pooling для Neon.
+# Размеры пулов считаются из лимита соединений БД и числа воркеров (см. db_pool);
+# синхронному engine (создание профиля, фоновые задачи) - четверть доли воркера
 engine = create_engine(
     DATABASE_URL,
     connect_args=connect_args,
-    pool_size=5,
-    max_overflow=10,
-    pool_pre_ping=True,  # Проверяем соединения перед использованием
-    pool_recycle=3600,  # Пересоздаем соединения каждый час
+    poolclass=db_pool.TimedQueuePool,
+    **db_pool.engine_kwargs("primary", 0.25),
 )
+db_pool.register("primary", engine)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+def _async_url(url: str):
+    """Тот же DATABASE_URL для асинхронного драйвера (asyncpg / aiosqlite)"""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend == "postgresql":
+        # asyncpg не понимает libpq-параметры в URL - SSL задаем через connect_args
+        query = {k: v for k, v in parsed.query.items() if k not in ("sslmode", "channel_binding")}
+        return parsed.set(drivername="postgresql+asyncpg", query=query)
+    if backend == "sqlite":
+        return parsed.set(drivername="sqlite+aiosqlite")
+    return parsed
+
+# Асинхронный engine для async-роутов: ожидание БД не занимает поток из threadpool.
+# Сервисы остаются синхронными и выполняются через AsyncSession.run_sync
+async_connect_args = {}
+if connect_args.get("sslmode") == "require":
+    async_connect_args = {"ssl": "require", "timeout": 10}
+
+async_engine = create_async_engine(
+    _async_url(DATABASE_URL),
+    connect_args=async_connect_args,
+    poolclass=db_pool.TimedAsyncQueuePool,
+    **db_pool.engine_kwargs("primary_async", 0.75),
+)
+db_pool.register("primary_async", async_engine)
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+# Реплика для чтения (необязательно). Без DATABASE_READ_URL все чтения идут в основную БД
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+# Сколько секунд после записи пользователь читает из основной БД (read-your-writes,
+# должно покрывать отставание реплики)
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+if DATABASE_READ_URL:
+    async_read_connect_args = {}
+    if "neon.tech" in DATABASE_READ_URL or "sslmode=require" in DATABASE_READ_URL:
+        async_read_connect_args = {"ssl": "require", "timeout": 10}
+    async_read_engine = create_async_engine(
+        _async_url(DATABASE_READ_URL),
+        connect_args=async_read_connect_args,
+        poolclass=db_pool.TimedAsyncQueuePool,
+        **db_pool.engine_kwargs("replica_async", 1.0),
+    )
+    db_pool.register("replica_async", async_read_engine)
+    AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+else:
+    async_read_engine = async_engine
+    AsyncReadSessionLocal = AsyncSessionLocal
+
+# user_id -> момент (time.monotonic), до которого его чтения идут в основную БД;
+# то же для профилей, которые пользователь только что изменил (чтение по profile_id).
+# Закрепление живет в памяти воркера
+_pinned = {}
+_pinned_profiles = {}
+_routing_stats = {"primary_reads": 0, "replica_reads": 0}
+_routing_lock = threading.Lock()
+
+# Повтор подключения при временных ошибках (просыпающийся Neon compute, обрыв соединения)
+DB_CONNECT_RETRIES = int(os.getenv("DB_CONNECT_RETRIES", "3"))
+DB_CONNECT_BACKOFF_MS = float(os.getenv("DB_CONNECT_BACKOFF_MS", "200"))
+# Бюджеты statement_timeout (мс, 0 - без ограничения): медленный запрос не держит
+# соединение из пула дольше бюджета своего роута
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "10000"))  # записи и остальное
+DB_LIST_TIMEOUT_MS = int(os.getenv("DB_LIST_TIMEOUT_MS", "5000"))  # лента, списки
+DB_LOOKUP_TIMEOUT_MS = int(os.getenv("DB_LOOKUP_TIMEOUT_MS", "2000"))  # чтение одной записи по ключу
+# Соединение, которым не пользовались дольше (секунды), при выдаче сессии проверяется
+# повторным SET statement_timeout
+DB_VERIFY_IDLE_SECONDS = float(os.getenv("DB_VERIFY_IDLE_SECONDS", "1"))
+
 Base = declarative_base()
 
+def _is_transient(error: Exception) -> bool:
+    """Ошибка подключения, после которой имеет смысл повторить попытку"""
+    if isinstance(error, exc.DBAPIError):
+        return error.connection_invalidated or isinstance(error, (exc.OperationalError, exc.InterfaceError))
+    return isinstance(error, (OSError, asyncio.TimeoutError))
+
+def _backoff_seconds(attempt: int) -> float:
+    # Экспоненциальная пауза с джиттером, не больше 2 секунд
+    return min(DB_CONNECT_BACKOFF_MS * 2 ** (attempt - 1), 2000) * random.uniform(0.5, 1.0) / 1000
+
+def _behind_pooler(connection) -> bool:
+    """Соединение через pooler в режиме транзакций (Neon, хост с -pooler): настройки сессии в нем не держатся"""
+    return "-pooler" in (connection.engine.url.host or "")
+
+@event.listens_for(Session, "after_begin")
+def _apply_statement_timeout(session, transaction, connection):
+    """
+    Бюджет statement_timeout сессии (session.info, см. _open_session) ставится на
+    соединение один раз, а не в каждой транзакции: SET идет вне транзакции
+    (autocommit) и держится, пока соединение живет в пуле. Повторный SET - только
+    при другом бюджете или если соединением не пользовались дольше
+    DB_VERIFY_IDLE_SECONDS: тогда он же проверяет соединение, и обрыв ловится
+    повтором в _open_session. Через pooler - SET LOCAL в каждой транзакции.
+    """
+    if connection.dialect.name != "postgresql":
+        return
+    timeout_ms = session.info.get("statement_timeout_ms")
+    if _behind_pooler(connection):
+        if timeout_ms is not None:
+            connection.exec_driver_sql(f"SET LOCAL statement_timeout = {int(timeout_ms)}")
+        return
+
+    info = connection.connection.info
+    now = time.monotonic()
+    used_at = info.get("used_at")
+    info["used_at"] = now
+    current = info.get("statement_timeout_ms")
+    if current == timeout_ms and (timeout_ms is None or (used_at is not None and now - used_at <= DB_VERIFY_IDLE_SECONDS)):
+        return
+    # Сессии без бюджета (фоновые задачи) получают значение сервера по умолчанию
+    sql = "RESET statement_timeout" if timeout_ms is None else f"SET statement_timeout = {int(timeout_ms)}"
+    dbapi_connection = connection.connection.dbapi_connection
+    autocommit = dbapi_connection.autocommit
+    dbapi_connection.autocommit = True
+    try:
+        connection.exec_driver_sql(sql)
+    finally:
+        if not connection.invalidated:
+            dbapi_connection.autocommit = autocommit
+    info["statement_timeout_ms"] = timeout_ms
+
+def _connection_failed(attempt: int, error: Exception):
+    """Решает, повторять ли подключение; после последней попытки отвечает 503"""
+    if not _is_transient(error):
+        raise error
+    if attempt >= DB_CONNECT_RETRIES:
+        print(f"[database] Connection failed after {attempt} attempts: {error}")
+        raise HTTPException(status_code=503, detail="База данных временно недоступна, повторите запрос")
+    print(f"[database] Connection failed (attempt {attempt}), retrying: {error}")
+
+def _open_session(session_factory, timeout_ms: int) -> Session:
+    """
+    Сессия с бюджетом timeout_ms и уже выданным соединением: checkout и SET
+    statement_timeout (см. _apply_statement_timeout) идут до возврата сессии,
+    их временные ошибки повторяются с паузой
+    """
+    for attempt in range(1, DB_CONNECT_RETRIES + 1):
+        db = session_factory()
+        db.info["statement_timeout_ms"] = timeout_ms
+        try:
+            db.connection()
+            return db
+        except Exception as e:
+            db.close()
+            _connection_failed(attempt, e)
+        time.sleep(_backoff_seconds(attempt))
+
+async def _open_async_session(session_factory, timeout_ms: int) -> AsyncSession:
+    for attempt in range(1, DB_CONNECT_RETRIES + 1):
+        db = session_factory()
+        db.sync_session.info["statement_timeout_ms"] = timeout_ms
+        try:
+            await db.connection()
+            return db
+        except Exception as e:
+            await db.close()
+            _connection_failed(attempt, e)
+        await asyncio.sleep(_backoff_seconds(attempt))
+
 def get_db():
-    db = SessionLocal()
+    db = _open_session(SessionLocal, DB_STATEMENT_TIMEOUT_MS)
     try:
         yield db
     finally:
         db.close()
 
+@asynccontextmanager
+async def open_async_db(request: Request, timeout_ms: int = DB_STATEMENT_TIMEOUT_MS, read_only: bool = False):
+    """
+    Async-сессия со своим бюджетом statement_timeout - для роутов, которым БД нужна
+    не всегда (сначала отвечают из памяти). Остальные роуты берут ее через async_db().
+    """
+    session_factory = AsyncSessionLocal
+    if read_only and _use_replica(request):
+        session_factory = AsyncReadSessionLocal
+    db = await _open_async_session(session_factory, timeout_ms)
+    try:
+        yield db
+    finally:
+        await db.close()
+
+def async_db(timeout_ms: int = DB_STATEMENT_TIMEOUT_MS, read_only: bool = False):
+    """
+    Зависимость с async-сессией и своим бюджетом statement_timeout.
+    read_only=True - роут только читает и может идти в реплику (см. get_async_read_db).
+    """
+    async def dependency(request: Request):
+        async with open_async_db(request, timeout_ms, read_only) as db:
+            yield db
+    return dependency
+
+get_async_db = async_db()
+
+def _pin_locked(pinned: dict, key: int, now: float):
+    pinned[key] = now + READ_YOUR_WRITES_SECONDS
+    # Чистим истекшие закрепления, чтобы словарь не рос
+    if len(pinned) > 10000:
+        for pinned_key, until in list(pinned.items()):
+            if until <= now:
+                del pinned[pinned_key]
+
+def _is_pinned_locked(pinned: dict, key: int) -> bool:
+    until = pinned.get(key)
+    if until is None:
+        return False
+    if until <= time.monotonic():
+        del pinned[key]
+        return False
+    return True
+
+def pin_to_primary(user_id: int, profile_id: Optional[int] = None):
+    """
+    Вызывается после записи: ближайшие READ_YOUR_WRITES_SECONDS пользователь читает
+    из основной БД. profile_id - измененный профиль: его чтения по /{profile_id}
+    (без user_id в запросе) тоже идут в основную БД.
+    """
+    if not DATABASE_READ_URL or user_id is None:
+        return
+    now = time.monotonic()
+    with _routing_lock:
+        _pin_locked(_pinned, user_id, now)
+        if profile_id is not None:
+            _pin_locked(_pinned_profiles, profile_id, now)
+
+def is_pinned(user_id: int) -> bool:
+    with _routing_lock:
+        return _is_pinned_locked(_pinned, user_id)
+
+def _int_or_none(value):
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+def _request_user_id(request: Request):
+    """
+    user_id запроса: из пути (/user/{user_id}), из query (?user_id=) или из
+    JWT в заголовке Authorization (проверка берется из кэша токенов app.auth)
+    """
+    user_id = _int_or_none(request.path_params.get("user_id") or request.query_params.get("user_id"))
+    if user_id is not None:
+        return user_id
+    authorization = request.headers.get("authorization")
+    if authorization and authorization.startswith("Bearer "):
+        try:
+            return _int_or_none(verify_jwt_token(authorization[7:]))
+        except TelegramAuthError:
+            return None
+    return None
+
+def _request_pinned(request: Request) -> bool:
+    """Пользователь запроса или читаемый профиль (/{profile_id}) недавно изменялись"""
+    user_id = _request_user_id(request)
+    profile_id = _int_or_none(request.path_params.get("profile_id"))
+    with _routing_lock:
+        return (
+            (user_id is not None and _is_pinned_locked(_pinned, user_id))
+            or (profile_id is not None and _is_pinned_locked(_pinned_profiles, profile_id))
+        )
+
+def _use_replica(request: Request) -> bool:
+    """
+    Чтение идет в реплику, если она настроена, а пользователь запроса и
+    читаемый профиль недавно не изменялись; иначе в основную БД.
+    """
+    use_replica = async_read_engine is not async_engine and not _request_pinned(request)
+    with _routing_lock:
+        _routing_stats["replica_reads" if use_replica else "primary_reads"] += 1
+    return use_replica
+
+def is_replica(db: Session) -> bool:
+    """Сессия (синхронная, как внутри run_sync) читает из реплики"""
+    return async_read_engine is not async_engine and db.get_bind() is async_read_engine.sync_engine
+
+# Сессии для роутов, которые только читают: списки и чтение одной записи
+get_async_read_db = async_db(DB_LIST_TIMEOUT_MS, read_only=True)
+get_async_lookup_db = async_db(DB_LOOKUP_TIMEOUT_MS, read_only=True)
+
+def get_routing_stats() -> dict:
+    with _routing_lock:
+        now = time.monotonic()
+        return {
+            "replica": bool(DATABASE_READ_URL),
+            "pinned_users": sum(1 for until in _pinned.values() if until > now),
+            **_routing_stats,
+        }
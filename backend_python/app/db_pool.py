@@ -0,0 +1,366 @@
+"""
+Пулы соединений с БД: размеры, метрики, фоновая проверка живости и прогрев.
+
+Размеры пулов считаются из лимита соединений БД (DB_MAX_CONNECTIONS) и
+числа воркеров uvicorn (WEB_CONCURRENCY): каждому воркеру достается равная
+доля лимита, которая делится между его engine'ами. DB_POOL_SIZE /
+DB_MAX_OVERFLOW задают размеры явно.
+
+Вместо pool_pre_ping (лишний SELECT 1 на каждый checkout) фоновая задача
+раз в DB_POOL_LIVENESS_SECONDS пингует соединение из пула. Пул отдает
+соединения по FIFO, поэтому пинг каждый раз достается самому давно
+простаивающему. При обрыве SQLAlchemy инвалидирует весь пул, и следующие
+checkout'ы получат новые соединения. Соединение, оборвавшееся между пингами
+и простоявшее дольше DB_VERIFY_IDLE_SECONDS, падает на SET statement_timeout
+при выдаче сессии, и database повторяет подключение. Если проверка живости выключена
+(DB_POOL_LIVENESS_SECONDS=0), включается pool_pre_ping - соединения сессий
+без этого повтора (фоновые задачи) иначе не проверялись бы ничем.
+
+Холодный старт Neon: при запуске приложения пулы прогреваются
+(DB_POOL_PREWARM соединений). Простаивающий пул не пингуется, чтобы compute
+мог уснуть; первый checkout после DB_POOL_IDLE_SECONDS простоя считает старые
+соединения оборванными и фоном прогревает пул заново.
+
+Метрики (занято, overflow, время ожидания соединения, задержка пинга)
+доступны через get_stats() - см. /api/debug/pool.
+"""
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from typing import Dict, Tuple
+
+from sqlalchemy import event, exc, text
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Лимит соединений БД на все приложение (max_connections compute или лимит pooler'а)
+DB_MAX_CONNECTIONS = int(os.getenv("DB_MAX_CONNECTIONS", "20"))
+# Сколько соединений оставляем под миграции, psql и архивацию с другого хоста
+DB_RESERVED_CONNECTIONS = int(os.getenv("DB_RESERVED_CONNECTIONS", "3"))
+# Число воркеров uvicorn (uvicorn читает ту же переменную)
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DB_POOL_SIZE = os.getenv("DB_POOL_SIZE")
+DB_MAX_OVERFLOW = os.getenv("DB_MAX_OVERFLOW")
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() == "true"
+DB_POOL_LIVENESS_SECONDS = float(os.getenv("DB_POOL_LIVENESS_SECONDS", "30"))
+# Ожидание соединения дольше этого порога считается медленным и пишется в лог
+DB_POOL_SLOW_WAIT_MS = float(os.getenv("DB_POOL_SLOW_WAIT_MS", "50"))
+# Сколько соединений открываем заранее: при старте и после простоя
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", "2"))
+# Простой пула, после которого его соединения считаются потерянными
+# (Neon усыпляет compute через 5 минут без запросов)
+DB_POOL_IDLE_SECONDS = float(os.getenv("DB_POOL_IDLE_SECONDS", "240"))
+
+_stats: Dict[str, dict] = {}
+_engines: Dict[str, object] = {}
+# name -> max_overflow из engine_kwargs (пул наружу отдает только текущий overflow)
+_max_overflow: Dict[str, int] = {}
+# name -> time.monotonic() последнего checkout'а запросом (пинги не считаются)
+_last_used: Dict[str, float] = {}
+# Пулы, которые сейчас прогреваются
+_warming: set = set()
+_lock = threading.Lock()
+# Флаг "checkout делает liveness-пинг" (свой у каждого потока и каждой asyncio-задачи)
+_pinging = contextvars.ContextVar("db_pool_pinging", default=False)
+_stopping = threading.Event()
+_sync_worker = None
+_async_task = None
+
+def pool_limits(share: float) -> Tuple[int, int]:
+    """(pool_size, max_overflow) для engine'а, которому достается share доли воркера"""
+    if DB_POOL_SIZE is not None or DB_MAX_OVERFLOW is not None:
+        return int(DB_POOL_SIZE or 5), int(DB_MAX_OVERFLOW or 10)
+    per_worker = max(2, (DB_MAX_CONNECTIONS - DB_RESERVED_CONNECTIONS) // max(1, WEB_CONCURRENCY))
+    total = max(2, int(per_worker * share))
+    # Половина держится открытой, остальное - overflow под пики
+    pool_size = max(1, total // 2)
+    return pool_size, total - pool_size
+
+def _entry(name: str) -> dict:
+    entry = _stats.get(name)
+    if entry is None:
+        entry = _stats[name] = {
+            "acquires": 0, "wait_ms_total": 0.0, "wait_ms_max": 0.0, "slow_waits": 0, "timeouts": 0,
+            "pings": 0, "ping_failures": 0, "ping_ms_last": None, "ping_ms_total": 0.0, "last_ping_at": None,
+            "idle_resets": 0,
+        }
+    return entry
+
+def _record_wait(name: str, wait_ms: float, timed_out: bool):
+    with _lock:
+        entry = _entry(name)
+        if timed_out:
+            entry["timeouts"] += 1
+            return
+        entry["acquires"] += 1
+        entry["wait_ms_total"] += wait_ms
+        entry["wait_ms_max"] = max(entry["wait_ms_max"], wait_ms)
+        if wait_ms >= DB_POOL_SLOW_WAIT_MS:
+            entry["slow_waits"] += 1
+    if wait_ms >= DB_POOL_SLOW_WAIT_MS:
+        print(f"[db_pool] {name}: waited {wait_ms:.2f}ms for a connection")
+
+def _record_ping(name: str, ping_ms: float, ok: bool):
+    with _lock:
+        entry = _entry(name)
+        entry["pings"] += 1
+        entry["last_ping_at"] = time.time()
+        if ok:
+            entry["ping_ms_last"] = ping_ms
+            entry["ping_ms_total"] += ping_ms
+        else:
+            entry["ping_failures"] += 1
+
+def _mark_used(name: str) -> bool:
+    """Отмечает checkout запросом; True, если перед ним пул простаивал дольше DB_POOL_IDLE_SECONDS"""
+    if _pinging.get():
+        return False
+    now = time.monotonic()
+    with _lock:
+        last_used = _last_used.get(name)
+        _last_used[name] = now
+        if last_used is None or now - last_used <= DB_POOL_IDLE_SECONDS:
+            return False
+        _entry(name)["idle_resets"] += 1
+        return True
+
+class TimedQueuePool(QueuePool):
+    """QueuePool, который замеряет, сколько checkout ждал соединение (имя пула - pool_logging_name)"""
+
+    def _do_get(self):
+        name = self.logging_name or "default"
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            _record_wait(name, 0.0, True)
+            raise
+        _record_wait(name, (time.perf_counter() - start) * 1000, False)
+        return connection
+
+class TimedAsyncQueuePool(TimedQueuePool, AsyncAdaptedQueuePool):
+    """То же для async engine'ов"""
+
+def _pre_ping() -> bool:
+    return DB_POOL_PRE_PING or DB_POOL_LIVENESS_SECONDS <= 0
+
+def engine_kwargs(name: str, share: float) -> dict:
+    """Параметры пула для create_engine/create_async_engine"""
+    pool_size, max_overflow = pool_limits(share)
+    with _lock:
+        _max_overflow[name] = max_overflow
+    return {
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_pre_ping": _pre_ping(),
+        "pool_recycle": 3600,  # Пересоздаем соединения каждый час
+        "pool_logging_name": name,
+    }
+
+def _on_checkout(name: str):
+    def listener(dbapi_connection, connection_record, connection_proxy):
+        if _mark_used(name):
+            _prewarm_in_background(name)
+            # Соединения пережили засыпание compute - считаем их оборванными, как
+            # SQLAlchemy после disconnect: пул инвалидирует все соединения старше
+            # этого момента, а checkout повторяется на новом соединении
+            raise exc.InvalidatePoolError(f"{name} pool was idle for over {DB_POOL_IDLE_SECONDS}s")
+    return listener
+
+def register(name: str, engine):
+    """Добавляет engine в метрики, проверку живости и прогрев"""
+    with _lock:
+        _engines[name] = engine
+        _entry(name)
+    event.listen(engine.sync_engine if _is_async(engine) else engine, "checkout", _on_checkout(name))
+
+def _is_async(engine) -> bool:
+    return hasattr(engine, "sync_engine")
+
+def _should_ping(name: str, engine) -> bool:
+    # Пингуем только простаивающие соединения (занятые и так используются) и только
+    # пока пул в работе - иначе пинги не дали бы Neon усыпить compute
+    with _lock:
+        last_used = _last_used.get(name)
+    if last_used is None or time.monotonic() - last_used > DB_POOL_IDLE_SECONDS:
+        return False
+    return engine.pool.checkedin() > 0
+
+def _ping_sync(name: str, engine):
+    if not _should_ping(name, engine):
+        return
+    start = time.perf_counter()
+    token = _pinging.set(True)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+        _record_ping(name, (time.perf_counter() - start) * 1000, True)
+    except Exception as e:
+        _record_ping(name, 0.0, False)
+        print(f"[db_pool] {name}: liveness check failed: {e}")
+    finally:
+        _pinging.reset(token)
+
+async def _ping_async(name: str, engine):
+    if not _should_ping(name, engine):
+        return
+    start = time.perf_counter()
+    token = _pinging.set(True)
+    try:
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+        _record_ping(name, (time.perf_counter() - start) * 1000, True)
+    except Exception as e:
+        _record_ping(name, 0.0, False)
+        print(f"[db_pool] {name}: liveness check failed: {e}")
+    finally:
+        _pinging.reset(token)
+
+def _prewarm_count(engine) -> int:
+    return max(0, min(DB_POOL_PREWARM, engine.pool.size()))
+
+def _prewarm_sync(name: str, engine):
+    """Открывает до DB_POOL_PREWARM соединений и возвращает их в пул"""
+    connections = []
+    start = time.perf_counter()
+    try:
+        for _ in range(_prewarm_count(engine)):
+            connections.append(engine.raw_connection())
+    except Exception as e:
+        print(f"[db_pool] {name}: prewarm failed: {e}")
+    finally:
+        for connection in connections:
+            connection.close()
+        with _lock:
+            _warming.discard(name)
+    if connections:
+        print(f"[db_pool] {name}: prewarmed {len(connections)} connections in {(time.perf_counter() - start) * 1000:.2f}ms")
+
+async def _prewarm_async(name: str, engine):
+    """То же для async engine: соединения открываются параллельно"""
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(engine.connect().start() for _ in range(_prewarm_count(engine))),
+        return_exceptions=True
+    )
+    connections = [r for r in results if not isinstance(r, BaseException)]
+    for connection in connections:
+        await connection.close()
+    with _lock:
+        _warming.discard(name)
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        print(f"[db_pool] {name}: prewarm failed: {errors[0]}")
+    if connections:
+        print(f"[db_pool] {name}: prewarmed {len(connections)} connections in {(time.perf_counter() - start) * 1000:.2f}ms")
+
+def _prewarm_in_background(name: str):
+    """Прогрев после простоя: текущий запрос открывает свое соединение, остальные - фоном"""
+    with _lock:
+        engine = _engines.get(name)
+        if engine is None or name in _warming or DB_POOL_PREWARM <= 0:
+            return
+        _warming.add(name)
+    if _is_async(engine):
+        try:
+            asyncio.get_running_loop().create_task(_prewarm_async(name, engine))
+        except RuntimeError:
+            with _lock:
+                _warming.discard(name)
+        return
+    threading.Thread(target=_prewarm_sync, args=(name, engine), name="db-pool-prewarm", daemon=True).start()
+
+async def prewarm_all():
+    """Прогрев всех пулов при старте; ошибки только логируются - старт не блокируем"""
+    if DB_POOL_PREWARM <= 0:
+        return
+    with _lock:
+        engines = list(_engines.items())
+        _warming.update(name for name, _ in engines)
+    tasks = []
+    for name, engine in engines:
+        if _is_async(engine):
+            tasks.append(_prewarm_async(name, engine))
+        else:
+            tasks.append(asyncio.to_thread(_prewarm_sync, name, engine))
+    try:
+        # Не дольше, чем просыпается compute; дальше пулы догреются первыми запросами
+        await asyncio.wait_for(asyncio.gather(*tasks), timeout=15)
+    except asyncio.TimeoutError:
+        print("[db_pool] Prewarm did not finish in 15s, continuing startup")
+
+def _run_sync():
+    while not _stopping.wait(DB_POOL_LIVENESS_SECONDS):
+        with _lock:
+            engines = [(name, engine) for name, engine in _engines.items() if not _is_async(engine)]
+        for name, engine in engines:
+            _ping_sync(name, engine)
+
+async def _run_async():
+    while not _stopping.is_set():
+        await asyncio.sleep(DB_POOL_LIVENESS_SECONDS)
+        with _lock:
+            engines = [(name, engine) for name, engine in _engines.items() if _is_async(engine)]
+        for name, engine in engines:
+            await _ping_async(name, engine)
+
+def start():
+    """Запускает проверку живости (вызывается из lifespan - async пулы пингуются в его event loop)"""
+    global _sync_worker, _async_task
+    if DB_POOL_LIVENESS_SECONDS <= 0:
+        return
+    _stopping.clear()
+    if _sync_worker is None or not _sync_worker.is_alive():
+        _sync_worker = threading.Thread(target=_run_sync, name="db-pool-liveness", daemon=True)
+        _sync_worker.start()
+    if _async_task is None or _async_task.done():
+        _async_task = asyncio.get_running_loop().create_task(_run_async())
+
+def shutdown():
+    global _async_task
+    _stopping.set()
+    if _async_task is not None:
+        _async_task.cancel()
+        _async_task = None
+
+def get_stats() -> dict:
+    with _lock:
+        engines = dict(_engines)
+        stats = {name: dict(entry) for name, entry in _stats.items()}
+        last_used = dict(_last_used)
+        max_overflow = dict(_max_overflow)
+    result = {}
+    now = time.monotonic()
+    for name, engine in engines.items():
+        pool = engine.pool
+        entry = stats.get(name, {})
+        acquires = entry.get("acquires", 0)
+        pings_ok = entry.get("pings", 0) - entry.get("ping_failures", 0)
+        result[name] = {
+            "pool_size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": max(0, pool.overflow()),
+            "max_overflow": max_overflow.get(name),
+            "acquires": acquires,
+            "wait_ms_avg": round(entry["wait_ms_total"] / acquires, 3) if acquires else 0,
+            "wait_ms_max": round(entry.get("wait_ms_max", 0.0), 3),
+            "slow_waits": entry.get("slow_waits", 0),
+            "timeouts": entry.get("timeouts", 0),
+            "pings": entry.get("pings", 0),
+            "ping_failures": entry.get("ping_failures", 0),
+            "ping_ms_last": round(entry["ping_ms_last"], 3) if entry.get("ping_ms_last") is not None else None,
+            "ping_ms_avg": round(entry["ping_ms_total"] / pings_ok, 3) if pings_ok else None,
+            "last_ping_ago_s": round(time.time() - entry["last_ping_at"], 1) if entry.get("last_ping_at") else None,
+            "idle_s": round(now - last_used[name], 1) if name in last_used else None,
+            "idle_resets": entry.get("idle_resets", 0),
+        }
+    return {
+        "workers": WEB_CONCURRENCY,
+        "db_max_connections": DB_MAX_CONNECTIONS,
+        "pre_ping": _pre_ping(),
+        "liveness_seconds": DB_POOL_LIVENESS_SECONDS,
+        "idle_seconds": DB_POOL_IDLE_SECONDS,
+        "pools": result,
+    }
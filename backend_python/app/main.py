@@ -1,19 +1,34 @@
-from fastapi import FastAPI, Request, status, Depends, HTTPException, UploadFile, File, Form
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, status, HTTPException
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, RedirectResponse, Response
-from starlette.middleware.base import BaseHTTPMiddleware
+from fastapi.responses import FileResponse, RedirectResponse
 from starlette.types import ASGIApp
-from app.routers import profiles, matches, auth, debug
-from app.routers.profiles import _create_profile_impl
-from app.database import get_db
-from app.schemas import ProfileResponse
-from sqlalchemy.orm import Session
-from typing import Optional
+from app.routers import profiles, matches, auth, debug, events
+from app.database import async_engine, async_read_engine
+from app.middleware import EdgeMiddleware
+from app.services import swipe_buffer, swipe_archive, profile_cache, profile_membership
+from app import db_pool
+from contextlib import asynccontextmanager
 import os
 from pathlib import Path
 
-app = FastAPI(title="Networking App API", version="1.0.0", redirect_slashes=False)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await db_pool.prewarm_all()
+    db_pool.start()
+    profile_membership.start()
+    swipe_archive.start()
+    yield
+    swipe_archive.shutdown()
+    profile_membership.shutdown()
+    profile_cache.shutdown()
+    db_pool.shutdown()
+    # Дописываем в БД пассы, накопленные в очереди write-behind
+    swipe_buffer.shutdown()
+    await async_engine.dispose()
+    if async_read_engine is not async_engine:
+        await async_read_engine.dispose()
+
+app = FastAPI(title="Networking App API", version="1.0.0", redirect_slashes=False, lifespan=lifespan)
 
 # CORS
 allowed_origins = [
@@ -68,166 +83,26 @@ if is_production:
 # Логируем разрешенные origins для отладки
 print(f"[CORS] Allowed origins: {allowed_origins}")
 
-# Middleware для логирования и обработки trailing slash
-class TrailingSlashMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        path = request.url.path
-        method = request.method
-        
-        # Логируем все POST запросы к /api/profiles
-        if path.startswith("/api/profiles") and method == "POST":
-            print(f"[TrailingSlashMiddleware] POST request to: {path}")
-        
-        response = await call_next(request)
-        
-        # Если получили 405 для POST /api/profiles/, логируем
-        if path == "/api/profiles/" and method == "POST" and response.status_code == 405:
-            print(f"[TrailingSlashMiddleware] Got 405 for POST /api/profiles/, trying to handle...")
-        
-        return response
-
-app.add_middleware(TrailingSlashMiddleware)
-
-# Кастомный CORS middleware для поддержки regex паттернов Telegram доменов
-class CustomCORSMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        origin = request.headers.get("origin")
-        method = request.method
-        path = request.url.path
-        
-        # #region agent log
-        import json
-        log_data = {
-            "location": "main.py:84",
-            "message": "CORS middleware check",
-            "data": {
-                "origin": origin,
-                "method": method,
-                "path": path,
-                "allowed_origins": allowed_origins,
-                "is_production": is_production
-            },
-            "timestamp": int(__import__('time').time() * 1000),
-            "sessionId": "debug-session",
-            "runId": "run1",
-            "hypothesisId": "C"
-        }
-        try:
-            with open("c:\\Users\\Lenovo\\max-networking-app\\.cursor\\debug.log", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_data) + "\n")
-        except:
-            pass
-        # #endregion
-        
-        # Проверяем, разрешен ли origin
-        is_allowed = False
-        if origin:
-            # Проверяем точное совпадение
-            if origin in allowed_origins:
-                is_allowed = True
-            # Проверяем Telegram домены по regex
-            elif is_production:
-                import re
-                telegram_pattern = re.compile(r"^https://(web|webk|webz|desktop)\.telegram\.org$")
-                if telegram_pattern.match(origin):
-                    is_allowed = True
-            # Проверяем Netlify домены
-            if origin.endswith('.netlify.app'):
-                is_allowed = True
-        
-        # #region agent log
-        log_data2 = {
-            "location": "main.py:108",
-            "message": "CORS decision",
-            "data": {
-                "origin": origin,
-                "is_allowed": is_allowed,
-                "method": method
-            },
-            "timestamp": int(__import__('time').time() * 1000),
-            "sessionId": "debug-session",
-            "runId": "run1",
-            "hypothesisId": "C"
-        }
-        try:
-            with open("c:\\Users\\Lenovo\\max-networking-app\\.cursor\\debug.log", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_data2) + "\n")
-        except:
-            pass
-        # #endregion
-        
-        # Если origin разрешен, добавляем CORS заголовки
-        response = await call_next(request)
-        if is_allowed and origin:
-            response.headers["Access-Control-Allow-Origin"] = origin
-            response.headers["Access-Control-Allow-Credentials"] = "true"
-            response.headers["Access-Control-Allow-Methods"] = "GET, POST, PUT, DELETE, OPTIONS, PATCH"
-            response.headers["Access-Control-Allow-Headers"] = "*"
-            response.headers["Access-Control-Expose-Headers"] = "*"
-        
-        # Обрабатываем preflight запросы
-        if request.method == "OPTIONS" and is_allowed:
-            return Response(status_code=200, headers=dict(response.headers))
-        
-        return response
-
-# Используем кастомный CORS middleware в production для поддержки всех Telegram доменов
-# В development используем стандартный CORSMiddleware
-if is_production:
-    app.add_middleware(CustomCORSMiddleware)
-    # Также добавляем стандартный для совместимости
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=allowed_origins,
-        allow_credentials=True,
-        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
-        allow_headers=["*"],
-        expose_headers=["*"],
-    )
-else:
-    app.add_middleware(
-        CORSMiddleware,
-        allow_origins=allowed_origins,
-        allow_credentials=True,
-        allow_methods=["GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"],
-        allow_headers=["*"],
-        expose_headers=["*"],
-    )
+# CORS и слэш в конце пути - один ASGI middleware (см. app/middleware.py).
+# В production дополнительно разрешены все *.netlify.app (превью деплоев)
+app.add_middleware(
+    EdgeMiddleware,
+    allow_origins=allowed_origins,
+    allow_origin_regex=r"https?://[^/]+\.netlify\.app" if is_production else None,
+    # "*" не действует для запросов с credentials - X-Next-Cursor перечислен явно
+    expose_headers=["*", "X-Next-Cursor"],
+)
 
 # Роутеры - ВАЖНО: регистрируем в правильном порядке
 # Сначала более специфичные, потом общие
 # API роуты должны быть зарегистрированы ДО catch-all роута
 
-# Дополнительный роут для POST /api/profiles/ (со слэшем) - регистрируем ПЕРЕД роутером
-# чтобы он обрабатывался первым
-@app.post("/api/profiles/", response_model=ProfileResponse, include_in_schema=True, tags=["profiles"])
-async def create_profile_slash_fallback(
-    user_id: int = Form(...),
-    name: str = Form(...),
-    gender: str = Form(...),
-    age: int = Form(...),
-    city: str = Form(...),
-    university: str = Form(...),
-    interests: str = Form(...),
-    goals: str = Form(...),
-    bio: Optional[str] = Form(None),
-    username: Optional[str] = Form(None),
-    first_name: Optional[str] = Form(None),
-    last_name: Optional[str] = Form(None),
-    photo: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
-):
-    """Fallback роут для POST /api/profiles/ со слэшем - обрабатывается первым"""
-    return _create_profile_impl(
-        user_id, name, gender, age, city, university, interests, goals,
-        bio, username, first_name, last_name, photo, db
-    )
-
 # Регистрируем роутеры
 app.include_router(auth.router)
 app.include_router(profiles.router)
 app.include_router(matches.router)
 app.include_router(debug.router)
+app.include_router(events.router)
 
 @app.get("/health")
 def health():
@@ -0,0 +1,154 @@
+"""
+Входной ASGI middleware: CORS и нормализация слэша в конце пути.
+
+Чистый ASGI (без BaseHTTPMiddleware) - на каждый запрос только разбор
+заголовков и дописывание CORS-заголовков к ответу:
+- путь "/api/profiles/" приходит в роутер как "/api/profiles" - роуты не
+  нужно объявлять дважды (со слэшем и без);
+- origin проверяется по множеству и заранее скомпилированному regex,
+  решение запоминается;
+- preflight (OPTIONS с Access-Control-Request-Method) отвечается сразу, без
+  прохода через приложение; готовые заголовки ответа кэшируются.
+
+Заголовки те же, что у Starlette CORSMiddleware с allow_credentials=True
+и allow_headers=["*"]. В expose_headers "*" работает только для запросов без
+credentials - заголовки, которые читает клиент (X-Next-Cursor), перечисляются явно.
+Preflight Private Network Access (Access-Control-Request-Private-Network) от
+разрешенного origin получает Access-Control-Allow-Private-Network: true - так
+браузер пускает страницу из интернета к API в локальной сети (разработка).
+"""
+import re
+from typing import Iterable, Optional
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+_PREFLIGHT_VARY = b"Origin, Access-Control-Request-Method, Access-Control-Request-Headers, Access-Control-Request-Private-Network"
+# Кэши решений ограничены: origin и заголовки preflight приходят от клиента
+_MAX_CACHED = 512
+
+class EdgeMiddleware:
+    def __init__(
+        self,
+        app: ASGIApp,
+        allow_origins: Iterable[str],
+        allow_origin_regex: Optional[str] = None,
+        allow_methods: Iterable[str] = ("GET", "POST", "PUT", "DELETE", "OPTIONS", "PATCH"),
+        expose_headers: Iterable[str] = ("*",),
+        max_age: int = 600,
+    ):
+        self.app = app
+        self.allow_origins = frozenset(allow_origins)
+        self.allow_origin_regex = re.compile(allow_origin_regex) if allow_origin_regex else None
+        self.allow_methods = frozenset(allow_methods)
+        self.expose_headers = ", ".join(expose_headers).encode()
+        self._preflight_base = [
+            (b"vary", _PREFLIGHT_VARY),
+            (b"access-control-allow-methods", ", ".join(allow_methods).encode()),
+            (b"access-control-max-age", str(max_age).encode()),
+            (b"access-control-allow-credentials", b"true"),
+        ]
+        self._origin_allowed: dict = {}
+        self._preflight_cache: dict = {}
+
+    def is_allowed_origin(self, origin: bytes) -> bool:
+        allowed = self._origin_allowed.get(origin)
+        if allowed is None:
+            text = origin.decode("latin-1")
+            allowed = text in self.allow_origins or bool(
+                self.allow_origin_regex is not None and self.allow_origin_regex.fullmatch(text)
+            )
+            if len(self._origin_allowed) >= _MAX_CACHED:
+                self._origin_allowed.clear()
+            self._origin_allowed[origin] = allowed
+        return allowed
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"]
+        if len(path) > 1 and path.endswith("/"):
+            scope = dict(scope)
+            scope["path"] = path.rstrip("/") or "/"
+            raw_path = scope.get("raw_path")
+            if raw_path:
+                scope["raw_path"] = raw_path.rstrip(b"/") or b"/"
+
+        origin = request_method = request_headers = private_network = None
+        for name, value in scope["headers"]:
+            if name == b"origin":
+                origin = value
+            elif name == b"access-control-request-method":
+                request_method = value
+            elif name == b"access-control-request-headers":
+                request_headers = value
+            elif name == b"access-control-request-private-network":
+                private_network = value
+
+        if origin is None:
+            await self.app(scope, receive, send)
+            return
+
+        if scope["method"] == "OPTIONS" and request_method is not None:
+            await self._preflight(send, origin, request_method, request_headers, private_network is not None)
+            return
+
+        allowed = self.is_allowed_origin(origin)
+
+        async def send_with_cors(message: Message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", ()))
+                headers.append((b"access-control-allow-credentials", b"true"))
+                headers.append((b"access-control-expose-headers", self.expose_headers))
+                if allowed:
+                    headers.append((b"access-control-allow-origin", origin))
+                _add_vary_origin(headers)
+                message = {**message, "headers": headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_cors)
+
+    async def _preflight(self, send: Send, origin: bytes, method: bytes, requested_headers: Optional[bytes],
+                         private_network: bool):
+        key = (origin, method, requested_headers, private_network)
+        response = self._preflight_cache.get(key)
+        if response is None:
+            response = self._build_preflight(origin, method, requested_headers, private_network)
+            if len(self._preflight_cache) >= _MAX_CACHED:
+                self._preflight_cache.clear()
+            self._preflight_cache[key] = response
+        status, headers, body = response
+        await send({"type": "http.response.start", "status": status, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def _build_preflight(self, origin: bytes, method: bytes, requested_headers: Optional[bytes],
+                         private_network: bool):
+        headers = list(self._preflight_base)
+        failures = []
+        if self.is_allowed_origin(origin):
+            headers.append((b"access-control-allow-origin", origin))
+        else:
+            failures.append("origin")
+        if method.decode("latin-1") not in self.allow_methods:
+            failures.append("method")
+        # Разрешены любые заголовки - возвращаем запрошенные
+        if requested_headers is not None:
+            headers.append((b"access-control-allow-headers", requested_headers))
+        if private_network and not failures:
+            headers.append((b"access-control-allow-private-network", b"true"))
+
+        if failures:
+            status, body = 400, ("Disallowed CORS " + ", ".join(failures)).encode()
+        else:
+            status, body = 200, b"OK"
+        headers.append((b"content-length", str(len(body)).encode()))
+        headers.append((b"content-type", b"text/plain; charset=utf-8"))
+        return status, headers, body
+
+def _add_vary_origin(headers: list):
+    for index, (name, value) in enumerate(headers):
+        if name.lower() == b"vary":
+            headers[index] = (name, value + b", Origin")
+            return
+    headers.append((b"vary", b"Origin"))
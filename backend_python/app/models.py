@@ -1,5 +1,5 @@
-from sqlalchemy import Column, BigInteger, String, Integer, Text, DateTime, CheckConstraint, ForeignKey, UniqueConstraint
-from sqlalchemy.sql import func
+from sqlalchemy import Column, BigInteger, String, Integer, Text, DateTime, CheckConstraint, ForeignKey, UniqueConstraint, Index
+from sqlalchemy.sql import func, text
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -29,18 +29,47 @@ class Profile(Base):
         CheckConstraint("LENGTH(bio) <= 300", name='check_bio_length'),
     )
 
+class ProfileTag(Base):
+    """Нормализованные интересы и цели профиля (по строке на тег) для индексируемой фильтрации"""
+    __tablename__ = "profile_tags"
+    
+    profile_id = Column(BigInteger, ForeignKey('profiles.id', ondelete='CASCADE'), primary_key=True)
+    kind = Column(String(10), primary_key=True)
+    tag = Column(String(100), primary_key=True)
+    
+    __table_args__ = (
+        CheckConstraint("kind IN ('interest', 'goal')", name='check_tag_kind'),
+        # Поиск профилей по тегу: WHERE kind = ... AND tag IN (...) -> profile_id
+        Index('idx_profile_tags_kind_tag', 'kind', 'tag', 'profile_id'),
+    )
+
+class ProfileCounter(Base):
+    """Счетчики профиля, которые match_service обновляет на каждом свайпе и мэтче"""
+    __tablename__ = "profile_counters"
+    
+    profile_id = Column(BigInteger, ForeignKey('profiles.id', ondelete='CASCADE'), primary_key=True)
+    likes_received = Column(Integer, nullable=False, default=0, server_default='0')
+    likes_sent = Column(Integer, nullable=False, default=0, server_default='0')
+    matches_count = Column(Integer, nullable=False, default=0, server_default='0')
+    # Входящие лайки, на которые владелец профиля еще не ответил
+    pending_incoming = Column(Integer, nullable=False, default=0, server_default='0')
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class Swipe(Base):
     __tablename__ = "swipes"
     
     id = Column(BigInteger, primary_key=True, index=True)
-    user_id = Column(BigInteger, nullable=False, index=True)
+    # Поиск по user_id идет по индексу unique_user_target
+    user_id = Column(BigInteger, nullable=False)
     target_profile_id = Column(BigInteger, ForeignKey('profiles.id', ondelete='CASCADE'), nullable=False, index=True)
-    action = Column(String(10), nullable=False, index=True)
-    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    action = Column(String(10), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     __table_args__ = (
         UniqueConstraint('user_id', 'target_profile_id', name='unique_user_target'),
         CheckConstraint("action IN ('like', 'pass')", name='check_action'),
+        # Старые пассы для архивации (см. swipe_archive)
+        Index('idx_swipes_pass_created_at', 'created_at', postgresql_where=text("action = 'pass'")),
     )
 
 class Match(Base):
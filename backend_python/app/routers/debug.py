@@ -6,6 +6,10 @@ import json
 import os
 from pathlib import Path
 from datetime import datetime
+from app.database import get_routing_stats
+from app import db_pool
+from app.auth import get_token_cache_stats
+from app.services import swipe_cache, swipe_buffer, event_hub, profile_cache, profile_membership
 
 router = APIRouter(prefix="/api/debug", tags=["debug"])
 
@@ -85,3 +89,21 @@ async def clear_logs():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+
+@router.get("/caches")
+async def get_cache_stats():
+    """Состояние in-process кэшей воркера (объем памяти, попадания/промахи)"""
+    return {
+        "swipe_cache": swipe_cache.get_stats(),
+        "swipe_buffer": swipe_buffer.get_stats(),
+        "event_hub": event_hub.get_stats(),
+        "profile_cache": profile_cache.get_stats(),
+        "profile_membership": profile_membership.get_stats(),
+        "jwt_cache": get_token_cache_stats(),
+        "read_routing": get_routing_stats(),
+    }
+
+@router.get("/pool")
+async def get_pool_stats():
+    """Пулы соединений воркера: занято/overflow, ожидание соединения, задержка пинга"""
+    return db_pool.get_stats()
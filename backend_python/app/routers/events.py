@@ -0,0 +1,47 @@
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
+import os
+from app.services import event_hub
+
+router = APIRouter(prefix="/api", tags=["events"])
+
+# Как часто шлем комментарий-пинг, чтобы прокси не закрывали простаивающее соединение
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "25"))
+
+@router.get("/events")
+async def stream_events(request: Request, user_id: int):
+    """
+    Поток событий пользователя (Server-Sent Events) вместо опроса
+    /api/matches и /api/profiles/incoming-likes.
+
+    События: incoming_like {user_id, profile_id} - кто-то лайкнул пользователя,
+    match {match_id, user_id, profile_id} - новый мэтч.
+    """
+    if not event_hub.is_enabled():
+        raise HTTPException(status_code=404, detail="События отключены")
+    try:
+        subscription = event_hub.subscribe(user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+    async def event_stream():
+        try:
+            # Браузер переподключится сам; retry задает паузу перед переподключением
+            yield "retry: 3000\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+        finally:
+            event_hub.unsubscribe(subscription)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
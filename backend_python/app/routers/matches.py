@@ -1,25 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Header
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.database import get_db
-from app.schemas import LikeRequest, LikeResponse, PassResponse, MatchResponse, RespondToLikeRequest
+from datetime import datetime
+from app.serialization import FastJSONResponse, etag_headers, etag_matches, make_etag, not_modified
+from app.database import get_async_db, get_async_read_db, pin_to_primary
+from app.schemas import LikeRequest, LikeResponse, PassResponse, MatchResponse, RespondToLikeRequest, SwipeBatchRequest, SwipeBatchResponse
 from app.services import match_service, profile_service
 from app.models import Match
 
 router = APIRouter(prefix="/api", tags=["matches"])
 
 @router.post("/profiles/{profile_id}/like", response_model=LikeResponse)
-def like_profile(
+async def like_profile(
     profile_id: int,
     request: LikeRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
-        matched, match_id = match_service.like_profile(
-            db=db,
+        matched, match_id = await db.run_sync(
+            match_service.like_profile,
             user_id=request.user_id,
             target_profile_id=profile_id
         )
+        pin_to_primary(request.user_id)
         
         if matched:
             return LikeResponse(
@@ -38,31 +41,54 @@ def like_profile(
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке лайка: {str(e)}")
 
 @router.post("/profiles/{profile_id}/pass", response_model=PassResponse)
-def pass_profile(
+async def pass_profile(
     profile_id: int,
     request: LikeRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     try:
         print(f"[pass_profile] user_id={request.user_id}, target_profile_id={profile_id}")
-        match_service.pass_profile(
-            db=db,
+        await db.run_sync(
+            match_service.pass_profile,
             user_id=request.user_id,
             target_profile_id=profile_id
         )
+        pin_to_primary(request.user_id)
         print(f"[pass_profile] Pass saved successfully")
         return PassResponse(message="Пропущено")
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         print(f"[pass_profile] Error: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Ошибка при обработке пропуска: {str(e)}")
 
+@router.post("/swipes/batch", response_model=SwipeBatchResponse)
+async def swipe_batch(
+    request: SwipeBatchRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Пакет лайков/пассов в порядке свайпов - одна запись в БД вместо запроса на карточку"""
+    try:
+        results = await db.run_sync(
+            match_service.swipe_batch,
+            user_id=request.user_id,
+            swipes=[(item.profile_id, item.action) for item in request.swipes]
+        )
+        pin_to_primary(request.user_id)
+        return SwipeBatchResponse(results=results)
+    except Exception as e:
+        print(f"[swipe_batch] Error: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        raise HTTPException(status_code=500, detail=f"Ошибка при обработке свайпов: {str(e)}")
+
 @router.post("/likes/respond", response_model=LikeResponse)
-def respond_to_like(
+async def respond_to_like(
     request: RespondToLikeRequest,
     user_id: Optional[int] = Query(None, description="ID текущего пользователя"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Ответить на входящий лайк: accept (мэтч) или decline (пропустить)"""
     if user_id is None:
@@ -70,16 +96,17 @@ def respond_to_like(
     
     try:
         # Находим профиль того, кто лайкнул
-        target_profile = profile_service.get_profile_by_user_id(db, request.targetUserId)
+        target_profile = await db.run_sync(profile_service.get_profile_by_user_id, request.targetUserId)
         if not target_profile:
             raise HTTPException(status_code=404, detail="Профиль не найден")
         
+        pin_to_primary(user_id)
         if request.action == 'accept':
             # Accept = лайк в ответ, что создаст мэтч
-            matched, match_id = match_service.like_profile(
-                db=db,
+            matched, match_id = await db.run_sync(
+                match_service.like_profile,
                 user_id=user_id,
-                target_profile_id=target_profile.id
+                target_profile_id=target_profile["id"]
             )
             return LikeResponse(
                 matched=matched,
@@ -88,10 +115,10 @@ def respond_to_like(
             )
         else:
             # Decline = pass
-            match_service.pass_profile(
-                db=db,
+            await db.run_sync(
+                match_service.pass_profile,
                 user_id=user_id,
-                target_profile_id=target_profile.id
+                target_profile_id=target_profile["id"]
             )
             return LikeResponse(
                 matched=False,
@@ -103,124 +130,45 @@ def respond_to_like(
         raise HTTPException(status_code=500, detail=f"Ошибка при ответе на лайк: {str(e)}")
 
 @router.get("/matches", response_model=List[MatchResponse])
-def get_matches(user_id: int, db: Session = Depends(get_db)):
-    """Получает список мэтчей для пользователя"""
+async def get_matches(
+    user_id: int,
+    limit: Optional[int] = Query(None, ge=1, le=500),
+    cursor: Optional[str] = None,  # X-Next-Cursor из предыдущего ответа (keyset-пагинация)
+    since: Optional[datetime] = None,  # только мэтчи новее этого момента
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """
+    Получает мэтчи пользователя, от новых к старым.
+    Без limit и cursor - все мэтчи одним списком, как раньше (клиенты, которые не листают).
+    Если мэтчей больше limit, курсор следующей страницы отдается в заголовке X-Next-Cursor
+    (cursor без limit - страницы по 100).
+    ETag считается по водяному знаку мэтчей: при совпадении If-None-Match - 304 без выборки списка.
+    """
     import time
-    import json
     query_start_time = time.time()
+    if limit is None and cursor is not None:
+        limit = 100
     try:
-        # #region agent log
-        try:
-            log_data = {
-                "location": "matches.py:get_matches",
-                "message": "Request started",
-                "data": {"userId": user_id},
-                "timestamp": int(time.time() * 1000),
-                "sessionId": "debug-session",
-                "runId": "run1",
-                "hypothesisId": "D"
-            }
-            with open(r"c:\Users\Lenovo\max-networking-app\.cursor\debug.log", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_data, ensure_ascii=False) + "\n")
-        except Exception as e:
-            print(f"[get_matches] Failed to write log: {e}")
-        # #endregion
-        
-        # Проверяем, что user_id правильный тип
-        user_id = int(user_id)
-        
-        # Получаем мэтчи
-        step_start = time.time()
-        matches = match_service.get_matches(db, user_id)
-        matches_duration = (time.time() - step_start) * 1000
-        print(f"[get_matches] Found {len(matches)} matches for user_id {user_id}")
+        version = await db.run_sync(match_service.get_matches_version, user_id)
+        etag = make_etag("matches", user_id, *version, limit, cursor, since)
+        if etag_matches(if_none_match, etag):
+            return not_modified(etag)
         
-        if len(matches) == 0:
-            return []
-        
-        # ОПТИМИЗАЦИЯ: Загружаем все профили одним запросом вместо N+1
-        other_user_ids = []
-        for match in matches:
-            other_user_id = match.user2_id if match.user1_id == user_id else match.user1_id
-            other_user_ids.append(other_user_id)
-        
-        # Один запрос для всех профилей
-        step_start = time.time()
-        from app.models import Profile
-        profiles_dict = {}
-        if other_user_ids:
-            profiles = db.query(Profile).filter(Profile.user_id.in_(other_user_ids)).all()
-            profiles_dict = {p.user_id: p for p in profiles}
-        profiles_duration = (time.time() - step_start) * 1000
-        
-        # #region agent log
-        try:
-            log_data = {
-                "location": "matches.py:get_matches",
-                "message": "Profiles bulk loaded",
-                "data": {
-                    "userId": user_id,
-                    "matchesCount": len(matches),
-                    "profilesLoaded": len(profiles_dict),
-                    "matchesDurationMs": round(matches_duration, 2),
-                    "profilesDurationMs": round(profiles_duration, 2)
-                },
-                "timestamp": int(time.time() * 1000),
-                "sessionId": "debug-session",
-                "runId": "run1",
-                "hypothesisId": "D"
-            }
-            with open(r"c:\Users\Lenovo\max-networking-app\.cursor\debug.log", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_data, ensure_ascii=False) + "\n")
-        except Exception as e:
-            print(f"[get_matches] Failed to write log: {e}")
-        # #endregion
-        
-        # Создаем ответы
-        responses = []
-        for match in matches:
-            other_user_id = match.user2_id if match.user1_id == user_id else match.user1_id
-            other_profile = profiles_dict.get(other_user_id)
-            
-            if not other_profile:
-                print(f"[get_matches] WARNING: Profile not found for user_id {other_user_id} in match {match.id}")
-                continue
-            
-            match_response = MatchResponse(
-                id=match.id,
-                matched_profile=other_profile,
-                matched_at=match.matched_at
-            )
-            responses.append(match_response)
+        matches, next_cursor = await db.run_sync(
+            match_service.get_matches, user_id, limit=limit, cursor=cursor, since=since
+        )
         
         total_duration = (time.time() - query_start_time) * 1000
-        print(f"[get_matches] Returning {len(responses)} match responses (total: {total_duration:.2f}ms)")
-        
-        # #region agent log
-        try:
-            log_data = {
-                "location": "matches.py:get_matches",
-                "message": "Request completed",
-                "data": {
-                    "userId": user_id,
-                    "resultCount": len(responses),
-                    "totalDurationMs": round(total_duration, 2)
-                },
-                "timestamp": int(time.time() * 1000),
-                "sessionId": "debug-session",
-                "runId": "run1",
-                "hypothesisId": "D"
-            }
-            with open(r"c:\Users\Lenovo\max-networking-app\.cursor\debug.log", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_data, ensure_ascii=False) + "\n")
-        except Exception as e:
-            print(f"[get_matches] Failed to write log: {e}")
-        # #endregion
-        
-        return responses
+        print(f"[get_matches] Returning {len(matches)} matches for user_id {user_id} (total: {total_duration:.2f}ms)")
+        # Элементы уже в формате MatchResponse - отдаем без повторной валидации
+        return FastJSONResponse(
+            matches, headers=etag_headers(etag, {"X-Next-Cursor": next_cursor} if next_cursor else None)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         import traceback
         print(f"[get_matches] ERROR: {str(e)}")
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Ошибка при получении мэтчей: {str(e)}")
-
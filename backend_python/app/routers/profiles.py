@@ -1,12 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Header, Request
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
 from typing import Optional
 from pydantic import ValidationError
-from app.database import get_db
-from app.models import Profile
-from app.schemas import ProfileCreate, ProfileResponse, PageResponse
-from app.services import profile_service
+from app.serialization import FastJSONResponse, etag_headers, etag_matches, make_etag, not_modified
+from app.database import get_db, get_async_read_db, get_async_lookup_db, open_async_db, pin_to_primary, DB_LOOKUP_TIMEOUT_MS
+from app.schemas import ProfileCreate, ProfileResponse, PageResponse, ProfileStatsResponse
+from app.services import profile_service, deck_service, profile_counters, profile_membership
 import json
 
 router = APIRouter(prefix="/api/profiles", tags=["profiles"])
@@ -102,6 +103,10 @@ def _create_profile_impl(
                 profile_data=profile_data,
                 photo=photo
             )
+            # Колода собиралась без учета нового/измененного профиля - пересоберем
+            deck_service.invalidate(user_id)
+            # Пока реплика догоняет, пользователь читает свой профиль из основной БД
+            pin_to_primary(user_id, profile.id)
             return profile
         except IntegrityError as e:
             db.rollback()
@@ -118,7 +123,7 @@ def _create_profile_impl(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Ошибка при создании профиля: {str(e)}")
 
-# POST /api/profiles - создание/обновление профиля (без слэша)
+# POST /api/profiles - создание/обновление профиля ("/api/profiles/" приводит к этому пути EdgeMiddleware)
 @router.post("", response_model=ProfileResponse, include_in_schema=True)
 def create_profile(
     user_id: int = Form(...),
@@ -141,56 +146,46 @@ def create_profile(
         bio, username, first_name, last_name, photo, db
     )
 
-# POST /api/profiles/ - создание/обновление профиля (со слэшем)
-# Этот роут обрабатывается fallback роутом в main.py, но оставляем для совместимости
-@router.post("/", response_model=ProfileResponse, include_in_schema=True)
-def create_profile_with_slash(
-    user_id: int = Form(...),
-    name: str = Form(...),
-    gender: str = Form(...),
-    age: int = Form(...),
-    city: str = Form(...),
-    university: str = Form(...),
-    interests: str = Form(...),
-    goals: str = Form(...),
-    bio: Optional[str] = Form(None),
-    username: Optional[str] = Form(None),
-    first_name: Optional[str] = Form(None),
-    last_name: Optional[str] = Form(None),
-    photo: Optional[UploadFile] = File(None),
-    db: Session = Depends(get_db)
-):
-    return _create_profile_impl(
-        user_id, name, gender, age, city, university, interests, goals,
-        bio, username, first_name, last_name, photo, db
-    )
+def _profile_etag(profile_id: int, updated_at) -> str:
+    """ETag профиля по его версии - сверяется до загрузки и сериализации профиля"""
+    # На SQLite updated_at с точностью до секунды - правки в ту же секунду ETag не меняют
+    return make_etag("profile", profile_id, updated_at)
 
 # Важно: более специфичные роуты должны быть ПЕРЕД общим роутом /{profile_id}
 @router.get("/check/{user_id}")
-def check_profile_exists(user_id: int, db: Session = Depends(get_db)):
-    """Проверяет наличие профиля у пользователя"""
-    profile = profile_service.get_profile_by_user_id(db, user_id)
-    return {"exists": profile is not None}
+async def check_profile_exists(user_id: int, request: Request):
+    """Проверяет наличие профиля у пользователя (обычно из памяти, без запроса к БД)"""
+    if profile_membership.contains(user_id):
+        return {"exists": True}
+    async with open_async_db(request, DB_LOOKUP_TIMEOUT_MS, read_only=True) as db:
+        return {"exists": await db.run_sync(profile_service.profile_exists, user_id)}
 
 @router.get("/incoming-likes", response_model=PageResponse)
-def get_incoming_likes(
+async def get_incoming_likes(
     user_id: Optional[int] = None,
     page: int = 0,
     size: int = 20,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,  # next_cursor из предыдущего ответа (keyset-пагинация)
+    include_total: bool = False,  # считать total_elements в keyset-режиме
+    db: AsyncSession = Depends(get_async_read_db)
 ):
     """Получает профили людей, которые лайкнули текущего пользователя"""
     if user_id is None:
         raise HTTPException(status_code=400, detail="Параметр user_id обязателен")
     
     try:
-        result = profile_service.get_incoming_likes(
-            db=db,
+        result = await db.run_sync(
+            profile_service.get_incoming_likes,
             user_id=user_id,
             page=page,
-            size=size
+            size=size,
+            cursor=cursor,
+            include_total=include_total
         )
-        return result
+        # Карточки уже в формате ProfileResponse - отдаем без повторной валидации
+        return FastJSONResponse(result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except HTTPException:
         raise
     except Exception as e:
@@ -199,130 +194,104 @@ def get_incoming_likes(
         print(traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Ошибка при получении входящих лайков: {str(e)}")
 
+@router.get("/incoming-likes/count")
+async def get_incoming_likes_count(
+    user_id: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Число входящих лайков без ответа (бейдж) - из profile_counters, одна строка по ключу"""
+    if user_id is None:
+        raise HTTPException(status_code=400, detail="Параметр user_id обязателен")
+    
+    try:
+        # Пассы из очереди swipe_buffer попадают в счетчик при сбросе (до SWIPE_BUFFER_FLUSH_MS)
+        return {"count": await db.run_sync(profile_counters.pending_incoming, user_id)}
+    except Exception as e:
+        print(f"Error in get_incoming_likes_count: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Ошибка при подсчете входящих лайков: {str(e)}")
+
 @router.get("/user/{user_id}", response_model=ProfileResponse)
-def get_profile_by_user_id(user_id: int, db: Session = Depends(get_db)):
-    """Получает профиль пользователя по user_id"""
-    profile = profile_service.get_profile_by_user_id(db, user_id)
+async def get_profile_by_user_id(
+    user_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_lookup_db)
+):
+    """Получает профиль пользователя по user_id (304, если ETag не изменился)"""
+    if if_none_match:
+        version = await db.run_sync(profile_service.get_profile_version_by_user_id, user_id)
+        if version is not None and etag_matches(if_none_match, _profile_etag(*version)):
+            return not_modified(_profile_etag(*version))
+    profile = await db.run_sync(profile_service.get_profile_by_user_id, user_id)
     if not profile:
         raise HTTPException(status_code=404, detail="Профиль не найден")
-    return profile
+    return FastJSONResponse(profile, headers=etag_headers(_profile_etag(profile["id"], profile["updated_at"])))
 
 # GET /api/profiles - получение списка профилей (должен быть ПОСЛЕ специфичных роутов)
 @router.get("", response_model=PageResponse, include_in_schema=True)
-def get_profiles(
+async def get_profiles(
     user_id: Optional[int] = None,
     city: Optional[str] = None,
     university: Optional[str] = None,
-    interests: Optional[str] = None,  # Добавляем параметр, но пока не используем
+    interests: Optional[str] = None,  # интересы через запятую: фильтр и ранжирование по совпадениям
     page: int = 0,
     size: int = 20,
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = None,  # next_cursor из предыдущего ответа (keyset-пагинация)
+    include_total: bool = False,  # считать total_elements в keyset-режиме
+    db: AsyncSession = Depends(get_async_read_db)
 ):
-    print(f"[get_profiles] Request: user_id={user_id}, city={city}, university={university}, interests={interests}, page={page}, size={size}")
+    print(f"[get_profiles] Request: user_id={user_id}, city={city}, university={university}, interests={interests}, page={page}, size={size}, cursor={cursor}")
     if user_id is None:
         raise HTTPException(status_code=400, detail="Параметр userId обязателен")
     
     try:
-        result = profile_service.get_available_profiles(
-            db=db,
-            user_id=user_id,
-            city=city,
-            university=university,
-            interests=interests,
-            page=page,
-            size=size
-        )
+        # Первая страница ленты без фильтров отдается из колоды кандидатов
+        result = None
+        if not (city or university or interests or cursor or include_total) and page == 0:
+            result = await db.run_sync(deck_service.get_feed_page, user_id=user_id, size=size)
+        if result is None:
+            result = await db.run_sync(
+                profile_service.get_available_profiles,
+                user_id=user_id,
+                city=city,
+                university=university,
+                interests=interests,
+                page=page,
+                size=size,
+                cursor=cursor,
+                include_total=include_total
+            )
         print(f"[get_profiles] Returning {len(result.get('content', []))} profiles, total={result.get('total_elements', 0)}")
-        return result
+        # Карточки уже в формате ProfileResponse - отдаем без повторной валидации
+        return FastJSONResponse(result)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         print(f"[get_profiles] Error: {str(e)}")
         import traceback
         traceback.print_exc()
         raise HTTPException(status_code=500, detail=f"Ошибка при получении профилей: {str(e)}")
 
-# GET /api/profiles/ - получение списка профилей СО СЛЭШЕМ (для совместимости)
-@router.get("/", response_model=PageResponse, include_in_schema=True)
-def get_profiles_with_slash(
-    user_id: Optional[int] = None,
-    city: Optional[str] = None,
-    university: Optional[str] = None,
-    interests: Optional[str] = None,
-    page: int = 0,
-    size: int = 20,
-    db: Session = Depends(get_db)
-):
-    """Тот же endpoint, но со слэшем - вызывает ту же функцию"""
-    return get_profiles(user_id, city, university, interests, page, size, db)
-
-@router.get("/debug/all", response_model=PageResponse, include_in_schema=False)
-def get_all_profiles_debug(
-    user_id: Optional[int] = None,
-    db: Session = Depends(get_db)
-):
-    """Отладочный endpoint - возвращает ВСЕ профили кроме текущего пользователя"""
-    if user_id is None:
-        raise HTTPException(status_code=400, detail="Параметр user_id обязателен")
-    
-    # Простой запрос - все профили кроме текущего пользователя
-    profiles = db.query(Profile).filter(Profile.user_id != user_id).all()
-    
-    # Проверяем Swipe записи
-    from app.models import Swipe
-    swipes = db.query(Swipe).filter(Swipe.user_id == user_id).all()
-    
-    print(f"[DEBUG] All profiles for user {user_id}:")
-    for p in profiles:
-        print(f"  - id={p.id}, user_id={p.user_id}, name={p.name}, city={p.city}, university={p.university}, interests={p.interests}")
-    
-    print(f"[DEBUG] Swipes made by user {user_id}:")
-    for s in swipes:
-        print(f"  - Swipe: user_id={s.user_id}, target_profile_id={s.target_profile_id}, action={s.action}")
-    
-    return {
-        "content": profiles,
-        "total_elements": len(profiles),
-        "total_pages": 1,
-        "size": len(profiles),
-        "number": 0
-    }
-
-@router.get("/debug/simple", include_in_schema=False)
-def get_profiles_simple(
-    user_id: Optional[int] = None,
-    db: Session = Depends(get_db)
-):
-    """УПРОЩЕННЫЙ endpoint БЕЗ фильтров - возвращает ВСЕ профили кроме текущего"""
-    if user_id is None:
-        return {"error": "user_id required", "profiles": []}
-    
-    # ВСЕ профили кроме текущего пользователя, БЕЗ фильтров
-    profiles = db.query(Profile).filter(Profile.user_id != user_id).all()
-    
-    # Простая сериализация
-    result = []
-    for p in profiles:
-        result.append({
-            "id": p.id,
-            "user_id": p.user_id,
-            "name": p.name,
-            "gender": p.gender,
-            "age": p.age,
-            "city": p.city,
-            "university": p.university,
-            "interests": p.interests,
-            "goals": p.goals,
-            "bio": p.bio,
-            "photo_url": p.photo_url
-        })
-    
-    print(f"[DEBUG SIMPLE] Returning {len(result)} profiles for user {user_id}")
-    return {"content": result, "total": len(result)}
-
 @router.get("/{profile_id}", response_model=ProfileResponse)
-def get_profile(profile_id: int, db: Session = Depends(get_db)):
-    """Получает профиль по ID"""
-    profile = profile_service.get_profile_by_id(db, profile_id)
+async def get_profile(
+    profile_id: int,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_lookup_db)
+):
+    """Получает профиль по ID (304, если ETag не изменился)"""
+    if if_none_match:
+        version = await db.run_sync(profile_service.get_profile_version_by_id, profile_id)
+        if version is not None and etag_matches(if_none_match, _profile_etag(*version)):
+            return not_modified(_profile_etag(*version))
+    profile = await db.run_sync(profile_service.get_profile_by_id, profile_id)
     if not profile:
         raise HTTPException(status_code=404, detail="Профиль не найден")
-    return profile
+    return FastJSONResponse(profile, headers=etag_headers(_profile_etag(profile["id"], profile["updated_at"])))
+
+@router.get("/{profile_id}/stats", response_model=ProfileStatsResponse)
+async def get_profile_stats(profile_id: int, db: AsyncSession = Depends(get_async_lookup_db)):
+    """Статистика профиля: лайки, мэтчи, входящие лайки без ответа (из profile_counters)"""
+    stats = await db.run_sync(profile_counters.get, profile_id)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Профиль не найден")
+    return stats
 
@@ -43,6 +43,24 @@ class LikeResponse(BaseModel):
 class PassResponse(BaseModel):
     message: str = "Пропущено"
 
+class SwipeBatchItem(BaseModel):
+    profile_id: int
+    action: str = Field(..., pattern="^(like|pass)$")
+
+class SwipeBatchRequest(BaseModel):
+    user_id: int
+    swipes: List[SwipeBatchItem] = Field(..., min_length=1, max_length=100)
+
+class SwipeBatchResult(BaseModel):
+    profile_id: int
+    action: str
+    status: str  # ok | duplicate | not_found
+    matched: bool = False
+    match_id: Optional[int] = None
+
+class SwipeBatchResponse(BaseModel):
+    results: List[SwipeBatchResult]
+
 class RespondToLikeRequest(BaseModel):
     targetUserId: int
     action: str = Field(..., pattern="^(accept|decline)$")
@@ -55,10 +73,20 @@ class MatchResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class ProfileStatsResponse(BaseModel):
+    profile_id: int
+    likes_received: int = 0
+    likes_sent: int = 0
+    matches_count: int = 0
+    pending_incoming: int = 0
+
 class PageResponse(BaseModel):
     content: List[ProfileResponse]
-    total_elements: int
-    total_pages: int
+    # В keyset-режиме (cursor) total не считается без include_total=true
+    total_elements: Optional[int] = None
+    total_pages: Optional[int] = None
     size: int
     number: int
+    # Непрозрачный курсор следующей страницы (None - страниц больше нет)
+    next_cursor: Optional[str] = None
 
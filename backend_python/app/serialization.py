@@ -0,0 +1,76 @@
+"""
+Быстрые JSON-ответы для данных, которые мы только что прочитали из своей БД.
+
+Списки (лента, входящие лайки, мэтчи) и профили отдаются через
+FastJSONResponse: словари в формате ProfileResponse/PageResponse кодируются
+orjson напрямую, без повторной валидации Pydantic. response_model у роутов
+остается - схема OpenAPI не меняется.
+
+Формат совпадает с тем, что пишет Pydantic: порядок полей ProfileResponse,
+datetime в ISO 8601 (UTC - с суффиксом Z). Без orjson используется json.
+
+Условные запросы: профили и мэтчи отдаются с сильным ETag, посчитанным по
+версии данных (updated_at, водяной знак мэтчей) - его можно проверить до
+выборки и сериализации тела и ответить 304 Not Modified.
+"""
+import hashlib
+import json
+from datetime import datetime
+from typing import Optional
+
+from fastapi.responses import JSONResponse, Response
+
+from app.schemas import ProfileResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+    print("Warning: orjson not installed, fast responses fall back to json")
+
+# Поля ProfileResponse в порядке сериализации
+PROFILE_FIELDS = tuple(ProfileResponse.model_fields)
+
+def json_datetime(value: datetime) -> str:
+    """datetime в строку так же, как ее пишет Pydantic (UTC - с суффиксом Z)"""
+    text = value.isoformat()
+    return text[:-6] + "Z" if text.endswith("+00:00") else text
+
+def _default(value):
+    if isinstance(value, datetime):
+        return json_datetime(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def dumps(content) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":"), default=_default
+    ).encode("utf-8")
+
+class FastJSONResponse(JSONResponse):
+    """JSON-ответ через orjson для уже готовых данных (без валидации response_model)"""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+# Клиент хранит ответ, но перед использованием всегда сверяет ETag
+ETAG_CACHE_CONTROL = "private, no-cache"
+
+def make_etag(*version) -> str:
+    """Сильный ETag из версии данных - одинаковая версия дает одинаковое тело ответа"""
+    return '"' + hashlib.blake2b(dumps(list(version)), digest_size=12).hexdigest() + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Совпадает ли If-None-Match с ETag (слабое сравнение, как требует RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+def etag_headers(etag: str, headers: Optional[dict] = None) -> dict:
+    return {**(headers or {}), "ETag": etag, "Cache-Control": ETAG_CACHE_CONTROL}
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers=etag_headers(etag))
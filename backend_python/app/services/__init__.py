@@ -1,4 +1,4 @@
-from . import profile_service, match_service, file_storage
+from . import profile_service, match_service, file_storage, deck_service, scoring_service, swipe_cache, swipe_buffer, event_hub, profile_counters, swipe_archive, profile_cache, profile_membership
 
-__all__ = ["profile_service", "match_service", "file_storage"]
+__all__ = ["profile_service", "match_service", "file_storage", "deck_service", "scoring_service", "swipe_cache", "swipe_buffer", "event_hub", "profile_counters", "swipe_archive", "profile_cache", "profile_membership"]
 
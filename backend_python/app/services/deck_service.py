@@ -0,0 +1,236 @@
+"""
+Колоды кандидатов для ленты.
+
+Для каждого активного пользователя в памяти воркера хранится готовая к выдаче
+очередь ID профилей-кандидатов (колода). GET /api/profiles берет карточки
+из начала колоды без пересчета кандидатов, свайп (лайк/пасс) убирает карточку
+из колоды за O(1), а когда карточек остается мало - колода пополняется
+в фоне отдельной сессией БД.
+
+Колода - это только кэш порядка выдачи: источником истины остается БД,
+при пополнении кандидаты заново выбираются через available_profiles_query.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Profile
+from app.services import scoring_service
+from app.services.profile_service import CARD_COLUMNS, available_profiles_query, encode_cursor, profile_card, ranked_candidates
+
+FEED_DECK_ENABLED = os.getenv("FEED_DECK_ENABLED", "true").lower() == "true"
+# Сколько кандидатов держим в колоде после пополнения
+DECK_SIZE = int(os.getenv("FEED_DECK_SIZE", "200"))
+# Если карточек меньше - запускаем фоновое пополнение
+DECK_LOW_WATERMARK = int(os.getenv("FEED_DECK_LOW_WATERMARK", "40"))
+# Сколько колод держим в памяти воркера (LRU) и сколько живет неактивная колода
+DECK_MAX_USERS = int(os.getenv("FEED_DECK_MAX_USERS", "5000"))
+DECK_TTL_SECONDS = int(os.getenv("FEED_DECK_TTL_SECONDS", "900"))
+
+class _Deck:
+    __slots__ = ("cards", "total", "exhausted", "refilling", "dropped", "touched_at")
+
+    def __init__(self):
+        # id карточки -> очки совместимости (None без scoring_service);
+        # OrderedDict дает выдачу по порядку и удаление за O(1)
+        self.cards: "OrderedDict[int, Optional[int]]" = OrderedDict()
+        # Число кандидатов в БД на момент пополнения за вычетом свайпнутых карточек
+        self.total = 0
+        # В БД больше нет кандидатов сверх тех, что уже в колоде
+        self.exhausted = False
+        self.refilling = False
+        # Карточки, свайпнутые во время фонового пополнения - чтобы не вернуть их обратно
+        self.dropped: set = set()
+        self.touched_at = time.monotonic()
+
+_decks: "OrderedDict[int, _Deck]" = OrderedDict()
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="deck-refill")
+
+def _get_deck(user_id: int) -> Optional[_Deck]:
+    """Возвращает живую колоду пользователя (под _lock)"""
+    deck = _decks.get(user_id)
+    if deck is None:
+        return None
+    if time.monotonic() - deck.touched_at > DECK_TTL_SECONDS:
+        del _decks[user_id]
+        return None
+    _decks.move_to_end(user_id)
+    return deck
+
+def _load_candidates(db: Session, user_id: int) -> Tuple[List[Tuple[int, Optional[int]]], int]:
+    """
+    Лучшие DECK_SIZE кандидатов (по оценке совместимости, а без нее - по id)
+    и общее число кандидатов для total_elements страницы.
+    """
+    if scoring_service.is_enabled():
+        ids, scores = ranked_candidates(db, user_id)
+        return list(zip(ids[:DECK_SIZE].tolist(), scores[:DECK_SIZE].tolist())), len(ids)
+    query = available_profiles_query(db, user_id)
+    rows = query.with_entities(Profile.id).order_by(Profile.id).limit(DECK_SIZE).all()
+    # COUNT нужен, только если кандидаты не поместились в колоду
+    total = len(rows) if len(rows) < DECK_SIZE else query.count()
+    return [(row[0], None) for row in rows], total
+
+def _card_order(card: Tuple[int, Optional[int]]) -> tuple:
+    """Порядок SQL-пути ленты: по очкам (больше - раньше), затем по id"""
+    profile_id, score = card
+    return (-score if score is not None else 0, profile_id)
+
+def _merge(deck: _Deck, candidates: List[Tuple[int, Optional[int]]], total: int):
+    """Добавляет кандидатов в колоду и запоминает их общее число total (под _lock)"""
+    stale = 0
+    for profile_id, score in candidates:
+        if profile_id in deck.dropped:
+            stale += 1
+        else:
+            deck.cards[profile_id] = score
+    # Пополнение приносит и кандидатов лучше уже лежащих в колоде - восстанавливаем
+    # общий порядок, иначе курсор по последней карточке страницы их пропустит
+    deck.cards = OrderedDict(sorted(deck.cards.items(), key=_card_order))
+    deck.total = max(total - stale, len(deck.cards))
+    deck.exhausted = len(candidates) < DECK_SIZE
+    deck.dropped.clear()
+    deck.refilling = False
+
+def _refill(user_id: int):
+    db = SessionLocal()
+    try:
+        candidates, total = _load_candidates(db, user_id)
+    except Exception as e:
+        print(f"[deck_service] Refill failed for user {user_id}: {e}")
+        candidates = total = None
+    finally:
+        db.close()
+
+    with _lock:
+        deck = _decks.get(user_id)
+        if deck is None:
+            return
+        if candidates is None:
+            deck.refilling = False
+            deck.dropped.clear()
+            return
+        _merge(deck, candidates, total)
+
+def _schedule_refill(user_id: int, deck: _Deck):
+    """Запускает фоновое пополнение, если оно нужно и еще не идет (под _lock)"""
+    if deck.refilling or deck.exhausted or len(deck.cards) >= DECK_LOW_WATERMARK:
+        return
+    deck.refilling = True
+    _executor.submit(_refill, user_id)
+
+def take_cards(db: Session, user_id: int, size: int) -> Optional[List[Tuple[int, Optional[int]]]]:
+    """
+    Возвращает (id, score) первых size карточек колоды (не удаляя их - карточка
+    уходит из колоды только после свайпа).
+
+    Если колоды еще нет, она заполняется синхронно в сессии запроса.
+    Возвращает None, если колоды отключены.
+    """
+    if not FEED_DECK_ENABLED:
+        return None
+
+    with _lock:
+        deck = _get_deck(user_id)
+        if deck is not None:
+            deck.touched_at = time.monotonic()
+            _schedule_refill(user_id, deck)
+            return list(islice(deck.cards.items(), size))
+
+    # Холодный старт: заполняем колоду синхронно, отдавать пока нечего
+    candidates, total = _load_candidates(db, user_id)
+    with _lock:
+        deck = _decks.get(user_id)
+        if deck is None:
+            deck = _Deck()
+            _decks[user_id] = deck
+            _merge(deck, candidates, total)
+            while len(_decks) > DECK_MAX_USERS:
+                _decks.popitem(last=False)
+        return list(islice(deck.cards.items(), size))
+
+def has_more_cards(user_id: int, served: int) -> bool:
+    """Есть ли в колоде (или в БД за ее пределами) карточки после первых served"""
+    with _lock:
+        deck = _decks.get(user_id)
+        if deck is None:
+            return False
+        return len(deck.cards) > served or not deck.exhausted
+
+def cached_total(user_id: int) -> int:
+    """Число кандидатов пользователя по данным колоды (0, если колоды нет)"""
+    with _lock:
+        deck = _decks.get(user_id)
+        return deck.total if deck is not None else 0
+
+def drop_card(user_id: int, profile_id: int):
+    """Убирает карточку из колоды пользователя после свайпа"""
+    with _lock:
+        deck = _decks.get(user_id)
+        if deck is None:
+            return
+        if profile_id in deck.cards:
+            del deck.cards[profile_id]
+            deck.total = max(deck.total - 1, len(deck.cards))
+        if deck.refilling:
+            deck.dropped.add(profile_id)
+        _schedule_refill(user_id, deck)
+
+def invalidate(user_id: int):
+    """Сбрасывает колоду пользователя - следующая выдача соберет ее заново"""
+    with _lock:
+        _decks.pop(user_id, None)
+
+def get_feed_page(db: Session, user_id: int, size: int = 20) -> Optional[dict]:
+    """
+    Страница ленты из колоды в формате PageResponse.
+
+    Карточки догружаются одним запросом по первичному ключу, с теми же
+    исключениями, что и обычная лента: свайпы, сделанные через другой воркер,
+    отфильтруются здесь и уберутся из колоды.
+    total_elements - число кандидатов, посчитанное при пополнении колоды (без
+    свайпов, сделанных с тех пор через другие воркеры); точное число дает
+    include_total=true (обычный путь).
+    Возвращает None, если колоды отключены (нужно идти обычным путем).
+    """
+    cards = take_cards(db, user_id, size)
+    if cards is None:
+        return None
+    card_ids = [profile_id for profile_id, _ in cards]
+
+    profiles_by_id = {}
+    if card_ids:
+        rows = available_profiles_query(db, user_id).with_entities(*CARD_COLUMNS).filter(
+            Profile.id.in_(card_ids)
+        ).all()
+        profiles_by_id = {row.id: profile_card(row) for row in rows}
+
+    stale_ids = [profile_id for profile_id in card_ids if profile_id not in profiles_by_id]
+    for profile_id in stale_ids:
+        drop_card(user_id, profile_id)
+
+    served = [(profile_id, score) for profile_id, score in cards if profile_id in profiles_by_id]
+    content = [profiles_by_id[profile_id] for profile_id, _ in served]
+    next_cursor = None
+    if served and has_more_cards(user_id, len(cards)):
+        # Курсор в том же формате (score, id), что и у SQL-пути ленты
+        next_cursor = encode_cursor(*served[-1])
+
+    total = cached_total(user_id)
+    return {
+        "content": content,
+        "total_elements": total,
+        "total_pages": math.ceil(total / size) if total > 0 else 0,
+        "size": size,
+        "number": 0,
+        "next_cursor": next_cursor
+    }
@@ -0,0 +1,91 @@
+"""
+Pub/sub событий для push-уведомлений клиентам (в памяти воркера).
+
+Клиент держит открытый поток GET /api/events (Server-Sent Events), а
+match_service публикует в хаб новые входящие лайки и мэтчи. Хаб раздает
+событие всем подключениям пользователя (несколько вкладок/устройств).
+
+Публикация вызывается из синхронных обработчиков (пул потоков FastAPI),
+поэтому события передаются в очередь подписчика через call_soon_threadsafe
+его event loop. Медленный клиент не блокирует публикацию: при переполнении
+его очереди событие для него отбрасывается, и клиент дочитает изменения
+обычным запросом.
+
+Хаб не разделяется между воркерами: при нескольких процессах событие
+увидят только подключения к тому же процессу, что обработал свайп.
+"""
+import asyncio
+import os
+import threading
+from typing import Dict, Set
+
+EVENTS_ENABLED = os.getenv("EVENTS_ENABLED", "true").lower() == "true"
+# Сколько событий копим для одного подключения, пока клиент их не вычитал
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+# Сколько одновременных подключений разрешаем одному пользователю
+EVENTS_MAX_CONNECTIONS_PER_USER = int(os.getenv("EVENTS_MAX_CONNECTIONS_PER_USER", "5"))
+
+class Subscription:
+    __slots__ = ("user_id", "queue", "loop")
+
+    def __init__(self, user_id: int, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=EVENTS_QUEUE_SIZE)
+        self.loop = loop
+
+    def _put(self, event: dict):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            with _lock:
+                _stats["dropped"] += 1
+
+_subscribers: Dict[int, Set[Subscription]] = {}
+_stats = {"published": 0, "delivered": 0, "dropped": 0}
+_lock = threading.Lock()
+
+def is_enabled() -> bool:
+    return EVENTS_ENABLED
+
+def subscribe(user_id: int) -> Subscription:
+    """Регистрирует подключение пользователя (вызывается из event loop)"""
+    subscription = Subscription(user_id, asyncio.get_running_loop())
+    with _lock:
+        subscriptions = _subscribers.setdefault(user_id, set())
+        if len(subscriptions) >= EVENTS_MAX_CONNECTIONS_PER_USER:
+            raise ValueError("Слишком много подключений к событиям")
+        subscriptions.add(subscription)
+    return subscription
+
+def unsubscribe(subscription: Subscription):
+    with _lock:
+        subscriptions = _subscribers.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del _subscribers[subscription.user_id]
+
+def publish(user_id: int, event: dict):
+    """Отправляет событие всем подключениям пользователя; без подключений - ничего не делает"""
+    if not EVENTS_ENABLED:
+        return
+    with _lock:
+        subscriptions = list(_subscribers.get(user_id, ()))
+        _stats["published"] += 1
+        _stats["delivered"] += len(subscriptions)
+    for subscription in subscriptions:
+        try:
+            subscription.loop.call_soon_threadsafe(subscription._put, event)
+        except RuntimeError:
+            # Event loop подписчика уже закрыт
+            unsubscribe(subscription)
+
+def get_stats() -> dict:
+    with _lock:
+        return {
+            "enabled": EVENTS_ENABLED,
+            "users": len(_subscribers),
+            "connections": sum(len(s) for s in _subscribers.values()),
+            **_stats,
+        }
@@ -1,30 +1,268 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from typing import List
+from sqlalchemy import and_, or_, case, func, text
+from typing import List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+from app.database import pin_to_primary
 from app.models import Swipe, Match, Profile
+from sqlalchemy.exc import IntegrityError
+from app.services import deck_service, swipe_cache, swipe_buffer, event_hub, profile_counters, profile_cache, swipe_archive
+from app.services.profile_service import CARD_COLUMNS, encode_cursor, decode_cursor, profile_card
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Лайк и мэтч одним выражением (PostgreSQL): вставка свайпа через ON CONFLICT DO NOTHING
+# (и без вставки, если профиль уже в архиве пассов swipe_archive),
+# поиск взаимного лайка и вставка мэтча в одном CTE - один commit.
+# Все части CTE видят один снимок данных, поэтому уже существующий мэтч
+# ищется отдельно (existing_match), а только что созданный - через RETURNING.
+# Встречный лайк, записанный одновременно, CTE бы не увидел - поэтому до него
+# пара пользователей блокируется (profile_counters.lock_pairs)
+_LIKE_AND_MATCH_SQL = """
+WITH target AS (
+    SELECT id, user_id FROM profiles WHERE id = :target_profile_id
+),
+own AS (
+    SELECT id FROM profiles WHERE user_id = :user_id
+),
+inserted_swipe AS (
+    INSERT INTO swipes (user_id, target_profile_id, action)
+    SELECT :user_id, target.id, 'like' FROM target
+    {archive_filter}
+    ON CONFLICT (user_id, target_profile_id) DO NOTHING
+    RETURNING id
+),
+mutual AS (
+    SELECT target.user_id
+    FROM target, own
+    WHERE EXISTS (SELECT 1 FROM inserted_swipe)
+      AND EXISTS (
+          SELECT 1 FROM swipes s
+          WHERE s.user_id = target.user_id
+            AND s.target_profile_id = own.id
+            AND s.action = 'like'
+      )
+),
+new_match AS (
+    INSERT INTO matches (user1_id, user2_id)
+    SELECT LEAST(:user_id, mutual.user_id), GREATEST(:user_id, mutual.user_id) FROM mutual
+    ON CONFLICT (user1_id, user2_id) DO NOTHING
+    RETURNING id
+),
+existing_match AS (
+    SELECT m.id FROM matches m, mutual
+    WHERE m.user1_id = LEAST(:user_id, mutual.user_id)
+      AND m.user2_id = GREATEST(:user_id, mutual.user_id)
+)
+SELECT
+    (SELECT user_id FROM target) AS target_user_id,
+    (SELECT id FROM own) AS own_profile_id,
+    EXISTS (SELECT 1 FROM inserted_swipe) AS inserted,
+    EXISTS (SELECT 1 FROM mutual) AS matched,
+    COALESCE((SELECT id FROM new_match), (SELECT id FROM existing_match)) AS match_id,
+    EXISTS (SELECT 1 FROM new_match) AS match_created,
+    COALESCE(
+        (SELECT s.action FROM swipes s, target, own
+         WHERE s.user_id = target.user_id AND s.target_profile_id = own.id),
+        {archived_reciprocal}
+    ) AS reciprocal_action
+"""
+
+# Пакет свайпов одним выражением (PostgreSQL): многострочная вставка свайпов
+# и поиск мэтчей сразу для всех лайков пакета, по тем же правилам, что и like_profile
+# (включая блокировку пар).
+# Повтор profile_id внутри пакета учитывается один раз (по первому вхождению)
+_SWIPE_BATCH_SQL = """
+WITH input AS (
+    SELECT t.profile_id, t.action, t.ord
+    FROM unnest(CAST(:profile_ids AS BIGINT[]), CAST(:actions AS VARCHAR[]))
+        WITH ORDINALITY AS t(profile_id, action, ord)
+),
+own AS (
+    SELECT id FROM profiles WHERE user_id = :user_id
+),
+targets AS (
+    SELECT DISTINCT ON (i.profile_id) i.ord, i.profile_id, i.action, p.user_id AS target_user_id
+    FROM input i JOIN profiles p ON p.id = i.profile_id
+    ORDER BY i.profile_id, i.ord
+),
+inserted_swipes AS (
+    INSERT INTO swipes (user_id, target_profile_id, action)
+    SELECT :user_id, t.profile_id, t.action FROM targets t
+    {archive_filter}
+    ON CONFLICT (user_id, target_profile_id) DO NOTHING
+    RETURNING target_profile_id
+),
+mutual AS (
+    SELECT t.ord, t.target_user_id
+    FROM targets t
+    JOIN inserted_swipes ins ON ins.target_profile_id = t.profile_id
+    CROSS JOIN own
+    WHERE t.action = 'like'
+      AND EXISTS (
+          SELECT 1 FROM swipes s
+          WHERE s.user_id = t.target_user_id
+            AND s.target_profile_id = own.id
+            AND s.action = 'like'
+      )
+),
+new_matches AS (
+    INSERT INTO matches (user1_id, user2_id)
+    SELECT LEAST(:user_id, target_user_id), GREATEST(:user_id, target_user_id) FROM mutual
+    ON CONFLICT (user1_id, user2_id) DO NOTHING
+    RETURNING id, user1_id, user2_id
+)
+SELECT
+    i.ord,
+    i.profile_id,
+    i.action,
+    t.target_user_id,
+    (SELECT id FROM own) AS own_profile_id,
+    EXISTS (SELECT 1 FROM profiles p WHERE p.id = i.profile_id) AS target_exists,
+    (ins.target_profile_id IS NOT NULL) AS inserted,
+    (mu.ord IS NOT NULL) AS matched,
+    COALESCE(nm.id, em.id) AS match_id,
+    (nm.id IS NOT NULL) AS match_created,
+    COALESCE(
+        (SELECT r.action FROM swipes r, own
+         WHERE r.user_id = t.target_user_id AND r.target_profile_id = own.id),
+        {archived_reciprocal}
+    ) AS reciprocal_action
+FROM input i
+LEFT JOIN targets t ON t.ord = i.ord
+LEFT JOIN inserted_swipes ins ON t.ord IS NOT NULL AND ins.target_profile_id = t.profile_id
+LEFT JOIN mutual mu ON mu.ord = i.ord
+LEFT JOIN new_matches nm
+    ON mu.ord IS NOT NULL
+   AND nm.user1_id = LEAST(:user_id, mu.target_user_id)
+   AND nm.user2_id = GREATEST(:user_id, mu.target_user_id)
+LEFT JOIN matches em
+    ON mu.ord IS NOT NULL
+   AND em.user1_id = LEAST(:user_id, mu.target_user_id)
+   AND em.user2_id = GREATEST(:user_id, mu.target_user_id)
+ORDER BY i.ord
+"""
+
+def _archive_variants(sql: str, archive_filter: str, archived_reciprocal: str) -> dict:
+    """
+    Два варианта выражения: с учетом swipe_archive (пасс из архива - тоже свайп)
+    и без него, если архив не создан (см. swipe_archive.is_supported)
+    """
+    return {
+        True: text(sql.format(archive_filter=archive_filter, archived_reciprocal=archived_reciprocal)),
+        False: text(sql.format(archive_filter="", archived_reciprocal="NULL")),
+    }
+
+_LIKE_AND_MATCH_SQL = _archive_variants(
+    _LIKE_AND_MATCH_SQL,
+    archive_filter="""WHERE NOT EXISTS (
+        SELECT 1 FROM swipe_archive a WHERE a.user_id = :user_id AND a.target_profile_id = target.id
+    )""",
+    archived_reciprocal="""(SELECT 'pass' FROM swipe_archive a, target, own
+         WHERE a.user_id = target.user_id AND a.target_profile_id = own.id)""",
+)
+_SWIPE_BATCH_SQL = _archive_variants(
+    _SWIPE_BATCH_SQL,
+    archive_filter="""WHERE NOT EXISTS (
+        SELECT 1 FROM swipe_archive a WHERE a.user_id = :user_id AND a.target_profile_id = t.profile_id
+    )""",
+    archived_reciprocal="""(SELECT 'pass' FROM swipe_archive a, own
+         WHERE a.user_id = t.target_user_id AND a.target_profile_id = own.id)""",
+)
+
+def _notify_like(user_id: int, own_profile_id: int, target_user_id: int, target_profile_id: int,
+                  matched: bool, match_id: int | None):
+    """Новый лайк: push второму пользователю (при мэтче - обоим)"""
+    # Второй пользователь пойдет за мэтчем/лайком по событию - читаем ему из основной БД;
+    # счетчики обоих профилей (/{profile_id}/stats) изменились - их тоже
+    pin_to_primary(target_user_id, target_profile_id)
+    pin_to_primary(user_id, own_profile_id)
+    if matched:
+        event_hub.publish(user_id, {
+            "type": "match", "match_id": match_id,
+            "user_id": target_user_id, "profile_id": target_profile_id
+        })
+        event_hub.publish(target_user_id, {
+            "type": "match", "match_id": match_id,
+            "user_id": user_id, "profile_id": own_profile_id
+        })
+    else:
+        event_hub.publish(target_user_id, {
+            "type": "incoming_like", "user_id": user_id, "profile_id": own_profile_id
+        })
 
 def like_profile(db: Session, user_id: int, target_profile_id: int) -> tuple[bool, int | None]:
     """Лайкает профиль и создает мэтч если есть взаимный лайк"""
     print(f"[like_profile] user_id={user_id}, target_profile_id={target_profile_id}")
     
+    # Уже известный этому воркеру свайп (в т.ч. пасс в очереди swipe_buffer) отсекаем без обращения к БД
+    if swipe_cache.known_swiped(user_id, target_profile_id) or swipe_buffer.is_pending(user_id, target_profile_id):
+        deck_service.drop_card(user_id, target_profile_id)
+        raise ValueError("Вы уже взаимодействовали с этим профилем")
+    
+    if db.get_bind().dialect.name != "postgresql":
+        return _like_profile_orm(db, user_id, target_profile_id)
+    
+    try:
+        profile_counters.lock_pairs(db, [(user_id, target_profile_id)])
+        row = db.execute(_LIKE_AND_MATCH_SQL[swipe_archive.is_supported(db)], {
+            "user_id": user_id,
+            "target_profile_id": target_profile_id
+        }).one()
+        if row.inserted:
+            # Счетчики профилей - в той же транзакции, без дополнительных чтений
+            deltas = profile_counters.CounterDeltas()
+            deltas.swipe(row.own_profile_id, target_profile_id, "like", row.reciprocal_action)
+            if row.match_created:
+                deltas.match(row.own_profile_id, target_profile_id)
+            profile_counters.apply(db, deltas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    if row.target_user_id is None:
+        raise ValueError("Профиль не найден")
+    
+    swipe_cache.record(user_id, target_profile_id)
+    deck_service.drop_card(user_id, target_profile_id)
+    
+    if not row.inserted:
+        raise ValueError("Вы уже взаимодействовали с этим профилем")
+    
+    if row.own_profile_id is None:
+        print(f"[like_profile] WARNING: Current user profile not found for user_id={user_id}")
+        return False, None
+    
+    _notify_like(user_id, row.own_profile_id, row.target_user_id, target_profile_id, row.matched, row.match_id)
+    
+    if row.matched:
+        # После мэтча текущий профиль не должен показываться и в колоде второго пользователя
+        deck_service.drop_card(row.target_user_id, row.own_profile_id)
+        print(f"[like_profile] MUTUAL LIKE FOUND! match_id={row.match_id}")
+        return True, row.match_id
+    
+    print(f"[like_profile] No mutual like yet. Waiting for other user to like back.")
+    return False, None
+
+def _like_profile_orm(db: Session, user_id: int, target_profile_id: int) -> tuple[bool, int | None]:
+    """Та же логика через ORM, пошагово - для БД без data-modifying CTE (SQLite в локальной разработке)"""
+    
     # Проверяем, существует ли профиль
-    target_profile = db.query(Profile).filter(Profile.id == target_profile_id).first()
+    target_profile = profile_cache.get_by_id(db, target_profile_id)
     if not target_profile:
         raise ValueError("Профиль не найден")
     
-    print(f"[like_profile] Target profile found: user_id={target_profile.user_id}, name={target_profile.name}")
+    print(f"[like_profile] Target profile found: user_id={target_profile['user_id']}, name={target_profile['name']}")
     
-    # Проверяем, не был ли уже свайп
-    existing_swipe = db.query(Swipe).filter(
-        and_(
-            Swipe.user_id == user_id,
-            Swipe.target_profile_id == target_profile_id
-        )
-    ).first()
-    
-    if existing_swipe:
+    # Проверяем, не был ли уже свайп (по swipe_cache, без запроса к БД, если история в кэше)
+    if swipe_cache.has_swiped(db, user_id, target_profile_id):
+        deck_service.drop_card(user_id, target_profile_id)
         raise ValueError("Вы уже взаимодействовали с этим профилем")
     
+    # Изменения счетчиков считаем до вставки - встречный свайп от нее не зависит
+    deltas = profile_counters.CounterDeltas()
+    profile_counters.collect_swipes(db, deltas, [(user_id, target_profile_id, "like")])
+    
     # Сохраняем лайк
     swipe = Swipe(
         user_id=user_id,
@@ -32,31 +270,43 @@ def like_profile(db: Session, user_id: int, target_profile_id: int) -> tuple[boo
         action="like"
     )
     db.add(swipe)
-    db.commit()
+    try:
+        profile_counters.apply(db, deltas)
+        db.commit()
+    except IntegrityError:
+        # Свайп успел записаться через другой воркер - кэш этого воркера отстал
+        db.rollback()
+        swipe_cache.record(user_id, target_profile_id)
+        deck_service.drop_card(user_id, target_profile_id)
+        raise ValueError("Вы уже взаимодействовали с этим профилем")
+    swipe_cache.record(user_id, target_profile_id)
+    deck_service.drop_card(user_id, target_profile_id)
     print(f"[like_profile] Swipe saved: user_id={user_id} -> profile_id={target_profile_id}")
     
     # Находим профиль текущего пользователя
-    current_profile = db.query(Profile).filter(Profile.user_id == user_id).first()
+    current_profile = profile_cache.get_by_user_id(db, user_id)
     if not current_profile:
         print(f"[like_profile] WARNING: Current user profile not found for user_id={user_id}")
         return False, None
     
-    print(f"[like_profile] Current profile found: id={current_profile.id}, name={current_profile.name}")
+    print(f"[like_profile] Current profile found: id={current_profile['id']}, name={current_profile['name']}")
     
     # Проверяем взаимный лайк (ищем лайк от целевого профиля к текущему)
     mutual_swipe = db.query(Swipe).filter(
         and_(
-            Swipe.user_id == target_profile.user_id,
-            Swipe.target_profile_id == current_profile.id,
+            Swipe.user_id == target_profile["user_id"],
+            Swipe.target_profile_id == current_profile["id"],
             Swipe.action == "like"
         )
     ).first()
     
     if mutual_swipe:
         print(f"[like_profile] MUTUAL LIKE FOUND! Creating match...")
+        # После мэтча текущий профиль не должен показываться и в колоде второго пользователя
+        deck_service.drop_card(target_profile["user_id"], current_profile["id"])
         # Создаем мэтч (user1_id всегда меньше user2_id для уникальности)
-        user1_id = min(user_id, target_profile.user_id)
-        user2_id = max(user_id, target_profile.user_id)
+        user1_id = min(user_id, target_profile["user_id"])
+        user2_id = max(user_id, target_profile["user_id"])
         
         print(f"[like_profile] Match will be: user1_id={user1_id}, user2_id={user2_id}")
         
@@ -71,43 +321,245 @@ def like_profile(db: Session, user_id: int, target_profile_id: int) -> tuple[boo
         if not existing_match:
             match = Match(user1_id=user1_id, user2_id=user2_id)
             db.add(match)
+            deltas = profile_counters.CounterDeltas()
+            deltas.match(current_profile["id"], target_profile_id)
+            profile_counters.apply(db, deltas)
             db.commit()
             db.refresh(match)
             print(f"[like_profile] Match created! match_id={match.id}")
+            _notify_like(user_id, current_profile["id"], target_profile["user_id"], target_profile_id, True, match.id)
             return True, match.id
         else:
             print(f"[like_profile] Match already exists: match_id={existing_match.id}")
+            _notify_like(user_id, current_profile["id"], target_profile["user_id"], target_profile_id, True, existing_match.id)
             return True, existing_match.id
     else:
         print(f"[like_profile] No mutual like yet. Waiting for other user to like back.")
+        _notify_like(user_id, current_profile["id"], target_profile["user_id"], target_profile_id, False, None)
     
     return False, None
 
+def _require_profile(db: Session, profile_id: int):
+    if db.query(Profile.id).filter(Profile.id == profile_id).first() is None:
+        raise ValueError("Профиль не найден")
+
 def pass_profile(db: Session, user_id: int, target_profile_id: int):
-    # Проверяем, не был ли уже свайп
-    existing_swipe = db.query(Swipe).filter(
-        and_(
-            Swipe.user_id == user_id,
-            Swipe.target_profile_id == target_profile_id
-        )
-    ).first()
+    """Пропускает профиль; ValueError - профиля нет"""
+    # В режиме write-behind пасс только ставится в очередь: дубли отсеет ON CONFLICT при сбросе
+    if swipe_buffer.is_enabled():
+        if not swipe_cache.known_swiped(user_id, target_profile_id):
+            _require_profile(db, target_profile_id)
+        swipe_buffer.enqueue_pass(user_id, target_profile_id)
+        swipe_cache.record(user_id, target_profile_id)
+        deck_service.drop_card(user_id, target_profile_id)
+        return
     
-    if existing_swipe:
+    # Проверяем, не был ли уже свайп
+    if swipe_cache.has_swiped(db, user_id, target_profile_id):
+        deck_service.drop_card(user_id, target_profile_id)
         return  # Уже был свайп, ничего не делаем
     
+    _require_profile(db, target_profile_id)
+    
+    # Пасс в ответ на входящий лайк уменьшает pending_incoming
+    deltas = profile_counters.CounterDeltas()
+    profile_counters.lock_pairs(db, [(user_id, target_profile_id)])
+    profile_counters.collect_swipes(db, deltas, [(user_id, target_profile_id, "pass")])
+    
     swipe = Swipe(
         user_id=user_id,
         target_profile_id=target_profile_id,
         action="pass"
     )
     db.add(swipe)
-    db.commit()
+    try:
+        profile_counters.apply(db, deltas)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        # Свайп успел записаться через другой воркер - ничего не делаем;
+        # остальные нарушения (внешний ключ) - ошибка
+        if getattr(e.orig, "pgcode", "23505") != "23505":
+            raise
+    swipe_cache.record(user_id, target_profile_id)
+    deck_service.drop_card(user_id, target_profile_id)
 
-def get_matches(db: Session, user_id: int) -> List[Match]:
-    return db.query(Match).filter(
-        or_(
-            Match.user1_id == user_id,
-            Match.user2_id == user_id
-        )
-    ).all()
+def swipe_batch(db: Session, user_id: int, swipes: List[Tuple[int, str]]) -> List[dict]:
+    """
+    Записывает пакет свайпов [(profile_id, 'like'|'pass'), ...] одним запросом и одним commit.
+
+    Возвращает результат по каждому элементу в исходном порядке:
+    status - 'ok', 'duplicate' (свайп уже был или повтор в пакете) или 'not_found',
+    matched/match_id - для лайков, которые дали мэтч.
+    """
+    if not swipes:
+        return []
+    
+    # Уже известные этому воркеру свайпы (в т.ч. пассы в очереди swipe_buffer) - как в
+    # like_profile: повтор без обращения к БД. В запрос они не идут - иначе лайк лег бы
+    # поверх пасса из очереди, а пасс потом молча отбросил бы ON CONFLICT
+    known = set()
+    for profile_id, _ in swipes:
+        if swipe_cache.known_swiped(user_id, profile_id) or swipe_buffer.is_pending(user_id, profile_id):
+            known.add(profile_id)
+            deck_service.drop_card(user_id, profile_id)
+    fresh = [(profile_id, action) for profile_id, action in swipes if profile_id not in known]
+    if not fresh:
+        written = iter(())
+    elif db.get_bind().dialect.name != "postgresql":
+        written = iter(_swipe_batch_orm(db, user_id, fresh))
+    else:
+        written = iter(_swipe_batch_sql(db, user_id, fresh))
+    return [
+        {"profile_id": profile_id, "action": action, "status": "duplicate", "matched": False, "match_id": None}
+        if profile_id in known else next(written)
+        for profile_id, action in swipes
+    ]
+
+def _swipe_batch_sql(db: Session, user_id: int, swipes: List[Tuple[int, str]]) -> List[dict]:
+    """Пакет свайпов одним выражением с data-modifying CTE (PostgreSQL)"""
+    try:
+        profile_counters.lock_pairs(db, [(user_id, profile_id) for profile_id, _ in swipes])
+        rows = db.execute(_SWIPE_BATCH_SQL[swipe_archive.is_supported(db)], {
+            "user_id": user_id,
+            "profile_ids": [profile_id for profile_id, _ in swipes],
+            "actions": [action for _, action in swipes]
+        }).all()
+        deltas = profile_counters.CounterDeltas()
+        for row in rows:
+            if row.inserted:
+                deltas.swipe(row.own_profile_id, row.profile_id, row.action, row.reciprocal_action)
+            if row.match_created:
+                deltas.match(row.own_profile_id, row.profile_id)
+        profile_counters.apply(db, deltas)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    
+    results = []
+    for row in rows:
+        if not row.target_exists:
+            status = "not_found"
+        elif row.inserted:
+            status = "ok"
+        else:
+            status = "duplicate"
+        
+        if row.target_exists:
+            swipe_cache.record(user_id, row.profile_id)
+            deck_service.drop_card(user_id, row.profile_id)
+        if row.matched:
+            deck_service.drop_card(row.target_user_id, row.own_profile_id)
+        if row.inserted and row.action == "like" and row.own_profile_id is not None:
+            _notify_like(user_id, row.own_profile_id, row.target_user_id, row.profile_id, row.matched, row.match_id)
+        
+        results.append({
+            "profile_id": row.profile_id,
+            "action": row.action,
+            "status": status,
+            "matched": bool(row.matched),
+            "match_id": row.match_id
+        })
+    
+    return results
+
+def _swipe_batch_orm(db: Session, user_id: int, swipes: List[Tuple[int, str]]) -> List[dict]:
+    """Пакет свайпов поэлементно через like_profile/pass_profile - для БД без data-modifying CTE"""
+    results = []
+    seen = set()
+    for profile_id, action in swipes:
+        result = {"profile_id": profile_id, "action": action, "status": "ok", "matched": False, "match_id": None}
+        if profile_id in seen:
+            result["status"] = "duplicate"
+        elif db.query(Profile.id).filter(Profile.id == profile_id).first() is None:
+            result["status"] = "not_found"
+        elif action == "like":
+            try:
+                result["matched"], result["match_id"] = _like_profile_orm(db, user_id, profile_id)
+            except ValueError:
+                result["status"] = "duplicate"
+        else:
+            if swipe_cache.has_swiped(db, user_id, profile_id):
+                result["status"] = "duplicate"
+            pass_profile(db, user_id, profile_id)
+        seen.add(profile_id)
+        results.append(result)
+    return results
+
+def _matched_at_to_us(matched_at: datetime) -> int:
+    """matched_at в микросекундах от эпохи - целое значение для курсора (без потери точности)"""
+    if matched_at.tzinfo is None:
+        # SQLite отдает время без зоны (CURRENT_TIMESTAMP - UTC)
+        matched_at = matched_at.replace(tzinfo=timezone.utc)
+    return (matched_at - _EPOCH) // timedelta(microseconds=1)
+
+def get_matches_version(db: Session, user_id: int) -> tuple:
+    """
+    Водяной знак мэтчей пользователя для ETag: число мэтчей, последний match_id и
+    последнее изменение профилей вторых участников. Меняется при новом мэтче,
+    удалении профиля и правке любой карточки из списка - одна агрегатная строка
+    вместо выборки и сериализации всего списка.
+    """
+    other_user_id = case((Match.user1_id == user_id, Match.user2_id), else_=Match.user1_id)
+    row = db.query(func.count(Match.id), func.max(Match.id), func.max(Profile.updated_at)).join(
+        Profile, Profile.user_id == other_user_id
+    ).filter(
+        or_(Match.user1_id == user_id, Match.user2_id == user_id)
+    ).one()
+    return tuple(row)
+
+def get_matches(db: Session, user_id: int, limit: Optional[int] = 100,
+                cursor: Optional[str] = None, since: Optional[datetime] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Мэтчи пользователя вместе с профилем второго участника - одним запросом,
+    от новых к старым (matched_at DESC, id DESC), с keyset-пагинацией.
+
+    limit=None - все мэтчи одной выборкой (без курсора).
+    since - только мэтчи новее этого момента (инкрементальная синхронизация).
+    Возвращает (элементы в формате MatchResponse для FastJSONResponse, next_cursor или None).
+    """
+    other_user_id = case((Match.user1_id == user_id, Match.user2_id), else_=Match.user1_id)
+    # Профиль второго участника - только колонки карточки, без ORM объектов
+    query = db.query(Match.id.label("match_id"), Match.matched_at, *CARD_COLUMNS).join(
+        Profile, Profile.user_id == other_user_id
+    ).filter(
+        or_(Match.user1_id == user_id, Match.user2_id == user_id)
+    )
+    
+    naive = db.get_bind().dialect.name == "sqlite"
+    if since is not None:
+        if naive and since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        query = query.filter(Match.matched_at > since)
+    if cursor:
+        after_id, after_us = decode_cursor(cursor)
+        if after_us is None:
+            raise ValueError("Неверный курсор пагинации")
+        after_at = _EPOCH + timedelta(microseconds=after_us)
+        if naive:
+            after_at = after_at.replace(tzinfo=None)
+        query = query.filter(or_(
+            Match.matched_at < after_at,
+            and_(Match.matched_at == after_at, Match.id < after_id)
+        ))
+    
+    query = query.order_by(Match.matched_at.desc(), Match.id.desc())
+    if limit is None:
+        rows, has_more = query.all(), False
+    else:
+        rows = query.limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+    
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.match_id, _matched_at_to_us(last.matched_at))
+    
+    items = [
+        {"id": row.match_id, "matched_profile": profile_card(row, offset=2), "matched_at": row.matched_at}
+        for row in rows
+    ]
+    return items, next_cursor
 
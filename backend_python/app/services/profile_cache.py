@@ -0,0 +1,300 @@
+"""
+Read-through кэш профилей по id и по user_id (в памяти воркера).
+
+Хранит профиль в формате ProfileResponse (словарь для FastJSONResponse) под
+двумя ключами - ("id", profile_id) и ("user", user_id). Ограничен по числу
+записей (LRU) и по времени жизни (TTL). Отсутствие профиля у user_id тоже
+кэшируется, но коротко: /check/{user_id} часто спрашивают до создания профиля.
+
+create_or_update_profile сбрасывает записи профиля через invalidate().
+Сброс рассылается через backend, чтобы его увидели и другие воркеры:
+- local - только свой процесс (для разработки и тестов): другие процессы
+  отдают старый профиль и его ETag до истечения TTL;
+- postgres - LISTEN/NOTIFY в основной БД (нужно прямое соединение, не pooler:
+  PROFILE_CACHE_LISTEN_URL, по умолчанию DATABASE_URL).
+Без PROFILE_CACHE_BACKEND на PostgreSQL с WEB_CONCURRENCY > 1 выбирается
+postgres, иначе local. Несколько экземпляров приложения с одним воркером
+тоже должны ставить postgres явно. Свой backend можно подключить через set_backend().
+
+Чтение из реплики может вернуть профиль до записи. Такой результат не
+кладется в кэш, если профиль сбрасывался последние READ_YOUR_WRITES_SECONDS -
+иначе старая версия жила бы в кэше весь TTL. Запись заполнит кэш при
+следующем чтении из основной БД или после отставания реплики.
+
+Возвращаемые словари общие для всех запросов - изменять их нельзя.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.database import READ_YOUR_WRITES_SECONDS, is_replica
+from app.db_pool import WEB_CONCURRENCY
+from app.models import Profile
+
+PROFILE_CACHE_ENABLED = os.getenv("PROFILE_CACHE_ENABLED", "true").lower() == "true"
+PROFILE_CACHE_MAX_ENTRIES = int(os.getenv("PROFILE_CACHE_MAX_ENTRIES", "20000"))
+PROFILE_CACHE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_TTL_SECONDS", "60"))
+# Сколько помним, что у user_id нет профиля
+PROFILE_CACHE_NEGATIVE_TTL_SECONDS = float(os.getenv("PROFILE_CACHE_NEGATIVE_TTL_SECONDS", "5"))
+# local | postgres; пусто - выбор по числу воркеров (см. выше)
+PROFILE_CACHE_BACKEND = os.getenv("PROFILE_CACHE_BACKEND", "").lower()
+_CHANNEL = "profile_cache_invalidate"
+
+Key = Tuple[str, int]
+
+class LocalBackend:
+    """Рассылка сброса внутри процесса"""
+
+    def __init__(self):
+        self._callback: Optional[Callable[[Iterable[Key]], None]] = None
+
+    def subscribe(self, callback: Callable[[Iterable[Key]], None]):
+        self._callback = callback
+
+    def publish(self, keys: Iterable[Key]):
+        if self._callback is not None:
+            self._callback(keys)
+
+    def close(self):
+        pass
+
+class PostgresBackend:
+    """
+    Рассылка сброса всем воркерам через PostgreSQL NOTIFY. Каждый воркер держит
+    одно LISTEN-соединение в фоновом потоке; свой процесс тоже получает
+    уведомление, поэтому повторный сброс безвреден.
+    """
+
+    def __init__(self, url: str):
+        self._url = url
+        self._callback = None
+        self._stopping = threading.Event()
+        self._listener = None
+
+    def subscribe(self, callback: Callable[[Iterable[Key]], None]):
+        self._callback = callback
+        self._listener = threading.Thread(target=self._listen, name="profile-cache-listen", daemon=True)
+        self._listener.start()
+
+    def publish(self, keys: Iterable[Key]):
+        from app.database import engine
+        payload = json.dumps([[kind, value] for kind, value in keys], separators=(",", ":"))
+        with engine.begin() as connection:
+            connection.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": _CHANNEL, "payload": payload})
+
+    def _listen(self):
+        import select
+
+        import psycopg2
+
+        while not self._stopping.is_set():
+            connection = None
+            try:
+                connection = psycopg2.connect(self._url)
+                connection.autocommit = True
+                connection.cursor().execute(f"LISTEN {_CHANNEL}")
+                # Пока слушателя не было, сбросы могли потеряться - начинаем с чистого кэша
+                clear()
+                while not self._stopping.is_set():
+                    if select.select([connection], [], [], 5)[0]:
+                        connection.poll()
+                        while connection.notifies:
+                            notify = connection.notifies.pop(0)
+                            self._callback([(kind, value) for kind, value in json.loads(notify.payload)])
+            except Exception as e:
+                print(f"[profile_cache] Invalidation listener failed, reconnecting: {e}")
+                self._stopping.wait(5)
+            finally:
+                if connection is not None:
+                    connection.close()
+
+    def close(self):
+        self._stopping.set()
+
+class _Entry:
+    __slots__ = ("profile", "expires_at")
+
+    def __init__(self, profile: Optional[dict], ttl: float):
+        self.profile = profile
+        self.expires_at = time.monotonic() + ttl
+
+_entries: "OrderedDict[Key, _Entry]" = OrderedDict()
+# Растет при каждом сбросе: загрузка, начатая до сброса, не кладет результат в кэш
+_generation = 0
+# Ключ -> time.monotonic() последнего сброса, в порядке сбросов (только за READ_YOUR_WRITES_SECONDS)
+_written: "OrderedDict[Key, float]" = OrderedDict()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "replica_skips": 0}
+_lock = threading.Lock()
+_backend = None
+
+def _drop_locked(keys: Iterable[Key]):
+    global _generation
+    _generation += 1
+    for key in keys:
+        entry = _entries.pop(key, None)
+        # Вторая запись того же профиля (по другому ключу)
+        if entry is not None and entry.profile is not None:
+            _entries.pop(("id", entry.profile["id"]), None)
+            _entries.pop(("user", entry.profile["user_id"]), None)
+    _stats["invalidations"] += 1
+
+def _mark_written_locked(keys: Iterable[Key]):
+    now = time.monotonic()
+    for key in keys:
+        _written.pop(key, None)
+        _written[key] = now
+    while _written and next(iter(_written.values())) <= now - READ_YOUR_WRITES_SECONDS:
+        _written.popitem(last=False)
+
+def _recently_written_locked(keys: Iterable[Key]) -> bool:
+    since = time.monotonic() - READ_YOUR_WRITES_SECONDS
+    return any(_written.get(key, since) > since for key in keys)
+
+def _on_invalidate(keys: Iterable[Key]):
+    keys = list(keys)
+    with _lock:
+        _drop_locked(keys)
+        _mark_written_locked(keys)
+
+def set_backend(backend):
+    """Подключает backend рассылки сброса (заменяет текущий)"""
+    global _backend
+    if _backend is not None:
+        _backend.close()
+    _backend = backend
+    backend.subscribe(_on_invalidate)
+
+def _get_backend():
+    if _backend is None:
+        backend = PROFILE_CACHE_BACKEND
+        if not backend:
+            from app.database import engine
+            backend = "postgres" if WEB_CONCURRENCY > 1 and engine.dialect.name == "postgresql" else "local"
+        if backend == "postgres":
+            set_backend(PostgresBackend(os.getenv("PROFILE_CACHE_LISTEN_URL") or os.getenv("DATABASE_URL")))
+        else:
+            set_backend(LocalBackend())
+    return _backend
+
+def _lookup(key: Key):
+    """(найдено, профиль или None)"""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None and entry.expires_at > time.monotonic():
+            _entries.move_to_end(key)
+            _stats["hits"] += 1
+            return True, entry.profile
+        if entry is not None:
+            del _entries[key]
+        _stats["misses"] += 1
+        return False, None
+
+def _store(profile: Optional[dict], keys: Iterable[Key], generation: int, from_replica: bool):
+    with _lock:
+        if generation != _generation:
+            return
+        if from_replica and _recently_written_locked(keys):
+            _stats["replica_skips"] += 1
+            return
+        for key in keys:
+            if profile is None:
+                _entries[key] = _Entry(None, PROFILE_CACHE_NEGATIVE_TTL_SECONDS)
+            else:
+                _entries[key] = _Entry(profile, PROFILE_CACHE_TTL_SECONDS)
+            _entries.move_to_end(key)
+        while len(_entries) > PROFILE_CACHE_MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+def _load(db: Session, key: Key) -> Optional[dict]:
+    # Импорт здесь: profile_service импортирует этот модуль (сброс при записи)
+    from app.services.profile_service import CARD_COLUMNS, profile_card
+
+    if not PROFILE_CACHE_ENABLED:
+        row = db.query(*CARD_COLUMNS).filter(_filter(key)).first()
+        return profile_card(row) if row is not None else None
+
+    found, profile = _lookup(key)
+    if found:
+        return profile
+    _get_backend()
+    with _lock:
+        generation = _generation
+    row = db.query(*CARD_COLUMNS).filter(_filter(key)).first()
+    from_replica = is_replica(db)
+    if row is None:
+        # Отсутствие запоминаем только по user_id - профиль по id не появляется заново
+        if key[0] == "user":
+            _store(None, [key], generation, from_replica)
+        return None
+    profile = profile_card(row)
+    _store(profile, [("id", profile["id"]), ("user", profile["user_id"])], generation, from_replica)
+    return profile
+
+def _filter(key: Key):
+    kind, value = key
+    return Profile.id == value if kind == "id" else Profile.user_id == value
+
+def _version(db: Session, key: Key) -> Optional[tuple]:
+    if PROFILE_CACHE_ENABLED:
+        found, profile = _lookup(key)
+        if found:
+            return (profile["id"], profile["updated_at"]) if profile is not None else None
+    row = db.query(Profile.id, Profile.updated_at).filter(_filter(key)).first()
+    return tuple(row) if row is not None else None
+
+def get_by_id(db: Session, profile_id: int) -> Optional[dict]:
+    """Профиль по id (словарь ProfileResponse) или None"""
+    return _load(db, ("id", profile_id))
+
+def get_by_user_id(db: Session, user_id: int) -> Optional[dict]:
+    """Профиль пользователя (словарь ProfileResponse) или None"""
+    return _load(db, ("user", user_id))
+
+def get_version_by_id(db: Session, profile_id: int) -> Optional[tuple]:
+    """(id, updated_at) профиля для ETag - из кэша или узкой выборкой, без загрузки профиля"""
+    return _version(db, ("id", profile_id))
+
+def get_version_by_user_id(db: Session, user_id: int) -> Optional[tuple]:
+    """(id, updated_at) профиля пользователя для ETag"""
+    return _version(db, ("user", user_id))
+
+def invalidate(profile_id: Optional[int], user_id: int):
+    """Сбрасывает записи профиля в этом воркере и рассылает сброс остальным"""
+    keys = [("user", user_id)]
+    if profile_id is not None:
+        keys.append(("id", profile_id))
+    with _lock:
+        _drop_locked(keys)
+        _mark_written_locked(keys)
+    if not PROFILE_CACHE_ENABLED:
+        return
+    try:
+        _get_backend().publish(keys)
+    except Exception as e:
+        # Остальные воркеры увидят изменение после TTL
+        print(f"[profile_cache] Failed to publish invalidation: {e}")
+
+def clear():
+    with _lock:
+        _drop_locked(list(_entries))
+        _entries.clear()
+
+def shutdown():
+    if _backend is not None:
+        _backend.close()
+
+def get_stats() -> dict:
+    with _lock:
+        return {
+            "enabled": PROFILE_CACHE_ENABLED,
+            "backend": type(_backend).__name__ if _backend is not None else PROFILE_CACHE_BACKEND or None,
+            "entries": len(_entries),
+            "max_entries": PROFILE_CACHE_MAX_ENTRIES,
+            **_stats,
+        }
@@ -0,0 +1,160 @@
+"""
+Счетчики профилей (profile_counters): полученные и отправленные лайки,
+мэтчи и входящие лайки без ответа.
+
+Вместо агрегата по всей истории свайпов (бывшее представление profile_stats)
+счетчики обновляются инкрементально: match_service собирает изменения
+записи в CounterDeltas и применяет их одним UPSERT в той же транзакции,
+что и сами свайпы/мэтчи. Чтение - одна строка по первичному ключу.
+
+Встречные свайпы одной пары пользователей пишутся по очереди (lock_pairs):
+иначе транзакции не видят друг друга, и pending_incoming расходится с историей.
+Повторный запуск database/add_profile_counters.sql пересчитывает счетчики из
+истории (пока не включена архивация пассов - скрипт не учитывает swipe_archive).
+"""
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session, aliased
+
+from app.models import Profile, ProfileCounter, Swipe
+
+FIELDS = ("likes_received", "likes_sent", "matches_count", "pending_incoming")
+
+# Блокировки пар пользователей (PostgreSQL) по возрастанию ключа - две транзакции
+# с общими парами не взаимоблокируются
+_LOCK_PAIRS_SQL = text("""
+SELECT pg_advisory_xact_lock(k.key)
+FROM (
+    SELECT DISTINCT hashtextextended(LEAST(t.user_id, p.user_id) || ':' || GREATEST(t.user_id, p.user_id), 0) AS key
+    FROM unnest(CAST(:user_ids AS BIGINT[]), CAST(:profile_ids AS BIGINT[])) AS t(user_id, profile_id)
+    JOIN profiles p ON p.id = t.profile_id
+    ORDER BY key
+) k
+""")
+
+class CounterDeltas:
+    """Накопленные изменения счетчиков: profile_id -> [likes_received, likes_sent, matches_count, pending_incoming]"""
+    __slots__ = ("rows",)
+
+    def __init__(self):
+        self.rows = defaultdict(lambda: [0, 0, 0, 0])
+
+    def __bool__(self) -> bool:
+        return any(any(row) for row in self.rows.values())
+
+    def swipe(self, own_profile_id: Optional[int], target_profile_id: int, action: str,
+              reciprocal_action: Optional[str]):
+        """
+        Новый свайп владельца own_profile_id на target_profile_id.
+        reciprocal_action - свайп владельца target_profile_id на own_profile_id (если был).
+        """
+        if action == "like":
+            self.rows[target_profile_id][0] += 1
+            if own_profile_id is not None:
+                self.rows[own_profile_id][1] += 1
+        if own_profile_id is None or own_profile_id == target_profile_id:
+            return
+        # Лайк становится входящим, если получатель еще не свайпал лайкнувшего
+        if action == "like" and reciprocal_action is None:
+            self.rows[target_profile_id][3] += 1
+        # Ответ на входящий лайк (лайком или пассом) убирает его из ожидающих
+        if reciprocal_action == "like":
+            self.rows[own_profile_id][3] -= 1
+
+    def match(self, profile_id: int, other_profile_id: int):
+        self.rows[profile_id][2] += 1
+        self.rows[other_profile_id][2] += 1
+
+def lock_pairs(db: Session, swipes: List[Tuple[int, int]]):
+    """
+    Блокирует до конца транзакции пары пользователей свайпов [(user_id, target_profile_id), ...].
+
+    Вызывается до записи свайпов: встречный свайп той же пары ждет commit, и его
+    следующее выражение (новый снимок) уже видит этот свайп - взаимный лайк дает
+    мэтч, а pending_incoming считается по фактическому встречному свайпу.
+    На SQLite записи и так идут по одной - ничего не делает.
+    """
+    if not swipes or db.get_bind().dialect.name != "postgresql":
+        return
+    db.execute(_LOCK_PAIRS_SQL, {
+        "user_ids": [user_id for user_id, _ in swipes],
+        "profile_ids": [target for _, target in swipes]
+    })
+
+def collect_swipes(db: Session, deltas: CounterDeltas, swipes: List[Tuple[int, int, str]]):
+    """
+    Добавляет в deltas записанные свайпы [(user_id, target_profile_id, action), ...],
+    для которых вызывающий код не знает профиль автора и встречный свайп.
+    Два запроса на весь список.
+    """
+    if not swipes:
+        return
+    user_ids = {user_id for user_id, _, _ in swipes}
+    target_ids = {target for _, target, _ in swipes}
+    own_by_user = dict(
+        db.query(Profile.user_id, Profile.id).filter(Profile.user_id.in_(user_ids)).all()
+    )
+
+    # Встречные свайпы: владелец целевого профиля -> профиль автора свайпа
+    reciprocal = {}
+    if own_by_user:
+        target = aliased(Profile)
+        rows = db.query(target.id, Swipe.target_profile_id, Swipe.action).join(
+            Swipe, Swipe.user_id == target.user_id
+        ).filter(
+            target.id.in_(target_ids),
+            Swipe.target_profile_id.in_(list(own_by_user.values()))
+        ).all()
+        reciprocal = {(target_id, own_id): action for target_id, own_id, action in rows}
+
+    # swipe_archive здесь не нужен: для пассов важен только встречный лайк (лайки
+    # не архивируются), а лайки через этот путь пишутся лишь на БД без архива
+    for user_id, target_profile_id, action in swipes:
+        own_id = own_by_user.get(user_id)
+        deltas.swipe(own_id, target_profile_id, action, reciprocal.get((target_profile_id, own_id)))
+
+def apply(db: Session, deltas: CounterDeltas):
+    """
+    Применяет изменения одним UPSERT (без commit - в транзакции вызывающего кода).
+    Строки идут по возрастанию profile_id: UPSERT блокирует их в этом порядке, и
+    пакеты с пересекающимися профилями не взаимоблокируются.
+    """
+    values = [
+        dict(zip(("profile_id",) + FIELDS, (profile_id, *row)))
+        for profile_id, row in sorted(deltas.rows.items()) if any(row)
+    ]
+    if not values:
+        return
+    dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+    stmt = dialect.insert(ProfileCounter).values(values)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["profile_id"],
+        set_={
+            **{field: getattr(ProfileCounter, field) + getattr(stmt.excluded, field) for field in FIELDS},
+            "updated_at": stmt.excluded.updated_at,
+        }
+    )
+    db.execute(stmt)
+
+def get(db: Session, profile_id: int) -> Optional[dict]:
+    """Счетчики профиля; None, если профиля нет"""
+    row = db.query(Profile.id, ProfileCounter).outerjoin(
+        ProfileCounter, ProfileCounter.profile_id == Profile.id
+    ).filter(Profile.id == profile_id).first()
+    if row is None:
+        return None
+    counters = row.ProfileCounter
+    return {
+        "profile_id": profile_id,
+        **{field: (getattr(counters, field) if counters is not None else 0) for field in FIELDS},
+    }
+
+def pending_incoming(db: Session, user_id: int) -> int:
+    """Входящие лайки без ответа у профиля пользователя (бейдж) - одна строка по ключу"""
+    count = db.query(ProfileCounter.pending_incoming).join(
+        Profile, Profile.id == ProfileCounter.profile_id
+    ).filter(Profile.user_id == user_id).scalar()
+    return count or 0
@@ -0,0 +1,121 @@
+"""
+Множество user_id, у которых есть профиль, в памяти воркера - для /check/{user_id}.
+
+Mini App спрашивает /check на каждом запуске, и почти всегда у пользователя
+профиль уже есть. Такой ответ дается из памяти, без соединения с БД.
+
+При старте воркера user_id всех профилей загружаются одним запросом в
+отсортированный array("q") (8 байт на пользователя, поиск - bisect).
+Новые профили (create_or_update_profile и найденные через БД) попадают в
+небольшое множество _recent и время от времени вливаются в массив.
+
+Ответ "есть" точный: профили не удаляются. Ответ "нет" не точный - профиль
+мог создать другой воркер после загрузки - поэтому отсутствие проверяется
+по БД (profile_service.profile_exists). Пока множество загружается, тоже.
+"""
+import heapq
+import os
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from app.database import SessionLocal
+from app.models import Profile
+
+PROFILE_MEMBERSHIP_ENABLED = os.getenv("PROFILE_MEMBERSHIP_ENABLED", "true").lower() == "true"
+# Сколько новых user_id копится в множестве до слияния с массивом
+PROFILE_MEMBERSHIP_MERGE_AT = int(os.getenv("PROFILE_MEMBERSHIP_MERGE_AT", "1024"))
+_LOAD_BATCH_SIZE = 10000
+_LOAD_RETRY_SECONDS = 30
+
+_sorted = array("q")
+_recent: set = set()
+_loaded = False
+_stats = {"hits": 0, "fallbacks": 0, "load_ms": None}
+_lock = threading.Lock()
+_stopping = threading.Event()
+_loader = None
+
+def _contains_sorted(user_id: int) -> bool:
+    index = bisect_left(_sorted, user_id)
+    return index < len(_sorted) and _sorted[index] == user_id
+
+def _merge_locked():
+    global _sorted
+    # Добавленные во время загрузки могут уже быть в массиве
+    fresh = sorted(user_id for user_id in _recent if not _contains_sorted(user_id))
+    _sorted = array("q", heapq.merge(_sorted, fresh))
+    _recent.clear()
+
+def contains(user_id: int) -> bool:
+    """True - профиль точно есть; False - неизвестно, нужна проверка по БД"""
+    if not PROFILE_MEMBERSHIP_ENABLED:
+        return False
+    with _lock:
+        if user_id in _recent or _contains_sorted(user_id):
+            _stats["hits"] += 1
+            return True
+        _stats["fallbacks"] += 1
+        return False
+
+def add(user_id: int):
+    """Профиль пользователя создан (или найден в БД)"""
+    if not PROFILE_MEMBERSHIP_ENABLED:
+        return
+    with _lock:
+        if user_id in _recent or _contains_sorted(user_id):
+            return
+        _recent.add(user_id)
+        if _loaded and len(_recent) >= PROFILE_MEMBERSHIP_MERGE_AT:
+            _merge_locked()
+
+def load():
+    """Загружает user_id всех профилей (добавленные во время загрузки не теряются)"""
+    global _sorted, _loaded
+    start = time.time()
+    db = SessionLocal()
+    try:
+        user_ids = array("q")
+        for user_id in db.query(Profile.user_id).order_by(Profile.user_id).yield_per(_LOAD_BATCH_SIZE):
+            user_ids.append(user_id[0])
+    finally:
+        db.close()
+    with _lock:
+        _sorted = user_ids
+        _loaded = True
+        _stats["load_ms"] = round((time.time() - start) * 1000, 1)
+        if len(_recent) >= PROFILE_MEMBERSHIP_MERGE_AT:
+            _merge_locked()
+    print(f"[profile_membership] Loaded {len(user_ids)} user_ids in {_stats['load_ms']}ms")
+
+def _run():
+    while not _stopping.is_set():
+        try:
+            load()
+            return
+        except Exception as e:
+            print(f"[profile_membership] Load failed, retrying in {_LOAD_RETRY_SECONDS}s: {e}")
+            _stopping.wait(_LOAD_RETRY_SECONDS)
+
+def start():
+    """Загружает множество в фоне - до окончания загрузки /check идет в БД"""
+    global _loader
+    if not PROFILE_MEMBERSHIP_ENABLED or _loaded or (_loader is not None and _loader.is_alive()):
+        return
+    _stopping.clear()
+    _loader = threading.Thread(target=_run, name="profile-membership-load", daemon=True)
+    _loader.start()
+
+def shutdown():
+    _stopping.set()
+
+def get_stats() -> dict:
+    with _lock:
+        return {
+            "enabled": PROFILE_MEMBERSHIP_ENABLED,
+            "loaded": _loaded,
+            "user_ids": len(_sorted) + len(_recent),
+            "bytes": _sorted.itemsize * len(_sorted),
+            **_stats,
+        }
@@ -1,14 +1,81 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, not_
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy import and_, or_, not_, exists, func
 from typing import Optional, List
-from app.models import Profile, Swipe, Match
+from app.models import Profile, ProfileTag, Swipe, Match
 from app.schemas import ProfileCreate
+from app.serialization import PROFILE_FIELDS
 from app.services.file_storage import store_file
+from app.services import scoring_service, swipe_cache, swipe_buffer, swipe_archive, profile_cache, profile_membership
 from fastapi import UploadFile
+import base64
 import math
+import numpy as np
+import os
 import time
 import json
 
+TAG_MAX_LENGTH = 100
+# Подробный лог каждого запроса ленты (параметры, фильтры, время) - для отладки
+FEED_DEBUG_LOG = os.getenv("FEED_DEBUG_LOG", "false").lower() == "true"
+
+# Карточка профиля для списков (лента, входящие лайки, мэтчи): только колонки
+# ProfileResponse, в порядке его полей. Списки читают их одним SELECT в кортежи,
+# без ORM объектов (identity map, отслеживание изменений) и без валидации Pydantic
+CARD_COLUMNS = tuple(getattr(Profile, field) for field in PROFILE_FIELDS)
+_CARD_WIDTH = len(CARD_COLUMNS)
+
+def profile_card(row, offset: int = 0) -> dict:
+    """Карточка в формате ProfileResponse (для FastJSONResponse) из колонок CARD_COLUMNS строки row"""
+    return dict(zip(PROFILE_FIELDS, row[offset:offset + _CARD_WIDTH]))
+
+def encode_cursor(last_id: int, score: Optional[int] = None) -> str:
+    """Кодирует позицию последней выданной карточки (id и, если есть, score) в непрозрачный курсор"""
+    data = {"id": last_id}
+    if score is not None:
+        data["s"] = score
+    payload = json.dumps(data, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[int, Optional[int]]:
+    """Декодирует курсор, возвращает (id, score) последней выданной карточки"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        score = payload.get("s")
+        return int(payload["id"]), (int(score) if score is not None else None)
+    except (ValueError, KeyError, TypeError, AttributeError):
+        raise ValueError("Неверный курсор пагинации")
+
+def normalize_tags(values) -> List[str]:
+    """Приводит теги к виду, в котором они хранятся в profile_tags (без дублей, порядок сохраняется)"""
+    tags = []
+    for value in values:
+        if not isinstance(value, str):
+            continue
+        tag = value.strip().lower()[:TAG_MAX_LENGTH]
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+def parse_tags(raw: Optional[str]) -> List[str]:
+    """Разбирает interests/goals профиля (JSON массив, для старых записей - строка через запятую)"""
+    if not raw:
+        return []
+    try:
+        parsed = json.loads(raw)
+    except (json.JSONDecodeError, TypeError):
+        parsed = raw.split(',')
+    if not isinstance(parsed, list):
+        parsed = [parsed]
+    return normalize_tags(parsed)
+
+def sync_profile_tags(db: Session, profile: Profile):
+    """Перезаписывает строки profile_tags профиля по его interests/goals (без commit)"""
+    db.query(ProfileTag).filter(ProfileTag.profile_id == profile.id).delete(synchronize_session=False)
+    for kind, raw in (("interest", profile.interests), ("goal", profile.goals)):
+        for tag in parse_tags(raw):
+            db.add(ProfileTag(profile_id=profile.id, kind=kind, tag=tag))
+
 def create_or_update_profile(
     db: Session,
     user_id: int,
@@ -46,313 +113,401 @@ def create_or_update_profile(
                 profile.photo_url = photo_url
         
         db.add(profile)
+        # flush нужен, чтобы у нового профиля появился id для profile_tags
+        db.flush()
+        sync_profile_tags(db, profile)
         db.commit()
         db.refresh(profile)
+        scoring_service.mark_stale()
+        profile_cache.invalidate(profile.id, user_id)
+        profile_membership.add(user_id)
         return profile
     except Exception as e:
         db.rollback()
         raise
 
-def get_available_profiles(
+def _swiped_exists(user_id: int):
+    """EXISTS: пользователь уже свайпнул профиль (лайк или пасс)"""
+    # ВАЖНО: учитываем только свайпы, которые сделал ТЕКУЩИЙ пользователь
+    return exists().where(
+        Swipe.user_id == user_id,
+        Swipe.target_profile_id == Profile.id
+    )
+
+def available_profiles_query(db: Session, user_id: int, exclude_swiped: bool = True):
+    """
+    Базовый запрос кандидатов для ленты пользователя user_id.
+
+    Все исключения делаются на стороне БД анти-джойнами (NOT EXISTS), без
+    выгрузки ID свайпов и мэтчей в Python и без гигантских NOT IN списков:
+    - свой профиль;
+    - профили, на которые пользователь уже свайпнул (лайк или пасс, в т.ч. архивный пасс);
+    - профили, с которыми уже есть мэтч.
+    Если у пользователя нет своего профиля, запрос возвращает пустой результат.
+    
+    exclude_swiped=False - свайпы из БД исключит вызывающий код (по swipe_cache).
+    """
+    # Мэтч хранится с user1_id < user2_id, поэтому проверяем обе стороны
+    matched = exists().where(
+        or_(
+            and_(Match.user1_id == user_id, Match.user2_id == Profile.user_id),
+            and_(Match.user1_id == Profile.user_id, Match.user2_id == user_id)
+        )
+    )
+    
+    # Свой профиль - через алиас, чтобы подзапрос не коррелировал с внешним Profile
+    own_profile = aliased(Profile)
+    own_profile_exists = exists().where(own_profile.user_id == user_id)
+    
+    query = db.query(Profile).filter(
+        own_profile_exists,
+        Profile.user_id != user_id,
+        ~matched
+    )
+    if exclude_swiped:
+        query = query.filter(~_swiped_exists(user_id))
+        # Старые пассы перенесены из swipes в swipe_archive
+        if swipe_archive.is_supported(db):
+            query = query.filter(~swipe_archive.archived_exists(user_id, Profile.id))
+    # Пассы, еще не записанные swipe_buffer, исключаем всегда - их нет ни в БД, ни (после TTL) в swipe_cache
+    pending_ids = swipe_buffer.pending_for(user_id)
+    if pending_ids:
+        query = query.filter(~Profile.id.in_(pending_ids))
+    return query
+
+def ranked_candidates(db: Session, user_id: int, query=None, swiped: Optional[swipe_cache.SwipedSet] = None):
+    """
+    Кандидаты ленты, упорядоченные scoring_service по совместимости.
+
+    Из БД берутся только ID кандидатов (с исключениями и фильтрами query),
+    оценка считается в памяти. Если передан swiped (или query не передан и
+    история свайпов есть в swipe_cache), свайпы исключаются в памяти, а не
+    анти-джойном. Возвращает (ids, scores) - массивы NumPy.
+
+    Если кандидатов больше SCORING_MAX_CANDIDATES, оцениваются самые новые
+    профили (по убыванию id - обратный проход по первичному ключу): новые
+    пользователи попадают в ленту, а не отсекаются лимитом.
+    """
+    if query is None:
+        swiped = swipe_cache.get(db, user_id)
+        query = available_profiles_query(db, user_id, exclude_swiped=swiped is None)
+    rows = query.with_entities(Profile.id).order_by(Profile.id.desc()).limit(
+        scoring_service.SCORING_MAX_CANDIDATES
+    ).all()
+    candidate_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    if swiped is not None:
+        candidate_ids = swipe_cache.exclude(swiped, candidate_ids)
+    return scoring_service.score_candidates(db, user_id, candidate_ids)
+
+def _get_ranked_page(
     db: Session,
+    query,
     user_id: int,
-    city: Optional[str] = None,
-    university: Optional[str] = None,
-    interests: Optional[str] = None,
-    page: int = 0,
-    size: int = 20
+    page: int,
+    size: int,
+    after_id: Optional[int],
+    after_score: Optional[int],
+    swiped: Optional[swipe_cache.SwipedSet] = None,
+    filters: tuple = ()
 ) -> dict:
-    query_start_time = time.time()
-    print(f"[get_available_profiles] ===== START ===== user_id={user_id}, city={city}, university={university}, interests={interests}, page={page}, size={size}")
+    """
+    Страница ленты в порядке scoring_service: ID кандидатов + догрузка страницы по первичному ключу.
+    Первая страница ранжирует кандидатов заново, следующие берут запомненный список.
+    """
+    if after_id is not None and after_score is None:
+        raise ValueError("Курсор не соответствует фильтрам ленты")
     
-    # Находим текущий профиль
-    step_start = time.time()
-    current_profile = db.query(Profile).filter(Profile.user_id == user_id).first()
-    step_duration = (time.time() - step_start) * 1000
-    if not current_profile:
-        print(f"[get_available_profiles] ❌ Current user {user_id} has no profile")
-        return {
-            "content": [],
-            "total_elements": 0,
-            "total_pages": 0,
-            "size": size,
-            "number": page
-        }
-    print(f"[get_available_profiles] ✅ Current profile found: id={current_profile.id}, name={current_profile.name}")
-    
-    print(f"[get_available_profiles] Current profile: id={current_profile.id}, name={current_profile.name}")
+    ranking_key = (user_id, *filters)
+    cached = scoring_service.cached_ranking(ranking_key) if after_id is not None or page > 0 else None
+    if cached is None:
+        ids, scores = ranked_candidates(db, user_id, query, swiped)
+        scoring_service.remember_ranking(ranking_key, ids, scores)
+    else:
+        ids, scores = cached
+        if swiped is not None:
+            # Свайпы, сделанные после ранжирования
+            keep = swipe_cache.not_swiped(swiped, ids)
+            ids, scores = ids[keep], scores[keep]
+    total = len(ids)
     
-    # Получаем ID всех профилей, с которыми уже взаимодействовали
-    # (лайк, пасс, любой свайп - все действия создают запись в Swipe)
-    # ВАЖНО: учитываем только свайпы, которые сделал ТЕКУЩИЙ пользователь
-    # НЕ учитываем свайпы, которые сделали ДРУГИЕ пользователи на текущего
-    step_start = time.time()
-    swiped_records = db.query(Swipe.target_profile_id, Swipe.action).filter(
-        Swipe.user_id == user_id
-    ).distinct().all()
-    swiped_duration = (time.time() - step_start) * 1000
-    swiped_profile_ids = [row[0] for row in swiped_records]
-    print(f"[get_available_profiles] Swiped profile IDs (swipes made by user {user_id}): {swiped_profile_ids}")
-    # #region agent log
-    try:
-        log_data = {
-            "location": "profile_service.py:get_available_profiles",
-            "message": "Swiped profiles query completed",
-            "data": {
-                "userId": user_id,
-                "swipedCount": len(swiped_profile_ids),
-                "durationMs": round(swiped_duration, 2)
-            },
-            "timestamp": int(time.time() * 1000),
-            "sessionId": "debug-session",
-            "runId": "run1",
-            "hypothesisId": "A"
-        }
-        with open(r"c:\Users\Lenovo\max-networking-app\.cursor\debug.log", "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_data, ensure_ascii=False) + "\n")
-    except Exception as e:
-        print(f"[get_available_profiles] Failed to write log: {e}")
-    # #endregion
+    if after_id is not None:
+        page_ids, page_scores = scoring_service.top_k(ids, scores, size + 1, after_id, after_score)
+    else:
+        page_ids = ids[page * size:page * size + size + 1]
+        page_scores = scores[page * size:page * size + size + 1]
     
-    # ОПТИМИЗАЦИЯ: Объединяем два запроса matches в один с OR условием
-    step_start = time.time()
-    matched_user_ids = set()
-    # Один запрос вместо двух - используем OR для поиска мэтчей где user_id в user1_id или user2_id
-    matches = db.query(Match).filter(
-        or_(Match.user1_id == user_id, Match.user2_id == user_id)
-    ).all()
-    for match in matches:
-        if match.user1_id == user_id:
-            matched_user_ids.add(match.user2_id)
-        else:
-            matched_user_ids.add(match.user1_id)
-    matches_duration = (time.time() - step_start) * 1000
-    print(f"[get_available_profiles] Matched user IDs: {matched_user_ids}")
+    has_more = len(page_ids) > size
+    page_ids, page_scores = page_ids[:size].tolist(), page_scores[:size].tolist()
     
-    # Получаем ID профилей, с которыми уже есть мэтч
-    matched_profile_ids = []
-    if matched_user_ids:
-        step_start = time.time()
-        matched_profile_ids = [
-            row[0] for row in db.query(Profile.id).filter(
-                Profile.user_id.in_(matched_user_ids)
+    profiles = []
+    if page_ids:
+        # Анти-джойн по свайпам на странице - страховка от свайпов через другой воркер,
+        # которых еще нет в swipe_cache
+        profiles_by_id = {
+            row.id: profile_card(row) for row in db.query(*CARD_COLUMNS).filter(
+                Profile.id.in_(page_ids),
+                ~_swiped_exists(user_id)
             ).all()
-        ]
-        matched_profiles_duration = (time.time() - step_start) * 1000
-        print(f"[get_available_profiles] Matched profile IDs: {matched_profile_ids}")
-        # #region agent log
-        try:
-            log_data = {
-                "location": "profile_service.py:get_available_profiles",
-                "message": "Matched profiles query completed",
-                "data": {
-                    "userId": user_id,
-                    "matchedCount": len(matched_profile_ids),
-                    "durationMs": round(matched_profiles_duration, 2)
-                },
-                "timestamp": int(time.time() * 1000),
-                "sessionId": "debug-session",
-                "runId": "run1",
-                "hypothesisId": "B"
-            }
-            with open(r"c:\Users\Lenovo\max-networking-app\.cursor\debug.log", "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_data, ensure_ascii=False) + "\n")
-        except Exception as e:
-            print(f"[get_available_profiles] Failed to write log: {e}")
-        # #endregion
-    else:
-        print(f"[get_available_profiles] Matched profile IDs: []")
+        }
+        profiles = [profiles_by_id[i] for i in page_ids if i in profiles_by_id]
     
-    # Объединяем все исключаемые ID профилей
-    excluded_profile_ids = set(swiped_profile_ids) | set(matched_profile_ids)
-    print(f"[get_available_profiles] Excluded profile IDs: {excluded_profile_ids}")
+    next_cursor = encode_cursor(page_ids[-1], page_scores[-1]) if has_more and page_ids else None
+    return {
+        "content": profiles,
+        "total_elements": total,
+        "total_pages": math.ceil(total / size) if total > 0 else 0,
+        "size": size,
+        "number": page,
+        "next_cursor": next_cursor
+    }
+
+def get_available_profiles(
+    db: Session,
+    user_id: int,
+    city: Optional[str] = None,
+    university: Optional[str] = None,
+    interests: Optional[str] = None,
+    page: int = 0,
+    size: int = 20,
+    cursor: Optional[str] = None,
+    include_total: bool = False
+) -> dict:
+    """
+    Лента доступных профилей.
+
+    Два режима пагинации:
+    - offset (page/size) - как раньше, с точным подсчетом total_elements;
+    - keyset (cursor) - продолжение с позиции next_cursor из предыдущего ответа,
+      без OFFSET-сканирования и без COUNT (если не запрошен include_total).
+    В обоих режимах порядок стабильный - по (score, Profile.id), где score -
+    число совпавших интересов при фильтре interests, иначе оценка совместимости
+    scoring_service (если он включен). next_cursor возвращается, если есть
+    следующая страница.
+
+    Исключения считаются в БД анти-джойнами. В SQL-порядке страница (вместе
+    с total) отдается одним запросом - total считается оконной функцией
+    COUNT(*) OVER (). В порядке scoring_service запросов два: ID кандидатов
+    и догрузка профилей страницы.
+    """
+    query_start_time = time.time()
+    if FEED_DEBUG_LOG:
+        print(f"[get_available_profiles] ===== START ===== user_id={user_id}, city={city}, university={university}, interests={interests}, page={page}, size={size}, cursor={cursor}")
     
-    # Базовый запрос: исключаем свой профиль и все просмотренные
-    query = db.query(Profile).filter(
-        Profile.user_id != user_id
-    )
+    # Декодируем курсор до обращений к БД, чтобы битый курсор не стоил запросов
+    after_id, after_score = decode_cursor(cursor) if cursor else (None, None)
     
-    # Исключаем все профили, с которыми уже взаимодействовали (лайк, пасс, мэтч)
-    if excluded_profile_ids:
-        query = query.filter(~Profile.id.in_(excluded_profile_ids))
+    # Порядок по оценке совместимости - когда нет фильтра по интересам.
+    # В этом режиме свайпы исключаются в памяти по swipe_cache
+    interest_tags = normalize_tags(interests.split(',')) if interests else []
+    ranked = not interest_tags and scoring_service.is_enabled()
+    swiped = swipe_cache.get(db, user_id) if ranked else None
+    query = available_profiles_query(db, user_id, exclude_swiped=swiped is None)
     
     # Фильтры по городу и университету
     if city:
         query = query.filter(Profile.city == city)
-        print(f"[get_available_profiles] Filtering by city: {city}")
+        if FEED_DEBUG_LOG:
+            print(f"[get_available_profiles] Filtering by city: {city}")
     if university:
         query = query.filter(Profile.university == university)
-        print(f"[get_available_profiles] Filtering by university: {university}")
+        if FEED_DEBUG_LOG:
+            print(f"[get_available_profiles] Filtering by university: {university}")
     
-    # Фильтр по интересам (если передан)
-    # ВАЖНО: фильтр по интересам временно отключен, чтобы не блокировать профили
-    # TODO: реализовать правильную фильтрацию по интересам
-    if interests:
-        # interests приходит как строка через запятую: "IT,Дизайн"
-        interest_list = [i.strip() for i in interests.split(',') if i.strip()]
-        if interest_list:
-            print(f"[get_available_profiles] WARNING: Interests filter requested but NOT APPLIED to avoid blocking profiles: {interest_list}")
-            print(f"[get_available_profiles] This is a temporary fix - interests filtering will be implemented properly later")
-            # ВРЕМЕННО ОТКЛЮЧЕНО: фильтр по интересам
-            # conditions = []
-            # for interest in interest_list:
-            #     conditions.append(
-            #         Profile.interests.contains(f'"{interest}"') |
-            #         Profile.interests.contains(f"'{interest}'") |
-            #         Profile.interests.ilike(f'%{interest}%')
-            #     )
-            # if conditions:
-            #     query = query.filter(or_(*conditions))
+    # Фильтр и ранжирование по интересам (если передан)
+    # interests приходит как строка через запятую: "IT,Дизайн".
+    # Кандидаты берутся из индекса profile_tags (kind, tag) и сортируются
+    # по числу совпавших интересов, без сканирования JSON в profiles
+    overlap = None
+    if not ranked:
+        # Дальше выбираем только колонки карточки (в режиме ранжирования - только ID)
+        query = query.with_entities(*CARD_COLUMNS)
+    if interest_tags:
+        overlap = db.query(
+            ProfileTag.profile_id.label("profile_id"),
+            func.count().label("overlap")
+        ).filter(
+            ProfileTag.kind == "interest",
+            ProfileTag.tag.in_(interest_tags)
+        ).group_by(ProfileTag.profile_id).subquery()
+        query = query.join(overlap, overlap.c.profile_id == Profile.id).add_columns(overlap.c.overlap)
+        if FEED_DEBUG_LOG:
+            print(f"[get_available_profiles] Filtering by interests: {interest_tags}")
+    elif ranked:
+        # Без фильтра по интересам порядок задает векторизованная оценка совместимости
+        return _get_ranked_page(db, query, user_id, page, size, after_id, after_score, swiped, (city, university))
     
-    # Подсчет общего количества
-    step_start = time.time()
-    total = query.count()
-    count_duration = (time.time() - step_start) * 1000
-    print(f"[get_available_profiles] Total profiles before pagination: {total}")
+    # Точный total в keyset-режиме - отдельным COUNT (только по явному include_total)
+    total = None
+    if after_id is not None and include_total:
+        total = query.order_by(None).with_entities(func.count(Profile.id)).scalar()
     
-    if total == 0:
-        print(f"[get_available_profiles] ⚠️ WARNING: Total is 0! No profiles match the query.")
-        print(f"[get_available_profiles] Query filters applied: user_id!={user_id}, excluded_ids={excluded_profile_ids}, city={city}, university={university}")
+    # В offset-режиме total считается оконной функцией до LIMIT/OFFSET - в том же запросе
+    window_total = after_id is None
+    if window_total:
+        query = query.add_columns(func.count().over().label("total"))
     
-    # Пагинация
+    # Пагинация: стабильный порядок по (score, id), берем на одну запись больше,
+    # чтобы узнать, есть ли следующая страница
     step_start = time.time()
-    profiles = query.offset(page * size).limit(size).all()
+    if overlap is not None:
+        query = query.order_by(overlap.c.overlap.desc(), Profile.id)
+    else:
+        query = query.order_by(Profile.id)
+    if after_id is not None:
+        if overlap is not None:
+            if after_score is None:
+                raise ValueError("Курсор не соответствует фильтрам ленты")
+            query = query.filter(or_(
+                overlap.c.overlap < after_score,
+                and_(overlap.c.overlap == after_score, Profile.id > after_id)
+            ))
+        else:
+            query = query.filter(Profile.id > after_id)
+    else:
+        query = query.offset(page * size)
+    rows = query.limit(size + 1).all()
+    
+    if window_total:
+        if rows:
+            total = rows[0].total
+        elif page == 0:
+            total = 0
+        else:
+            # Страница за пределами выборки: оконная функция ничего не вернула
+            total = query.limit(None).offset(None).order_by(None).with_entities(func.count(Profile.id)).scalar()
+    
+    has_more = len(rows) > size
+    rows = rows[:size]
+    profiles = [profile_card(row) for row in rows]
+    
+    next_cursor = None
+    if has_more and rows:
+        last = rows[-1]
+        next_cursor = encode_cursor(last.id, last.overlap if overlap is not None else None)
     fetch_duration = (time.time() - step_start) * 1000
     
-    # Логируем найденные профили (только количество для производительности)
-    print(f"[get_available_profiles] ===== RESULT ===== Found {len(profiles)} profiles after all filters")
-    # #region agent log
-    try:
-        log_data = {
-            "location": "profile_service.py:get_available_profiles",
-            "message": "Profiles fetched",
-            "data": {
-                "userId": user_id,
-                "resultCount": len(profiles),
-                "totalElements": total,
-                "fetchDurationMs": round(fetch_duration, 2),
-                "countDurationMs": round(count_duration, 2)
-            },
-            "timestamp": int(time.time() * 1000),
-            "sessionId": "debug-session",
-            "runId": "run1",
-            "hypothesisId": "C"
-        }
-        with open(r"c:\Users\Lenovo\max-networking-app\.cursor\debug.log", "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_data, ensure_ascii=False) + "\n")
-    except Exception as e:
-        print(f"[get_available_profiles] Failed to write log: {e}")
-    # #endregion
+    if total == 0 and FEED_DEBUG_LOG:
+        print(f"[get_available_profiles] ⚠️ WARNING: Total is 0! No profiles match the query (user_id={user_id}, city={city}, university={university})")
     
-    total_pages = math.ceil(total / size) if total > 0 else 0
+    if total is None:
+        total_pages = None
+    else:
+        total_pages = math.ceil(total / size) if total > 0 else 0
     
     result = {
         "content": profiles,
         "total_elements": total,
         "total_pages": total_pages,
         "size": size,
-        "number": page
+        "number": page,
+        "next_cursor": next_cursor
     }
     
-    total_duration = (time.time() - query_start_time) * 1000
-    print(f"[get_available_profiles] ===== RETURNING ===== content.length={len(profiles)}, total_elements={total}")
-    # matches_duration может быть не определена, если matches запрос не выполнился
-    matches_duration_str = f"{matches_duration:.2f}ms" if 'matches_duration' in locals() else "N/A"
-    print(f"[get_available_profiles] ⏱️ QUERY TIMING: total={total_duration:.2f}ms, swiped_query={swiped_duration:.2f}ms, matches_query={matches_duration_str}, count={count_duration:.2f}ms, fetch={fetch_duration:.2f}ms")
-    
-    # #region agent log
-    try:
-        log_data = {
-            "location": "profile_service.py:get_available_profiles",
-            "message": "Query completed",
-            "data": {
-                "userId": user_id,
-                "totalDurationMs": round(total_duration, 2),
-                "swipedQueryMs": round(swiped_duration, 2),
-                "countMs": round(count_duration, 2),
-                "fetchMs": round(fetch_duration, 2),
-                "resultCount": len(profiles),
-                "totalElements": total,
-                "swipedCount": len(swiped_profile_ids)
-            },
-            "timestamp": int(time.time() * 1000),
-            "sessionId": "debug-session",
-            "runId": "run1",
-            "hypothesisId": "E"
-        }
-        with open(r"c:\Users\Lenovo\max-networking-app\.cursor\debug.log", "a", encoding="utf-8") as f:
-            f.write(json.dumps(log_data, ensure_ascii=False) + "\n")
-    except Exception as e:
-        print(f"[get_available_profiles] Failed to write log: {e}")
-    # #endregion
+    if FEED_DEBUG_LOG:
+        total_duration = (time.time() - query_start_time) * 1000
+        print(f"[get_available_profiles] ===== RETURNING ===== content.length={len(profiles)}, total_elements={total}")
+        print(f"[get_available_profiles] ⏱️ QUERY TIMING: total={total_duration:.2f}ms, fetch={fetch_duration:.2f}ms")
     
     return result
 
-def get_profile_by_id(db: Session, profile_id: int) -> Optional[Profile]:
-    return db.query(Profile).filter(Profile.id == profile_id).first()
+def get_profile_by_id(db: Session, profile_id: int) -> Optional[dict]:
+    """Профиль в формате ProfileResponse (через profile_cache) или None"""
+    return profile_cache.get_by_id(db, profile_id)
 
-def get_profile_by_user_id(db: Session, user_id: int) -> Optional[Profile]:
-    return db.query(Profile).filter(Profile.user_id == user_id).first()
+def get_profile_by_user_id(db: Session, user_id: int) -> Optional[dict]:
+    """Профиль пользователя в формате ProfileResponse (через profile_cache) или None"""
+    return profile_cache.get_by_user_id(db, user_id)
+
+def profile_exists(db: Session, user_id: int) -> bool:
+    """Есть ли профиль у пользователя - по БД (через profile_cache), когда его нет в profile_membership"""
+    exists = get_profile_by_user_id(db, user_id) is not None
+    if exists:
+        profile_membership.add(user_id)
+    return exists
+
+def get_profile_version_by_id(db: Session, profile_id: int) -> Optional[tuple]:
+    """Версия профиля (id, updated_at) для ETag или None"""
+    return profile_cache.get_version_by_id(db, profile_id)
+
+def get_profile_version_by_user_id(db: Session, user_id: int) -> Optional[tuple]:
+    """Версия профиля пользователя (id, updated_at) для ETag или None"""
+    return profile_cache.get_version_by_user_id(db, user_id)
+
+def incoming_likes_query(db: Session, user_id: int):
+    """
+    Профили, которые лайкнули пользователя user_id, а он им еще не ответил -
+    один запрос с анти-джойном по свайпам пользователя (NOT EXISTS).
+    Вторая колонка like_id - id лайка (порядок выдачи: новые лайки первыми).
+    """
+    own = aliased(Profile)
+    like = aliased(Swipe)
+    query = db.query(Profile, like.id.label("like_id")).join(
+        like, like.user_id == Profile.user_id
+    ).join(
+        own, own.id == like.target_profile_id
+    ).filter(
+        own.user_id == user_id,
+        like.action == "like",
+        ~_swiped_exists(user_id)
+    )
+    if swipe_archive.is_supported(db):
+        query = query.filter(~swipe_archive.archived_exists(user_id, Profile.id))
+    # Отклонения (пассы), которые еще ждут записи в swipe_buffer
+    pending_ids = swipe_buffer.pending_for(user_id)
+    if pending_ids:
+        query = query.filter(~Profile.id.in_(pending_ids))
+    return query, like
 
 def get_incoming_likes(
     db: Session,
     user_id: int,
     page: int = 0,
-    size: int = 20
+    size: int = 20,
+    cursor: Optional[str] = None,
+    include_total: bool = False
 ) -> dict:
-    """Получает профили пользователей, которые лайкнули текущего, но он ещё не ответил"""
-    
-    # Находим профиль текущего пользователя
-    current_profile = db.query(Profile).filter(Profile.user_id == user_id).first()
-    if not current_profile:
-        return {
-            "content": [],
-            "total_elements": 0,
-            "total_pages": 0,
-            "size": size,
-            "number": page
-        }
-    
-    # Получаем user_id тех, кто лайкнул текущего пользователя
-    # В Swipe: user_id - кто сделал свайп, target_profile_id - на кого свайпнули
-    likers_query = db.query(Swipe.user_id).filter(
-        Swipe.target_profile_id == current_profile.id,
-        Swipe.action == 'like'
-    ).distinct()
-    liker_user_ids = [row[0] for row in likers_query.all()]
-    
-    if not liker_user_ids:
-        return {
-            "content": [],
-            "total_elements": 0,
-            "total_pages": 0,
-            "size": size,
-            "number": page
-        }
+    """
+    Получает профили пользователей, которые лайкнули текущего, но он ещё не ответил.
+
+    Без cursor - offset-пагинация по page, total считается в том же запросе.
+    С cursor - keyset-пагинация по id лайка; total только при include_total.
+    """
+    after_id = decode_cursor(cursor)[0] if cursor else None
+    query, like = incoming_likes_query(db, user_id)
+    query = query.with_entities(*CARD_COLUMNS, like.id.label("like_id"))
     
-    # Получаем ID профилей, на которые текущий пользователь уже ответил
-    responded_swipes = db.query(Swipe.target_profile_id).filter(
-        Swipe.user_id == user_id
-    ).distinct().all()
-    responded_profile_ids = [row[0] for row in responded_swipes] if responded_swipes else []
+    total = None
+    if after_id is not None:
+        if include_total:
+            total = query.with_entities(func.count(Profile.id)).scalar()
+        query = query.filter(like.id < after_id).order_by(like.id.desc())
+    else:
+        query = query.add_columns(func.count().over().label("total")).order_by(like.id.desc()).offset(page * size)
+    rows = query.limit(size + 1).all()
     
-    # Получаем профили лайкеров, исключая тех, на кого уже ответили
-    query = db.query(Profile).filter(
-        Profile.user_id.in_(liker_user_ids)
-    )
+    if after_id is None:
+        if rows:
+            total = rows[0].total
+        elif page == 0:
+            total = 0
+        else:
+            # Страница за пределами выборки: оконная функция ничего не вернула
+            total = query.limit(None).offset(None).order_by(None).with_entities(func.count(Profile.id)).scalar()
     
-    if responded_profile_ids:
-        query = query.filter(~Profile.id.in_(responded_profile_ids))
+    has_more = len(rows) > size
+    rows = rows[:size]
+    next_cursor = encode_cursor(rows[-1].like_id) if has_more and rows else None
     
-    total = query.count()
-    profiles = query.offset(page * size).limit(size).all()
-    total_pages = math.ceil(total / size) if total > 0 else 0
+    if total is None:
+        total_pages = None
+    else:
+        total_pages = math.ceil(total / size) if total > 0 else 0
     
     return {
-        "content": profiles,
+        "content": [profile_card(row) for row in rows],
         "total_elements": total,
         "total_pages": total_pages,
         "size": size,
-        "number": page
+        "number": page,
+        "next_cursor": next_cursor
     }
-
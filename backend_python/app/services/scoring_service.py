@@ -0,0 +1,259 @@
+"""
+Векторизованная оценка совместимости профилей для порядка выдачи ленты.
+
+Признаки всех профилей держатся в памяти воркера в компактных NumPy массивах:
+интересы и цели - битовыми множествами (uint8, по биту на тег), город и
+университет - целочисленными кодами, возраст - int16. Оценка пользователя
+против тысяч кандидатов считается одним векторизованным проходом:
+
+    score = W_INTERESTS * jaccard(интересы) + W_GOALS * jaccard(цели)
+          + бонус за тот же университет + бонус за тот же город
+          - штраф за разницу в возрасте
+
+Очки целые, чтобы их можно было класть в курсор пагинации.
+
+Ранжированный список кандидатов пользователя запоминается между страницами
+ленты (remember_ranking/cached_ranking): следующие страницы берутся из него
+без повторной выборки и оценки, пока не пересобран снимок признаков.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+from app.models import Profile, ProfileTag
+
+FEED_SCORING_ENABLED = os.getenv("FEED_SCORING_ENABLED", "true").lower() == "true"
+# Как часто пересобираем признаки из БД (в фоне) и не чаще чего после изменения профиля
+SCORING_REFRESH_SECONDS = int(os.getenv("FEED_SCORING_REFRESH_SECONDS", "300"))
+SCORING_MIN_REBUILD_SECONDS = int(os.getenv("FEED_SCORING_MIN_REBUILD_SECONDS", "30"))
+# Сколько кандидатов максимум оцениваем за один запрос ленты
+SCORING_MAX_CANDIDATES = int(os.getenv("FEED_SCORING_MAX_CANDIDATES", "20000"))
+# Сколько живут ранжированные списки между страницами и сколько памяти они занимают
+SCORING_RANKING_TTL_SECONDS = int(os.getenv("FEED_SCORING_RANKING_TTL_SECONDS", "120"))
+SCORING_RANKING_MAX_BYTES = int(os.getenv("FEED_SCORING_RANKING_MAX_BYTES", str(32 * 1024 * 1024)))
+
+W_INTERESTS = 600
+W_GOALS = 300
+BONUS_SAME_UNIVERSITY = 150
+BONUS_SAME_CITY = 50
+PENALTY_PER_AGE_YEAR = 10
+MAX_AGE_PENALTY_YEARS = 10
+
+# popcount для каждого значения байта
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class _FeatureStore:
+    """Неизменяемый снимок признаков; при пересборке заменяется целиком"""
+    __slots__ = ("ids", "row_by_user_id", "interests", "goals", "city", "university", "age", "built_at")
+
+    def __init__(self, ids, user_ids, interests, goals, city, university, age):
+        # ids отсортированы (order_by(Profile.id)) - строки профилей ищет _rows
+        self.ids = ids
+        self.row_by_user_id: Dict[int, int] = {int(user_id): row for row, user_id in enumerate(user_ids)}
+        self.interests = interests
+        self.goals = goals
+        self.city = city
+        self.university = university
+        self.age = age
+        self.built_at = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.ids, self.interests, self.goals, self.city, self.university, self.age))
+
+class _Ranking:
+    __slots__ = ("ids", "scores", "store", "created_at")
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray, store: Optional[_FeatureStore]):
+        self.ids = ids
+        self.scores = scores
+        self.store = store
+        self.created_at = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + self.scores.nbytes
+
+_store: Optional[_FeatureStore] = None
+_stale = False
+_rebuilding = False
+_rankings: "OrderedDict[Hashable, _Ranking]" = OrderedDict()
+_rankings_bytes = 0
+_lock = threading.Lock()
+
+def _codes(values: List[str]) -> np.ndarray:
+    """Кодирует строки целыми числами (одинаковые строки - одинаковый код)"""
+    vocab: Dict[str, int] = {}
+    return np.fromiter((vocab.setdefault(v, len(vocab)) for v in values), dtype=np.int32, count=len(values))
+
+def _rows(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+    """Номера строк ids в отсортированном sorted_ids бинарным поиском; -1 - такого id нет"""
+    if not len(sorted_ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    rows = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+    return np.where(sorted_ids[rows] == ids, rows, -1)
+
+def _bitsets(n: int, rows: List[Tuple[int, str]]) -> np.ndarray:
+    """Строит матрицу битовых множеств n x ceil(len(vocab)/8) из пар (строка, тег)"""
+    vocab: Dict[str, int] = {}
+    bits = [(row, vocab.setdefault(tag, len(vocab))) for row, tag in rows]
+    packed = np.zeros((n, max(1, (len(vocab) + 7) // 8)), dtype=np.uint8)
+    if bits:
+        row_idx = np.fromiter((r for r, _ in bits), dtype=np.int64, count=len(bits))
+        bit_idx = np.fromiter((b for _, b in bits), dtype=np.int64, count=len(bits))
+        np.bitwise_or.at(packed, (row_idx, bit_idx >> 3), (1 << (bit_idx & 7)).astype(np.uint8))
+    return packed
+
+def _build(db: Session) -> _FeatureStore:
+    start = time.time()
+    profiles = db.query(
+        Profile.id, Profile.user_id, Profile.city, Profile.university, Profile.age
+    ).order_by(Profile.id).all()
+    ids = np.fromiter((p.id for p in profiles), dtype=np.int64, count=len(profiles))
+
+    tags = db.query(ProfileTag.profile_id, ProfileTag.kind, ProfileTag.tag).all()
+    tag_rows = _rows(ids, np.fromiter((t.profile_id for t in tags), dtype=np.int64, count=len(tags)))
+    interest_rows, goal_rows = [], []
+    for (_, kind, tag), row in zip(tags, tag_rows.tolist()):
+        if row < 0:
+            continue
+        (interest_rows if kind == "interest" else goal_rows).append((row, tag))
+
+    store = _FeatureStore(
+        ids=ids,
+        user_ids=[p.user_id for p in profiles],
+        interests=_bitsets(len(profiles), interest_rows),
+        goals=_bitsets(len(profiles), goal_rows),
+        city=_codes([(p.city or "").strip().lower() for p in profiles]),
+        university=_codes([(p.university or "").strip().lower() for p in profiles]),
+        age=np.fromiter((p.age or 0 for p in profiles), dtype=np.int16, count=len(profiles)),
+    )
+    print(f"[scoring_service] Features built: {len(profiles)} profiles, {store.nbytes} bytes, {(time.time() - start) * 1000:.2f}ms")
+    return store
+
+def _rebuild_in_background():
+    global _store, _stale, _rebuilding
+    db = SessionLocal()
+    try:
+        store = _build(db)
+        with _lock:
+            _store = store
+            _stale = False
+    except Exception as e:
+        print(f"[scoring_service] Background rebuild failed: {e}")
+    finally:
+        db.close()
+        with _lock:
+            _rebuilding = False
+
+def _get_store(db: Session) -> _FeatureStore:
+    """Текущий снимок признаков; первый строится синхронно, дальнейшие - в фоне"""
+    global _store, _rebuilding
+    with _lock:
+        store = _store
+        if store is not None:
+            age = time.monotonic() - store.built_at
+            needs_rebuild = age > SCORING_REFRESH_SECONDS or (_stale and age > SCORING_MIN_REBUILD_SECONDS)
+            if needs_rebuild and not _rebuilding:
+                _rebuilding = True
+                threading.Thread(target=_rebuild_in_background, name="scoring-rebuild", daemon=True).start()
+            return store
+
+    store = _build(db)
+    with _lock:
+        if _store is None:
+            _store = store
+        return _store
+
+def mark_stale():
+    """Профиль создан или изменен - признаки пересоберутся при следующем обращении"""
+    global _stale
+    with _lock:
+        _stale = True
+
+def is_enabled() -> bool:
+    return FEED_SCORING_ENABLED
+
+def _popcount_rows(bits: np.ndarray) -> np.ndarray:
+    return _POPCOUNT[bits].sum(axis=1, dtype=np.int32)
+
+def _jaccard(matrix: np.ndarray, own: np.ndarray) -> np.ndarray:
+    inter = _popcount_rows(matrix & own)
+    union = _popcount_rows(matrix | own)
+    return np.divide(inter, union, out=np.zeros(len(matrix), dtype=np.float32), where=union > 0)
+
+def score_candidates(db: Session, user_id: int, candidate_ids: List[int]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Оценивает кандидатов для пользователя user_id одним векторизованным проходом.
+
+    Возвращает (ids, scores) - массивы int64, отсортированные по убыванию очков,
+    при равных очках - по возрастанию id. Кандидаты, которых еще нет в снимке
+    признаков (только что созданные профили), получают 0 очков.
+    """
+    store = _get_store(db)
+    ids = np.asarray(candidate_ids, dtype=np.int64)
+    scores = np.zeros(len(ids), dtype=np.int64)
+
+    own_row = store.row_by_user_id.get(user_id)
+    if own_row is not None and len(ids):
+        rows = _rows(store.ids, ids)
+        known = rows >= 0
+        r = rows[known]
+
+        points = W_INTERESTS * _jaccard(store.interests[r], store.interests[own_row])
+        points += W_GOALS * _jaccard(store.goals[r], store.goals[own_row])
+        points += BONUS_SAME_UNIVERSITY * (store.university[r] == store.university[own_row])
+        points += BONUS_SAME_CITY * (store.city[r] == store.city[own_row])
+        age_gap = np.minimum(np.abs(store.age[r].astype(np.int32) - int(store.age[own_row])), MAX_AGE_PENALTY_YEARS)
+        points -= PENALTY_PER_AGE_YEAR * age_gap
+        scores[known] = np.rint(points).astype(np.int64)
+
+    order = np.lexsort((ids, -scores))
+    return ids[order], scores[order]
+
+def _pop_ranking_locked(key: Hashable):
+    global _rankings_bytes
+    ranking = _rankings.pop(key, None)
+    if ranking is not None:
+        _rankings_bytes -= ranking.nbytes
+
+def remember_ranking(key: Hashable, ids: np.ndarray, scores: np.ndarray):
+    """Запоминает ранжированный список (пользователь + фильтры ленты) для следующих страниц"""
+    global _rankings_bytes
+    ranking = _Ranking(ids, scores, _store)
+    with _lock:
+        _pop_ranking_locked(key)
+        _rankings[key] = ranking
+        _rankings_bytes += ranking.nbytes
+        while _rankings_bytes > SCORING_RANKING_MAX_BYTES and _rankings:
+            _, evicted = _rankings.popitem(last=False)
+            _rankings_bytes -= evicted.nbytes
+
+def cached_ranking(key: Hashable) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+    """(ids, scores), запомненные remember_ranking; None - если истек TTL или пересобраны признаки"""
+    with _lock:
+        ranking = _rankings.get(key)
+        if ranking is None:
+            return None
+        if ranking.store is not _store or time.monotonic() - ranking.created_at > SCORING_RANKING_TTL_SECONDS:
+            _pop_ranking_locked(key)
+            return None
+        _rankings.move_to_end(key)
+        return ranking.ids, ranking.scores
+
+def top_k(ids: np.ndarray, scores: np.ndarray, k: int,
+          after_id: Optional[int] = None, after_score: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Первые k кандидатов из отсортированного score_candidates списка,
+    строго после позиции курсора (after_score, after_id), если она задана.
+    """
+    if after_id is not None:
+        keep = (scores < after_score) | ((scores == after_score) & (ids > after_id))
+        ids, scores = ids[keep], scores[keep]
+    return ids[:k], scores[:k]
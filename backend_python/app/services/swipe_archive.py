@@ -0,0 +1,187 @@
+"""
+Архивация старых пассов (только PostgreSQL).
+
+Пассы старше SWIPE_ARCHIVE_AFTER_DAYS дней переносятся из swipes в swipe_archive:
+строка на пасс с первичным ключом (user_id, target_profile_id). Так swipes и ее
+индексы растут только на объем свежей истории, а исключения в ленте продолжают
+работать: available_profiles_query и входящие лайки учитывают архив анти-джойном
+(archived_exists), swipe_cache - через archived_ids_query. Запись свайпа
+(match_service, swipe_buffer) проверяет архив, чтобы не записать пасс повторно.
+
+Лайки не архивируются - по ним ищутся мэтчи и входящие лайки.
+
+Без миграции database/add_swipe_archive.sql архив выключен (is_supported проверяет
+таблицу при старте), и запросы строятся без анти-джойна по архиву.
+
+Задача запускается фоновым потоком раз в SWIPE_ARCHIVE_INTERVAL_SECONDS
+(при нескольких воркерах работает один - под advisory lock) или вручную:
+    python -m app.services.swipe_archive
+"""
+import os
+import threading
+import time
+
+from typing import List, Set, Tuple
+
+from sqlalchemy import BigInteger, Column, MetaData, Table, exists, select, text, tuple_
+from sqlalchemy.orm import Session
+
+from app.database import SessionLocal
+
+SWIPE_ARCHIVE_ENABLED = os.getenv("SWIPE_ARCHIVE_ENABLED", "false").lower() == "true"
+SWIPE_ARCHIVE_AFTER_DAYS = int(os.getenv("SWIPE_ARCHIVE_AFTER_DAYS", "30"))
+SWIPE_ARCHIVE_BATCH_SIZE = int(os.getenv("SWIPE_ARCHIVE_BATCH_SIZE", "10000"))
+SWIPE_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("SWIPE_ARCHIVE_INTERVAL_SECONDS", "3600"))
+# Ключ pg_try_advisory_xact_lock (берется в каждой пачке), чтобы архивацию не запускали несколько воркеров сразу
+_ADVISORY_LOCK_KEY = 7_140_014
+
+# Таблица без ORM модели: архив есть только в PostgreSQL (создается
+# database/add_swipe_archive.sql), а локальная разработка может идти на SQLite
+swipe_archive_table = Table(
+    "swipe_archive", MetaData(),
+    Column("user_id", BigInteger, primary_key=True),
+    Column("target_profile_id", BigInteger, primary_key=True),
+)
+
+# Одна пачка: удаляем старые пассы из swipes и вставляем их в архив.
+# Все в одном выражении - либо перенесено, либо нет
+_ARCHIVE_BATCH_SQL = text("""
+WITH moved AS (
+    DELETE FROM swipes
+    WHERE id IN (
+        SELECT id FROM swipes
+        WHERE action = 'pass' AND created_at < :cutoff
+        ORDER BY created_at
+        LIMIT :batch_size
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING user_id, target_profile_id
+),
+archived AS (
+    INSERT INTO swipe_archive (user_id, target_profile_id)
+    SELECT user_id, target_profile_id FROM moved
+    ON CONFLICT (user_id, target_profile_id) DO NOTHING
+    RETURNING user_id
+)
+SELECT (SELECT COUNT(*) FROM moved) AS moved, (SELECT COUNT(*) FROM archived) AS archived
+""")
+
+# Есть ли таблица swipe_archive (None - еще не проверяли)
+_table_exists = None
+_stopping = threading.Event()
+_worker = None
+
+def is_supported(db: Session) -> bool:
+    """
+    Архив есть: PostgreSQL и применена database/add_swipe_archive.sql. Таблица
+    проверяется один раз на процесс - без миграции лента и свайпы работают без архива.
+    """
+    global _table_exists
+    if db.get_bind().dialect.name != "postgresql":
+        return False
+    if _table_exists is None:
+        _table_exists = bool(db.execute(text("SELECT to_regclass('swipe_archive') IS NOT NULL")).scalar())
+        if not _table_exists:
+            print("[swipe_archive] Table swipe_archive not found, archive is off (apply database/add_swipe_archive.sql)")
+    return _table_exists
+
+def detect():
+    """Проверяет наличие таблицы архива при старте, чтобы первый запрос ленты не ждал проверку"""
+    db = SessionLocal()
+    try:
+        is_supported(db)
+    except Exception as e:
+        print(f"[swipe_archive] Table check failed, will retry on first request: {e}")
+    finally:
+        db.close()
+
+def archived_exists(user_id: int, profile_id_column):
+    """EXISTS: профиль profile_id_column есть в архиве пассов пользователя - для анти-джойна"""
+    return exists().where(
+        swipe_archive_table.c.user_id == user_id,
+        swipe_archive_table.c.target_profile_id == profile_id_column
+    )
+
+def archived_ids_query(user_id: int):
+    """SELECT target_profile_id архива пользователя - для объединения со swipes"""
+    return select(swipe_archive_table.c.target_profile_id).where(
+        swipe_archive_table.c.user_id == user_id
+    )
+
+def archived_pairs(db: Session, swipes: List[Tuple[int, int]]) -> Set[Tuple[int, int]]:
+    """Какие из пар (user_id, target_profile_id) уже есть в архиве - одним запросом по первичному ключу"""
+    if not swipes or not is_supported(db):
+        return set()
+    rows = db.execute(
+        select(swipe_archive_table.c.user_id, swipe_archive_table.c.target_profile_id).where(
+            tuple_(swipe_archive_table.c.user_id, swipe_archive_table.c.target_profile_id).in_(swipes)
+        )
+    ).all()
+    return {(user_id, target) for user_id, target in rows}
+
+def archive_old_passes(db: Session) -> int:
+    """Переносит все пассы старше SWIPE_ARCHIVE_AFTER_DAYS пачками, возвращает число перенесенных"""
+    if not is_supported(db):
+        return 0
+
+    start = time.time()
+    total = 0
+    try:
+        cutoff = db.execute(
+            text("SELECT CURRENT_TIMESTAMP - make_interval(days => :days)"),
+            {"days": SWIPE_ARCHIVE_AFTER_DAYS}
+        ).scalar()
+        while not _stopping.is_set():
+            # Блокировка уровня транзакции: снимается commit/rollback этой же пачки,
+            # даже если следующая пачка пойдет через другое соединение из пула
+            if not db.execute(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK_KEY}).scalar():
+                db.rollback()
+                if not total:
+                    print("[swipe_archive] Another worker is archiving, skipping")
+                break
+            row = db.execute(_ARCHIVE_BATCH_SQL, {
+                "cutoff": cutoff,
+                "batch_size": SWIPE_ARCHIVE_BATCH_SIZE
+            }).one()
+            db.commit()
+            total += row.moved
+            if row.moved < SWIPE_ARCHIVE_BATCH_SIZE:
+                break
+    except Exception:
+        db.rollback()
+        raise
+
+    if total:
+        print(f"[swipe_archive] Archived {total} passes in {(time.time() - start) * 1000:.2f}ms")
+    return total
+
+def _run():
+    while not _stopping.is_set():
+        db = SessionLocal()
+        try:
+            archive_old_passes(db)
+        except Exception as e:
+            print(f"[swipe_archive] Archival failed: {e}")
+        finally:
+            db.close()
+        _stopping.wait(SWIPE_ARCHIVE_INTERVAL_SECONDS)
+
+def start():
+    """Проверяет таблицу архива и запускает периодическую архивацию (если включена)"""
+    global _worker
+    detect()
+    if not SWIPE_ARCHIVE_ENABLED or (_worker is not None and _worker.is_alive()):
+        return
+    _stopping.clear()
+    _worker = threading.Thread(target=_run, name="swipe-archive", daemon=True)
+    _worker.start()
+
+def shutdown():
+    _stopping.set()
+
+if __name__ == "__main__":
+    session = SessionLocal()
+    try:
+        print(f"[swipe_archive] Done: {archive_old_passes(session)} passes archived")
+    finally:
+        session.close()
@@ -0,0 +1,168 @@
+"""
+Отложенная запись пассов (write-behind) с групповым commit.
+
+Пасс никогда не дает мэтч и сразу никем не читается, поэтому в этом режиме
+pass_profile только кладет свайп в очередь в памяти воркера. Фоновый поток
+сбрасывает очередь в БД одной многострочной вставкой раз в
+SWIPE_BUFFER_FLUSH_MS миллисекунд или как только набралось
+SWIPE_BUFFER_MAX_ROWS строк. При остановке приложения очередь сбрасывается.
+
+Пока пасс не записан, он учитывается в исключениях ленты и входящих лайков
+через pending_for() - см. profile_service.
+"""
+import atexit
+import os
+import threading
+import time
+from typing import Dict, List, Set, Tuple
+
+from sqlalchemy.dialects import postgresql, sqlite
+
+from app.database import SessionLocal
+from app.models import Profile, Swipe
+from app.services import profile_counters, swipe_archive
+
+SWIPE_WRITE_BEHIND = os.getenv("SWIPE_WRITE_BEHIND", "false").lower() == "true"
+SWIPE_BUFFER_FLUSH_MS = int(os.getenv("SWIPE_BUFFER_FLUSH_MS", "500"))
+SWIPE_BUFFER_MAX_ROWS = int(os.getenv("SWIPE_BUFFER_MAX_ROWS", "200"))
+# Сколько раз повторяем неудавшийся сброс, прежде чем отбросить пачку
+_MAX_FLUSH_ATTEMPTS = 5
+
+# user_id -> profile_id, ожидающие записи (для исключений в ленте)
+_pending: Dict[int, Set[int]] = {}
+# Очередь на запись в порядке поступления
+_queue: List[Tuple[int, int]] = []
+_stats = {"enqueued": 0, "flushed": 0, "flushes": 0, "errors": 0, "dropped": 0}
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_stopping = threading.Event()
+_flusher = None
+
+def is_enabled() -> bool:
+    return SWIPE_WRITE_BEHIND
+
+def _ensure_flusher():
+    """Запускает фоновый поток сброса (под _lock)"""
+    global _flusher
+    if _flusher is None or not _flusher.is_alive():
+        _flusher = threading.Thread(target=_run, name="swipe-buffer-flush", daemon=True)
+        _flusher.start()
+
+def enqueue_pass(user_id: int, target_profile_id: int):
+    """Ставит пасс в очередь на запись"""
+    with _lock:
+        pending = _pending.setdefault(user_id, set())
+        if target_profile_id in pending:
+            return
+        pending.add(target_profile_id)
+        _queue.append((user_id, target_profile_id))
+        _stats["enqueued"] += 1
+        full = len(_queue) >= SWIPE_BUFFER_MAX_ROWS
+        _ensure_flusher()
+    if full:
+        _wakeup.set()
+
+def pending_for(user_id: int) -> List[int]:
+    """ID профилей, пассы на которые пользователь сделал, но они еще не записаны в БД"""
+    with _lock:
+        pending = _pending.get(user_id)
+        return list(pending) if pending else []
+
+def is_pending(user_id: int, target_profile_id: int) -> bool:
+    with _lock:
+        pending = _pending.get(user_id)
+        return pending is not None and target_profile_id in pending
+
+def _insert(rows: List[Tuple[int, int]]):
+    """Одна многострочная вставка; повторы (в т.ч. с архивом) и свайпы на удаленные профили пропускаются"""
+    db = SessionLocal()
+    try:
+        target_ids = {target for _, target in rows}
+        existing = {
+            row[0] for row in db.query(Profile.id).filter(Profile.id.in_(target_ids)).all()
+        }
+        archived = swipe_archive.archived_pairs(db, rows)
+        values = [
+            {"user_id": user_id, "target_profile_id": target, "action": "pass"}
+            for user_id, target in rows if target in existing and (user_id, target) not in archived
+        ]
+        if values:
+            profile_counters.lock_pairs(db, [(value["user_id"], value["target_profile_id"]) for value in values])
+            dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+            stmt = dialect.insert(Swipe).values(values).on_conflict_do_nothing(
+                index_elements=["user_id", "target_profile_id"]
+            ).returning(Swipe.user_id, Swipe.target_profile_id)
+            inserted = db.execute(stmt).all()
+            # Счетчики - только по реально вставленным пассам, в той же транзакции
+            deltas = profile_counters.CounterDeltas()
+            profile_counters.collect_swipes(db, deltas, [(user_id, target, "pass") for user_id, target in inserted])
+            profile_counters.apply(db, deltas)
+            db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def flush():
+    """Сбрасывает текущую очередь в БД (вызывается фоновым потоком и при остановке)"""
+    with _lock:
+        rows = _queue[:]
+        del _queue[:]
+    if not rows:
+        return
+
+    start = time.time()
+    written = False
+    for attempt in range(1, _MAX_FLUSH_ATTEMPTS + 1):
+        try:
+            _insert(rows)
+            written = True
+            break
+        except Exception as e:
+            with _lock:
+                _stats["errors"] += 1
+            print(f"[swipe_buffer] Flush of {len(rows)} passes failed (attempt {attempt}): {e}")
+            if attempt < _MAX_FLUSH_ATTEMPTS:
+                time.sleep(min(0.1 * 2 ** attempt, 2.0))
+
+    # Снимаем отметку "ожидает записи" только после записи (или окончательной неудачи)
+    with _lock:
+        for user_id, target in rows:
+            pending = _pending.get(user_id)
+            if pending is not None:
+                pending.discard(target)
+                if not pending:
+                    del _pending[user_id]
+        if written:
+            _stats["flushed"] += len(rows)
+            _stats["flushes"] += 1
+        else:
+            _stats["dropped"] += len(rows)
+    if written:
+        print(f"[swipe_buffer] Flushed {len(rows)} passes in {(time.time() - start) * 1000:.2f}ms")
+
+def _run():
+    while not _stopping.is_set():
+        _wakeup.wait(SWIPE_BUFFER_FLUSH_MS / 1000)
+        _wakeup.clear()
+        flush()
+
+def shutdown():
+    """Останавливает фоновый поток и записывает все, что осталось в очереди"""
+    _stopping.set()
+    _wakeup.set()
+    if _flusher is not None:
+        _flusher.join(timeout=10)
+    flush()
+
+def get_stats() -> dict:
+    with _lock:
+        return {
+            "enabled": SWIPE_WRITE_BEHIND,
+            "queued": len(_queue),
+            "pending_users": len(_pending),
+            **_stats,
+        }
+
+atexit.register(shutdown)
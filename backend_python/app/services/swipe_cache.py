@@ -0,0 +1,193 @@
+"""
+Кэш свайпнутых профилей активных пользователей (в памяти воркера).
+
+Для каждого пользователя хранится множество target_profile_id его свайпов:
+отсортированный массив NumPy плюс небольшой буфер свежих свайпов, который
+периодически вливается в массив. Кэш ограничен по памяти (LRU по байтам)
+и по размеру одного множества; слишком большие истории не кэшируются -
+для них исключения остаются на стороне БД.
+
+Записи обновляются инкрементально из match_service после каждого свайпа.
+Свайпы, сделанные через другой воркер, видны после истечения TTL записи.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.models import Swipe
+from app.services import swipe_archive
+
+SWIPE_CACHE_ENABLED = os.getenv("SWIPE_CACHE_ENABLED", "true").lower() == "true"
+SWIPE_CACHE_MAX_BYTES = int(os.getenv("SWIPE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+SWIPE_CACHE_MAX_PER_USER = int(os.getenv("SWIPE_CACHE_MAX_PER_USER", "50000"))
+SWIPE_CACHE_TTL_SECONDS = int(os.getenv("SWIPE_CACHE_TTL_SECONDS", "120"))
+# Сколько свежих свайпов копим в буфере перед слиянием в отсортированный массив
+_DELTA_LIMIT = 64
+# Оценка накладных расходов на запись (объекты Python вокруг массива)
+_ENTRY_OVERHEAD_BYTES = 200
+
+class SwipedSet:
+    """Множество ID профилей: отсортированный int64 массив + буфер свежих добавлений"""
+    __slots__ = ("ids", "delta", "loaded_at")
+
+    def __init__(self, ids: np.ndarray):
+        self.ids = np.unique(ids.astype(np.int64))
+        self.delta: set = set()
+        self.loaded_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.delta)
+
+    @property
+    def nbytes(self) -> int:
+        return self.ids.nbytes + len(self.delta) * 8 + _ENTRY_OVERHEAD_BYTES
+
+    def add(self, profile_id: int):
+        if profile_id in self:
+            return
+        self.delta.add(profile_id)
+        if len(self.delta) >= _DELTA_LIMIT:
+            self.ids = np.union1d(self.ids, np.fromiter(self.delta, dtype=np.int64, count=len(self.delta)))
+            self.delta.clear()
+
+    def __contains__(self, profile_id: int) -> bool:
+        if profile_id in self.delta:
+            return True
+        pos = np.searchsorted(self.ids, profile_id)
+        return pos < len(self.ids) and self.ids[pos] == profile_id
+
+    def mask(self, profile_ids: np.ndarray) -> np.ndarray:
+        """Булев массив: True для ID, которые уже свайпнуты"""
+        swiped = np.isin(profile_ids, self.ids, assume_unique=False)
+        if self.delta:
+            swiped |= np.isin(profile_ids, np.fromiter(self.delta, dtype=np.int64, count=len(self.delta)))
+        return swiped
+
+_entries: "OrderedDict[int, SwipedSet]" = OrderedDict()
+_total_bytes = 0
+_stats = {"hits": 0, "misses": 0, "evictions": 0, "uncacheable": 0}
+_lock = threading.Lock()
+
+def _evict_locked():
+    global _total_bytes
+    while _total_bytes > SWIPE_CACHE_MAX_BYTES and _entries:
+        _, evicted = _entries.popitem(last=False)
+        _total_bytes -= evicted.nbytes
+        _stats["evictions"] += 1
+
+def _pop_locked(user_id: int):
+    global _total_bytes
+    entry = _entries.pop(user_id, None)
+    if entry is not None:
+        _total_bytes -= entry.nbytes
+
+def get(db: Session, user_id: int) -> Optional[SwipedSet]:
+    """
+    Множество свайпов пользователя; при промахе загружается одним запросом.
+    Возвращает None, если кэш выключен или история слишком большая.
+    """
+    global _total_bytes
+    if not SWIPE_CACHE_ENABLED:
+        return None
+
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is not None and time.monotonic() - entry.loaded_at <= SWIPE_CACHE_TTL_SECONDS:
+            _entries.move_to_end(user_id)
+            _stats["hits"] += 1
+            return entry
+        _pop_locked(user_id)
+        _stats["misses"] += 1
+
+    query = db.query(Swipe.target_profile_id).filter(Swipe.user_id == user_id)
+    if swipe_archive.is_supported(db):
+        # Вместе со старыми пассами из архива - тем же запросом
+        query = query.union_all(swipe_archive.archived_ids_query(user_id))
+    rows = query.limit(SWIPE_CACHE_MAX_PER_USER + 1).all()
+    if len(rows) > SWIPE_CACHE_MAX_PER_USER:
+        with _lock:
+            _stats["uncacheable"] += 1
+        return None
+    entry = SwipedSet(np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows)))
+
+    with _lock:
+        _pop_locked(user_id)
+        _entries[user_id] = entry
+        _total_bytes += entry.nbytes
+        _evict_locked()
+    return entry
+
+def has_swiped(db: Session, user_id: int, profile_id: int) -> bool:
+    """Свайпал ли пользователь профиль (без обращения к БД, если запись в кэше)"""
+    entry = get(db, user_id)
+    if entry is None:
+        if db.query(Swipe.id).filter(
+            Swipe.user_id == user_id,
+            Swipe.target_profile_id == profile_id
+        ).first() is not None:
+            return True
+        return swipe_archive.is_supported(db) and bool(
+            db.query(swipe_archive.archived_exists(user_id, profile_id)).scalar()
+        )
+    with _lock:
+        return profile_id in entry
+
+def known_swiped(user_id: int, profile_id: int) -> bool:
+    """True, если свайп уже есть в кэше; промах ничего не загружает и не означает отсутствия свайпа"""
+    with _lock:
+        entry = _entries.get(user_id)
+        return entry is not None and profile_id in entry
+
+def is_cached(user_id: int) -> bool:
+    """Есть ли в кэше запись пользователя (тогда known_swiped точен для этого воркера)"""
+    with _lock:
+        return user_id in _entries
+
+def record(user_id: int, profile_id: int):
+    """Инкрементально добавляет свайп в запись пользователя (если она в кэше)"""
+    global _total_bytes
+    with _lock:
+        entry = _entries.get(user_id)
+        if entry is None:
+            return
+        before = entry.nbytes
+        entry.add(profile_id)
+        if len(entry) > SWIPE_CACHE_MAX_PER_USER:
+            _pop_locked(user_id)
+            return
+        _total_bytes += entry.nbytes - before
+        _evict_locked()
+
+def not_swiped(entry: SwipedSet, profile_ids: np.ndarray) -> np.ndarray:
+    """Булев массив: True для ID, которых нет в множестве свайпов"""
+    with _lock:
+        return ~entry.mask(profile_ids)
+
+def exclude(entry: SwipedSet, profile_ids: np.ndarray) -> np.ndarray:
+    """Оставляет только ID, которых нет в множестве свайпов"""
+    return profile_ids[not_swiped(entry, profile_ids)]
+
+def invalidate(user_id: int):
+    with _lock:
+        _pop_locked(user_id)
+
+def get_stats() -> dict:
+    """Размер кэша для мониторинга: общий объем и объем на пользователя"""
+    with _lock:
+        users = len(_entries)
+        largest = max((e.nbytes for e in _entries.values()), default=0)
+        return {
+            "enabled": SWIPE_CACHE_ENABLED,
+            "users": users,
+            "bytes": _total_bytes,
+            "max_bytes": SWIPE_CACHE_MAX_BYTES,
+            "avg_bytes_per_user": round(_total_bytes / users) if users else 0,
+            "max_bytes_per_user": largest,
+            "max_ids_per_user": SWIPE_CACHE_MAX_PER_USER,
+            **_stats,
+        }
@@ -0,0 +1,93 @@
+"""
+Общие фикстуры тестов.
+
+Тесты никогда не ходят в DATABASE_URL из окружения: база берется из
+TEST_DATABASE_URL (по умолчанию - временный файл SQLite), и все таблицы в ней
+пересоздаются. Тесты, которым нужен PostgreSQL, пропускаются на SQLite.
+"""
+import json
+import os
+from collections import OrderedDict
+import sys
+import tempfile
+
+import pytest
+from sqlalchemy import BigInteger, text
+from sqlalchemy.ext.compiler import compiles
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ["DATABASE_URL"] = os.getenv(
+    "TEST_DATABASE_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(), "test.db")
+)
+
+@compiles(BigInteger, "sqlite")
+def _sqlite_bigint(type_, compiler, **kw):
+    # В SQLite автоинкремент есть только у INTEGER PRIMARY KEY
+    return "INTEGER"
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app.models import Profile  # noqa: E402
+from app.services import (  # noqa: E402
+    deck_service, profile_cache, scoring_service, swipe_archive, swipe_buffer, swipe_cache
+)
+
+def _drop_tables():
+    if engine.dialect.name == "postgresql":
+        # CASCADE: в базе могут быть объекты из database/*.sql, зависящие от таблиц
+        names = [table.name for table in Base.metadata.sorted_tables] + [swipe_archive.swipe_archive_table.name]
+        with engine.begin() as conn:
+            conn.execute(text("DROP TABLE IF EXISTS " + ", ".join(names) + " CASCADE"))
+    else:
+        Base.metadata.drop_all(engine)
+
+def _reset_worker_state(monkeypatch):
+    """Кэши воркера в памяти, иначе в тест попадут профили и свайпы предыдущего"""
+    monkeypatch.setattr(scoring_service, "_store", None)
+    monkeypatch.setattr(scoring_service, "_rankings", OrderedDict())
+    monkeypatch.setattr(scoring_service, "_rankings_bytes", 0)
+    monkeypatch.setattr(swipe_cache, "_entries", OrderedDict())
+    monkeypatch.setattr(swipe_cache, "_total_bytes", 0)
+    monkeypatch.setattr(deck_service, "_decks", OrderedDict())
+    monkeypatch.setattr(swipe_buffer, "_pending", {})
+    monkeypatch.setattr(swipe_buffer, "_queue", [])
+    monkeypatch.setattr(swipe_archive, "_table_exists", None)
+    monkeypatch.setattr(profile_cache, "_written", OrderedDict())
+    profile_cache.clear()
+
+@pytest.fixture
+def db_tables(monkeypatch):
+    """Пустые таблицы и пустые кэши воркера на время теста"""
+    _reset_worker_state(monkeypatch)
+    _drop_tables()
+    Base.metadata.create_all(engine)
+    if engine.dialect.name == "postgresql":
+        swipe_archive.swipe_archive_table.create(engine)
+    yield engine
+    _drop_tables()
+
+@pytest.fixture
+def postgres(db_tables):
+    if db_tables.dialect.name != "postgresql":
+        pytest.skip("нужен PostgreSQL (TEST_DATABASE_URL)")
+    return db_tables
+
+@pytest.fixture
+def make_profiles(db_tables):
+    """Создает count профилей с user_id 1001, 1002, ... и возвращает их id"""
+    def make(count: int) -> list:
+        db = SessionLocal()
+        try:
+            profiles = [
+                Profile(
+                    user_id=1000 + i, name=f"User{i}", gender="male", age=20,
+                    city="Москва", university="МГУ",
+                    interests=json.dumps(["IT"]), goals=json.dumps(["Хакатон"])
+                )
+                for i in range(1, count + 1)
+            ]
+            db.add_all(profiles)
+            db.commit()
+            return [profile.id for profile in profiles]
+        finally:
+            db.close()
+    return make
@@ -0,0 +1,25 @@
+"""Проверка initData Telegram"""
+import hashlib
+import hmac
+import json
+import time
+from urllib.parse import urlencode
+
+import pytest
+
+from app import auth
+
+def _init_data(**overrides) -> str:
+    data = {"auth_date": str(int(time.time())), "user": json.dumps({"id": 1001})}
+    check_string = "\n".join(f"{k}={v}" for k, v in sorted(data.items()))
+    data["hash"] = hmac.new(auth._WEBAPP_SECRET_KEY, check_string.encode(), hashlib.sha256).hexdigest()
+    data.update(overrides)
+    return urlencode(data)
+
+def test_valid_init_data():
+    assert auth.extract_user_id(_init_data())[0] == "1001"
+
+@pytest.mark.parametrize("received_hash", ["0" * 64, "хэш", ""], ids=["wrong", "non-ascii", "empty"])
+def test_bad_hash_is_auth_error(received_hash):
+    with pytest.raises(auth.TelegramAuthError):
+        auth.validate_init_data(_init_data(hash=received_hash))
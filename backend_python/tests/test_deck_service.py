@@ -0,0 +1,46 @@
+"""Колода кандидатов: порядок карточек как у SQL-пути ленты и total_elements первой страницы"""
+import pytest
+
+from app.database import SessionLocal
+from app.services import deck_service, scoring_service
+
+def test_refill_merges_candidates_in_feed_order():
+    deck = deck_service._Deck()
+    deck_service._merge(deck, [(5, 10), (2, 7), (9, 7)], 3)
+    # Пополнение приносит кандидата лучше лежащих в колоде и новые очки старой карточки
+    deck.refilling = True
+    deck_service._merge(deck, [(7, 12), (3, 7), (9, 8)], 3)
+    assert list(deck.cards.items()) == [(7, 12), (5, 10), (9, 8), (2, 7), (3, 7)]
+
+def test_refill_without_scores_keeps_id_order():
+    deck = deck_service._Deck()
+    deck_service._merge(deck, [(4, None), (8, None)], 2)
+    deck_service._merge(deck, [(1, None), (6, None)], 2)
+    assert list(deck.cards) == [1, 4, 6, 8]
+
+def test_refill_skips_cards_swiped_during_refill():
+    deck = deck_service._Deck()
+    deck.refilling = True
+    deck.dropped.add(3)
+    deck_service._merge(deck, [(3, 5), (4, 1)], 2)
+    assert list(deck.cards) == [4]
+    assert deck.total == 1
+
+@pytest.mark.parametrize("scoring", [True, False], ids=["ranked", "by-id"])
+def test_feed_page_reports_candidate_total(make_profiles, monkeypatch, scoring):
+    profile_ids = make_profiles(8)
+    monkeypatch.setattr(scoring_service, "FEED_SCORING_ENABLED", scoring)
+    # Кандидатов больше, чем помещается в колоду
+    monkeypatch.setattr(deck_service, "DECK_SIZE", 4)
+    # Без фонового пополнения: свайпы здесь не пишутся в БД
+    monkeypatch.setattr(deck_service, "DECK_LOW_WATERMARK", 0)
+    db = SessionLocal()
+    try:
+        page = deck_service.get_feed_page(db, 1001, size=3)
+        assert (page["total_elements"], page["total_pages"]) == (7, 3)
+        deck_service.drop_card(1001, page["content"][0]["id"])
+        deck_service.drop_card(1001, profile_ids[0])
+        page = deck_service.get_feed_page(db, 1001, size=3)
+        assert (page["total_elements"], page["total_pages"]) == (6, 2)
+    finally:
+        db.close()
@@ -0,0 +1,63 @@
+"""Число SQL-запросов на страницу ленты - регрессия N+1 и лишних подсчетов"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from app.database import SessionLocal, engine
+from app.models import Profile
+from app.services import profile_service, scoring_service, swipe_archive
+
+@contextmanager
+def _statements():
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "after_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "after_cursor_execute", record)
+
+@pytest.fixture
+def feed_db(make_profiles):
+    make_profiles(10)
+    db = SessionLocal()
+    for profile in db.query(Profile).all():
+        profile_service.sync_profile_tags(db, profile)
+    db.commit()
+    # Разовая проверка таблицы архива (при старте ее делает swipe_archive.detect) - не в счет
+    swipe_archive.is_supported(db)
+    yield db
+    db.close()
+
+@pytest.mark.parametrize("kwargs, expected", [
+    ({}, 1),
+    ({"interests": "IT"}, 1),
+    ({"city": "Москва", "university": "МГУ"}, 1),
+    # Страница за концом выдачи - второй запрос считает total
+    ({"page": 10}, 2),
+], ids=["offset", "interests", "filters", "past-end"])
+def test_sql_ordered_page_is_one_statement(feed_db, monkeypatch, kwargs, expected):
+    monkeypatch.setattr(scoring_service, "FEED_SCORING_ENABLED", False)
+    with _statements() as statements:
+        page = profile_service.get_available_profiles(feed_db, 1001, size=4, **kwargs)
+    assert len(statements) == expected
+    assert page["total_elements"] == 9
+
+def test_cursor_page_is_one_statement(feed_db, monkeypatch):
+    monkeypatch.setattr(scoring_service, "FEED_SCORING_ENABLED", False)
+    first = profile_service.get_available_profiles(feed_db, 1001, size=4)
+    with _statements() as statements:
+        profile_service.get_available_profiles(feed_db, 1001, size=4, cursor=first["next_cursor"])
+    assert len(statements) == 1
+
+def test_ranked_next_page_only_loads_cards(feed_db, monkeypatch):
+    monkeypatch.setattr(scoring_service, "FEED_SCORING_ENABLED", True)
+    first = profile_service.get_available_profiles(feed_db, 1001, size=4)
+    with _statements() as statements:
+        second = profile_service.get_available_profiles(feed_db, 1001, size=4, cursor=first["next_cursor"])
+    assert len(statements) == 1
+    assert len(second["content"]) == 4
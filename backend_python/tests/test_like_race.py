@@ -0,0 +1,143 @@
+"""Гонки записи свайпов: встречные лайки дают ровно один мэтч, счетчики не расходятся и не взаимоблокируются"""
+import threading
+
+import pytest
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.models import Match
+from app.services import match_service, profile_counters
+
+PAIRS = 20
+
+def _like(db, user_id: int, target_profile_id: int) -> bool:
+    matched, _ = match_service.like_profile(db, user_id, target_profile_id)
+    return matched
+
+def _batch_like(db, user_id: int, target_profile_id: int) -> bool:
+    [result] = match_service.swipe_batch(db, user_id, [(target_profile_id, "like")])
+    assert result["status"] == "ok"
+    return result["matched"]
+
+@pytest.mark.parametrize("first_like, second_like", [
+    (_like, _like),
+    (_batch_like, _batch_like),
+    (_like, _batch_like),
+], ids=["like-like", "batch-batch", "like-batch"])
+def test_concurrent_reciprocal_likes_match(postgres, make_profiles, first_like, second_like):
+    profile_ids = make_profiles(PAIRS * 2)
+    barrier = threading.Barrier(PAIRS * 2)
+    results = []
+    errors = []
+
+    def run(like, user_id: int, target_profile_id: int):
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            results.append(like(db, user_id, target_profile_id))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = []
+    for pair in range(PAIRS):
+        first, second = pair * 2, pair * 2 + 1
+        threads.append(threading.Thread(target=run, args=(first_like, 1001 + first, profile_ids[second])))
+        threads.append(threading.Thread(target=run, args=(second_like, 1001 + second, profile_ids[first])))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    # В каждой паре мэтч видит тот лайк, что записан вторым
+    assert sum(results) == PAIRS
+    db = SessionLocal()
+    try:
+        assert db.query(Match).count() == PAIRS
+    finally:
+        db.close()
+
+def test_concurrent_like_and_pass_keep_pending_incoming(postgres, make_profiles):
+    """Пасс в ответ на встречный лайк, записанный одновременно, не оставляет входящий лайк в бейдже"""
+    profile_ids = make_profiles(PAIRS * 2)
+    barrier = threading.Barrier(PAIRS * 2)
+    errors = []
+
+    def run(swipe, user_id: int, target_profile_id: int):
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            swipe(db, user_id, target_profile_id)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    threads = []
+    for pair in range(PAIRS):
+        first, second = pair * 2, pair * 2 + 1
+        threads.append(threading.Thread(target=run, args=(match_service.like_profile, 1001 + first, profile_ids[second])))
+        threads.append(threading.Thread(target=run, args=(match_service.pass_profile, 1001 + second, profile_ids[first])))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    db = SessionLocal()
+    try:
+        assert [profile_counters.pending_incoming(db, 1001 + user) for user in range(PAIRS * 2)] == [0] * (PAIRS * 2)
+    finally:
+        db.close()
+
+def test_concurrent_batches_over_shared_profiles_do_not_deadlock(postgres, make_profiles):
+    """Пакеты разных пользователей на общие профили в разном порядке пишут счетчики без deadlock"""
+    # Не больше соединений пула
+    swipers = 4
+    profile_ids = make_profiles(swipers + 20)
+    targets = profile_ids[swipers:]
+    # Замедляем запись каждой строки счетчиков, чтобы UPSERT'ы пакетов шли одновременно
+    with postgres.begin() as conn:
+        conn.execute(text(
+            "CREATE FUNCTION test_slow_counter() RETURNS trigger AS "
+            "$$ BEGIN PERFORM pg_sleep(0.02); RETURN NEW; END $$ LANGUAGE plpgsql"
+        ))
+        conn.execute(text(
+            "CREATE TRIGGER test_slow_counter BEFORE INSERT OR UPDATE ON profile_counters "
+            "FOR EACH ROW EXECUTE FUNCTION test_slow_counter()"
+        ))
+    barrier = threading.Barrier(swipers)
+    errors = []
+
+    def run(user: int):
+        # Пары (автор, цель) у пакетов разные - блокировки пар их не упорядочивают;
+        # общие только строки счетчиков целей, и каждый пакет идет по ним в своем порядке
+        shift = user * len(targets) // swipers
+        order = targets[shift:] + targets[:shift]
+        db = SessionLocal()
+        try:
+            barrier.wait()
+            match_service.swipe_batch(db, 1001 + user, [(target, "like") for target in order])
+        except Exception as e:
+            errors.append(e)
+        finally:
+            db.close()
+
+    try:
+        threads = [threading.Thread(target=run, args=(user,)) for user in range(swipers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        with postgres.begin() as conn:
+            conn.execute(text("DROP FUNCTION test_slow_counter() CASCADE"))
+
+    assert not errors
+    db = SessionLocal()
+    try:
+        assert [profile_counters.get(db, target)["likes_received"] for target in targets] == [swipers] * len(targets)
+    finally:
+        db.close()
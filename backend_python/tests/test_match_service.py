@@ -0,0 +1,43 @@
+"""Пасс и пакет свайпов: несуществующий профиль, повторы, пасс в очереди write-behind"""
+import pytest
+
+from app.database import SessionLocal
+from app.models import Match, Swipe
+from app.services import match_service, swipe_buffer, swipe_cache
+
+def test_pass_on_missing_profile_is_rejected(make_profiles):
+    [own_id] = make_profiles(1)
+    db = SessionLocal()
+    try:
+        with pytest.raises(ValueError):
+            match_service.pass_profile(db, 1001, own_id + 99999)
+        assert not swipe_cache.known_swiped(1001, own_id + 99999)
+        assert db.query(Swipe).count() == 0
+    finally:
+        db.close()
+
+def test_repeated_pass_is_recorded_once(make_profiles):
+    _, target_id = make_profiles(2)
+    db = SessionLocal()
+    try:
+        match_service.pass_profile(db, 1001, target_id)
+        match_service.pass_profile(db, 1001, target_id)
+        assert db.query(Swipe).filter(Swipe.user_id == 1001, Swipe.target_profile_id == target_id).count() == 1
+    finally:
+        db.close()
+
+def test_batch_like_after_queued_pass_is_duplicate(make_profiles, monkeypatch):
+    own_id, target_id = make_profiles(2)
+    monkeypatch.setattr(swipe_buffer, "SWIPE_WRITE_BEHIND", True)
+    # Очередь не сбрасывается в БД во время теста
+    monkeypatch.setattr(swipe_buffer, "_ensure_flusher", lambda: None)
+    db = SessionLocal()
+    try:
+        match_service.like_profile(db, 1002, own_id)
+        match_service.pass_profile(db, 1001, target_id)
+        [result] = match_service.swipe_batch(db, 1001, [(target_id, "like")])
+        assert result["status"] == "duplicate" and not result["matched"]
+        assert db.query(Swipe).filter(Swipe.user_id == 1001).count() == 0
+        assert db.query(Match).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,40 @@
+"""EdgeMiddleware: preflight CORS и слэш в конце пути"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.middleware import EdgeMiddleware
+
+ORIGIN = "https://app.example.com"
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+
+    @app.get("/items")
+    def items():
+        return {"ok": True}
+
+    app.add_middleware(EdgeMiddleware, allow_origins=[ORIGIN])
+    return TestClient(app)
+
+def _preflight(client, origin: str, **headers):
+    return client.options("/items", headers={
+        "Origin": origin, "Access-Control-Request-Method": "GET", **headers
+    })
+
+def test_private_network_preflight_from_allowed_origin(client):
+    response = _preflight(client, ORIGIN, **{"Access-Control-Request-Private-Network": "true"})
+    assert response.status_code == 200
+    assert response.headers["access-control-allow-private-network"] == "true"
+    assert response.headers["access-control-allow-origin"] == ORIGIN
+
+def test_private_network_preflight_from_other_origin(client):
+    response = _preflight(client, "https://evil.example.com", **{"Access-Control-Request-Private-Network": "true"})
+    assert response.status_code == 400
+    assert "access-control-allow-private-network" not in response.headers
+
+def test_trailing_slash_reaches_route(client):
+    response = client.get("/items/", headers={"Origin": ORIGIN})
+    assert response.json() == {"ok": True}
+    assert response.headers["access-control-allow-origin"] == ORIGIN
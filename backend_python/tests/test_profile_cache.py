@@ -0,0 +1,36 @@
+"""Кэш профилей: чтение из реплики сразу после записи не кладется в кэш"""
+from app.database import SessionLocal
+from app.models import Profile
+from app.services import profile_cache
+
+def _rename(profile_id: int, name: str):
+    db = SessionLocal()
+    try:
+        db.query(Profile).filter(Profile.id == profile_id).update({"name": name})
+        db.commit()
+    finally:
+        db.close()
+
+def test_replica_read_after_write_is_not_cached(make_profiles, monkeypatch):
+    [profile_id] = make_profiles(1)
+    monkeypatch.setattr(profile_cache, "is_replica", lambda db: True)
+    db = SessionLocal()
+    try:
+        # Реплика еще отдает профиль до записи
+        profile_cache.invalidate(profile_id, 1001)
+        assert profile_cache.get_by_id(db, profile_id)["name"] == "User1"
+        _rename(profile_id, "Renamed")
+        assert profile_cache.get_by_id(db, profile_id)["name"] == "Renamed"
+    finally:
+        db.close()
+
+def test_replica_read_without_recent_write_is_cached(make_profiles, monkeypatch):
+    [profile_id] = make_profiles(1)
+    monkeypatch.setattr(profile_cache, "is_replica", lambda db: True)
+    db = SessionLocal()
+    try:
+        assert profile_cache.get_by_id(db, profile_id)["name"] == "User1"
+        _rename(profile_id, "Renamed")
+        assert profile_cache.get_by_id(db, profile_id)["name"] == "User1"
+    finally:
+        db.close()
@@ -0,0 +1,45 @@
+"""Лента в порядке scoring_service: выбор кандидатов и запомненный список между страницами"""
+from app.database import SessionLocal
+from app.services import profile_service, scoring_service
+
+def _feed(**kwargs) -> dict:
+    db = SessionLocal()
+    try:
+        return profile_service.get_available_profiles(db, 1001, **kwargs)
+    finally:
+        db.close()
+
+def test_candidate_cap_keeps_newest_profiles(make_profiles, monkeypatch):
+    profile_ids = make_profiles(10)
+    monkeypatch.setattr(scoring_service, "SCORING_MAX_CANDIDATES", 3)
+    page = _feed(size=10)
+    assert sorted(card["id"] for card in page["content"]) == sorted(profile_ids[-3:])
+
+def test_next_pages_reuse_ranking(make_profiles, monkeypatch):
+    make_profiles(10)
+    calls = []
+    ranked_candidates = profile_service.ranked_candidates
+    monkeypatch.setattr(profile_service, "ranked_candidates", lambda *args: calls.append(args) or ranked_candidates(*args))
+
+    first = _feed(size=4)
+    second = _feed(size=4, cursor=first["next_cursor"])
+    third = _feed(size=4, cursor=second["next_cursor"])
+
+    assert len(calls) == 1
+    served = [card["id"] for page in (first, second, third) for card in page["content"]]
+    assert len(served) == 9 and len(set(served)) == 9
+    assert third["next_cursor"] is None
+
+def test_candidates_missing_from_features_score_zero(make_profiles):
+    profile_ids = make_profiles(3)
+    # Неизвестные снимку признаков id: меньше первого и больше последнего
+    missing = [0, profile_ids[2] + 1, profile_ids[2] + 100]
+    db = SessionLocal()
+    try:
+        ids, scores = scoring_service.score_candidates(db, 1001, [missing[2], profile_ids[1], missing[0], missing[1]])
+    finally:
+        db.close()
+    scored = dict(zip(ids.tolist(), scores.tolist()))
+    assert scored[profile_ids[1]] > 0
+    assert [scored[profile_id] for profile_id in missing] == [0, 0, 0]
+    assert ids.tolist() == [profile_ids[1]] + missing
@@ -0,0 +1,36 @@
+"""Read-your-writes: после записи чтения пользователя и его профиля идут в основную БД"""
+import pytest
+from starlette.requests import Request
+
+from app import auth, database
+
+def _request(path_params=None, query="", authorization=None) -> Request:
+    headers = [(b"authorization", authorization.encode())] if authorization else []
+    return Request({
+        "type": "http", "method": "GET", "path": "/", "headers": headers,
+        "query_string": query.encode(), "path_params": path_params or {}
+    })
+
+@pytest.fixture
+def pins(monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_READ_URL", "postgresql://replica")
+    monkeypatch.setattr(database, "_pinned", {})
+    monkeypatch.setattr(database, "_pinned_profiles", {})
+
+def test_user_from_bearer_token(pins):
+    database.pin_to_primary(1001)
+    token = auth.generate_jwt_token("1001")
+    assert database._request_pinned(_request(authorization=f"Bearer {token}"))
+    assert not database._request_pinned(_request(authorization=f"Bearer {auth.generate_jwt_token('1002')}"))
+    assert not database._request_pinned(_request(authorization="Bearer broken"))
+
+def test_user_from_path_and_query(pins):
+    database.pin_to_primary(1001)
+    assert database._request_pinned(_request({"user_id": "1001"}))
+    assert database._request_pinned(_request(query="user_id=1001"))
+    assert not database._request_pinned(_request(query="user_id=1002"))
+
+def test_changed_profile_read_by_id(pins):
+    database.pin_to_primary(1001, 7)
+    assert database._request_pinned(_request({"profile_id": "7"}))
+    assert not database._request_pinned(_request({"profile_id": "8"}))
@@ -0,0 +1,65 @@
+"""statement_timeout ставится на соединение один раз, а не в каждой транзакции (PostgreSQL)"""
+from contextlib import contextmanager
+
+from sqlalchemy import event, text
+
+from app import database
+from app.database import SessionLocal, engine
+
+@contextmanager
+def _timeout_statements():
+    """SET/RESET statement_timeout, выполненные за время блока"""
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        if "statement_timeout" in statement and not statement.startswith("SHOW"):
+            statements.append(statement)
+
+    event.listen(engine, "after_cursor_execute", record)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "after_cursor_execute", record)
+
+def _show(db) -> str:
+    return db.execute(text("SHOW statement_timeout")).scalar()
+
+def test_timeout_is_set_once_per_connection(postgres, monkeypatch):
+    monkeypatch.setattr(database, "DB_VERIFY_IDLE_SECONDS", 60)
+    # Одно соединение в пуле - все сессии теста получают его
+    engine.dispose()
+    with _timeout_statements() as statements:
+        db = database._open_session(SessionLocal, 1234)
+        try:
+            assert _show(db) == "1234ms"
+            # Откат транзакции не сбрасывает бюджет, а следующие транзакции обходятся без SET
+            db.rollback()
+            assert _show(db) == "1234ms"
+            db.commit()
+            assert _show(db) == "1234ms"
+        finally:
+            db.close()
+        assert statements == ["SET statement_timeout = 1234"]
+
+        db = database._open_session(SessionLocal, 1234)
+        db.close()
+        db = database._open_session(SessionLocal, 2000)
+        try:
+            assert _show(db) == "2s"
+        finally:
+            db.close()
+        # Сессия без бюджета (фоновые задачи) - значение сервера по умолчанию
+        db = SessionLocal()
+        try:
+            assert _show(db) == "0"
+        finally:
+            db.close()
+    assert statements == ["SET statement_timeout = 1234", "SET statement_timeout = 2000", "RESET statement_timeout"]
+
+def test_idle_connection_is_checked_on_open(postgres, monkeypatch):
+    monkeypatch.setattr(database, "DB_VERIFY_IDLE_SECONDS", 0)
+    engine.dispose()
+    with _timeout_statements() as statements:
+        for _ in range(2):
+            database._open_session(SessionLocal, 1234).close()
+    assert statements == ["SET statement_timeout = 1234"] * 2
@@ -0,0 +1,23 @@
+"""Без миграции add_swipe_archive.sql лента и свайпы на PostgreSQL работают без архива"""
+from sqlalchemy import text
+
+from app.database import SessionLocal
+from app.services import match_service, profile_service, swipe_archive
+
+def test_swipes_and_feed_without_archive_table(postgres, make_profiles):
+    with postgres.begin() as conn:
+        conn.execute(text("DROP TABLE swipe_archive"))
+    first_id, second_id, third_id = make_profiles(3)
+    db = SessionLocal()
+    try:
+        assert not swipe_archive.is_supported(db)
+        match_service.like_profile(db, 1002, first_id)
+        assert match_service.like_profile(db, 1001, second_id)[0]
+        match_service.pass_profile(db, 1002, third_id)
+        [result] = match_service.swipe_batch(db, 1003, [(first_id, "like")])
+        assert result["status"] == "ok"
+        feed = profile_service.get_available_profiles(db, 1003, size=10)["content"]
+        assert [profile["id"] for profile in feed] == [second_id]
+        assert [like["user_id"] for like in profile_service.get_incoming_likes(db, 1001)["content"]] == [1003]
+    finally:
+        db.close()
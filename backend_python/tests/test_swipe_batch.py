@@ -0,0 +1,63 @@
+"""Пакет свайпов: статусы элементов в поэлементном пути и через POST /api/swipes/batch"""
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.database import SessionLocal
+from app.models import Match, Swipe
+from app.routers import matches
+from app.services import match_service
+
+@pytest.fixture
+def batch(make_profiles):
+    """
+    Профили 1001-1004; 1002 уже лайкнул 1001. Пакет 1001: взаимный лайк, пасс,
+    повтор в пакете, несуществующий профиль и обычный лайк - и ожидаемые статусы
+    """
+    own_id, liker_id, passed_id, liked_id = make_profiles(4)
+    db = SessionLocal()
+    try:
+        match_service.like_profile(db, 1002, own_id)
+    finally:
+        db.close()
+    swipes = [
+        (liker_id, "like"), (passed_id, "pass"), (passed_id, "like"),
+        (liked_id + 999, "like"), (liked_id, "like")
+    ]
+    expected = [
+        (liker_id, "like", "ok", True), (passed_id, "pass", "ok", False), (passed_id, "like", "duplicate", False),
+        (liked_id + 999, "like", "not_found", False), (liked_id, "like", "ok", False)
+    ]
+    return swipes, expected
+
+def _check_written(results, expected):
+    assert [(r["profile_id"], r["action"], r["status"], r["matched"]) for r in results] == expected
+    db = SessionLocal()
+    try:
+        [match] = db.query(Match).all()
+        assert results[0]["match_id"] == match.id
+        assert all(r["match_id"] is None for r in results[1:])
+        assert db.query(Swipe).filter(Swipe.user_id == 1001).count() == 3
+    finally:
+        db.close()
+
+def test_orm_batch_statuses(batch):
+    swipes, expected = batch
+    db = SessionLocal()
+    try:
+        results = match_service._swipe_batch_orm(db, 1001, swipes)
+    finally:
+        db.close()
+    _check_written(results, expected)
+
+def test_batch_endpoint(batch):
+    swipes, expected = batch
+    app = FastAPI()
+    app.include_router(matches.router)
+    with TestClient(app) as client:
+        response = client.post("/api/swipes/batch", json={
+            "user_id": 1001,
+            "swipes": [{"profile_id": profile_id, "action": action} for profile_id, action in swipes]
+        })
+    assert response.status_code == 200
+    _check_written(response.json()["results"], expected)
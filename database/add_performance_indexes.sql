@@ -1,12 +1,14 @@
 -- Скрипт для добавления составных индексов для оптимизации производительности
 -- Выполнить на существующей БД для ускорения запросов
 
--- Составные индексы для таблицы swipes
-CREATE INDEX IF NOT EXISTS idx_swipes_user_target ON swipes(user_id, target_profile_id);
+-- Составной индекс для таблицы swipes ((user_id, target_profile_id) покрывает UNIQUE)
 CREATE INDEX IF NOT EXISTS idx_swipes_target_action ON swipes(target_profile_id, action) WHERE action = 'like';
 
 -- Составной индекс для таблицы matches
 CREATE INDEX IF NOT EXISTS idx_matches_user1_user2 ON matches(user1_id, user2_id);
+-- Keyset-пагинация списка мэтчей пользователя (ORDER BY matched_at DESC, id DESC)
+CREATE INDEX IF NOT EXISTS idx_matches_user1_matched_at ON matches(user1_id, matched_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_matches_user2_matched_at ON matches(user2_id, matched_at DESC, id DESC);
 
 -- Проверка индексов
 SELECT 
@@ -0,0 +1,74 @@
+-- Миграция: инкрементальные счетчики профилей вместо агрегирующего представления profile_stats
+-- Выполнить на существующей БД. Скрипт идемпотентный: повторный запуск пересчитывает
+-- счетчики из истории свайпов (например, после ручных правок swipes/matches)
+
+CREATE TABLE IF NOT EXISTS profile_counters (
+    profile_id BIGINT PRIMARY KEY,
+    likes_received INTEGER NOT NULL DEFAULT 0,
+    likes_sent INTEGER NOT NULL DEFAULT 0,
+    matches_count INTEGER NOT NULL DEFAULT 0,
+    pending_incoming INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (profile_id) REFERENCES profiles(id) ON DELETE CASCADE
+);
+
+-- Заполняем счетчики из истории. Каждый агрегат считается отдельно (без
+-- COUNT(DISTINCT) по декартову произведению swipes x swipes x matches)
+INSERT INTO profile_counters (profile_id, likes_received, likes_sent, matches_count, pending_incoming)
+SELECT
+    p.id,
+    COALESCE(lr.cnt, 0),
+    COALESCE(ls.cnt, 0),
+    COALESCE(mc.cnt, 0),
+    COALESCE(pi.cnt, 0)
+FROM profiles p
+LEFT JOIN (
+    SELECT target_profile_id, COUNT(*) AS cnt FROM swipes
+    WHERE action = 'like' GROUP BY target_profile_id
+) lr ON lr.target_profile_id = p.id
+LEFT JOIN (
+    SELECT user_id, COUNT(*) AS cnt FROM swipes
+    WHERE action = 'like' GROUP BY user_id
+) ls ON ls.user_id = p.user_id
+LEFT JOIN (
+    SELECT user_id, COUNT(*) AS cnt FROM (
+        SELECT user1_id AS user_id FROM matches
+        UNION ALL
+        SELECT user2_id FROM matches
+    ) m GROUP BY user_id
+) mc ON mc.user_id = p.user_id
+LEFT JOIN (
+    -- Входящие лайки без ответа: лайк от пользователя с профилем, на которого владелец не свайпал
+    SELECT l.target_profile_id, COUNT(*) AS cnt
+    FROM swipes l
+    JOIN profiles liker ON liker.user_id = l.user_id
+    JOIN profiles own ON own.id = l.target_profile_id
+    WHERE l.action = 'like'
+      AND NOT EXISTS (
+          SELECT 1 FROM swipes r
+          WHERE r.user_id = own.user_id AND r.target_profile_id = liker.id
+      )
+    GROUP BY l.target_profile_id
+) pi ON pi.target_profile_id = p.id
+ON CONFLICT (profile_id) DO UPDATE SET
+    likes_received = EXCLUDED.likes_received,
+    likes_sent = EXCLUDED.likes_sent,
+    matches_count = EXCLUDED.matches_count,
+    pending_incoming = EXCLUDED.pending_incoming,
+    updated_at = CURRENT_TIMESTAMP;
+
+-- profile_stats остается для совместимости, но читает готовые счетчики
+DROP VIEW IF EXISTS profile_stats;
+CREATE VIEW profile_stats AS
+SELECT
+    p.id,
+    p.user_id,
+    p.name,
+    COALESCE(c.likes_received, 0) AS likes_received,
+    COALESCE(c.likes_sent, 0) AS likes_sent,
+    COALESCE(c.matches_count, 0) AS matches_count,
+    COALESCE(c.pending_incoming, 0) AS pending_incoming
+FROM profiles p
+LEFT JOIN profile_counters c ON c.profile_id = p.id;
+
+COMMENT ON TABLE profile_counters IS 'Счетчики профилей, обновляются приложением на каждом свайпе и мэтче';
@@ -0,0 +1,38 @@
+-- Миграция: нормализованные теги интересов и целей профилей
+-- Выполнить на существующей БД. Скрипт идемпотентный - можно запускать повторно
+-- (например, после массовой загрузки профилей в обход API)
+
+CREATE TABLE IF NOT EXISTS profile_tags (
+    profile_id BIGINT NOT NULL,
+    kind VARCHAR(10) NOT NULL CHECK (kind IN ('interest', 'goal')),
+    tag VARCHAR(100) NOT NULL,
+    PRIMARY KEY (profile_id, kind, tag),
+    FOREIGN KEY (profile_id) REFERENCES profiles(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_profile_tags_kind_tag ON profile_tags(kind, tag, profile_id);
+
+-- Заполняем теги из JSON массивов profiles.interests / profiles.goals
+-- (теги нормализуются так же, как в приложении: trim + lower, не длиннее 100 символов)
+INSERT INTO profile_tags (profile_id, kind, tag)
+SELECT DISTINCT p.id, 'interest', LEFT(LOWER(BTRIM(t.tag)), 100)
+FROM profiles p
+CROSS JOIN LATERAL jsonb_array_elements_text(
+    CASE WHEN p.interests ~ '^\s*\[' THEN p.interests::jsonb ELSE '[]'::jsonb END
+) AS t(tag)
+WHERE BTRIM(t.tag) <> ''
+ON CONFLICT DO NOTHING;
+
+INSERT INTO profile_tags (profile_id, kind, tag)
+SELECT DISTINCT p.id, 'goal', LEFT(LOWER(BTRIM(t.tag)), 100)
+FROM profiles p
+CROSS JOIN LATERAL jsonb_array_elements_text(
+    CASE WHEN p.goals ~ '^\s*\[' THEN p.goals::jsonb ELSE '[]'::jsonb END
+) AS t(tag)
+WHERE BTRIM(t.tag) <> ''
+ON CONFLICT DO NOTHING;
+
+-- Проверка
+SELECT kind, COUNT(*) AS tags, COUNT(DISTINCT profile_id) AS profiles
+FROM profile_tags
+GROUP BY kind;
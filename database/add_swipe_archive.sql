@@ -0,0 +1,29 @@
+-- Миграция: архив старых пассов
+-- Выполнить на существующей БД. Скрипт идемпотентный - можно запускать повторно.
+--
+-- Старые пассы переносит из swipes в swipe_archive фоновая задача приложения
+-- (app/services/swipe_archive.py): строка на пасс, первичный ключ
+-- (user_id, target_profile_id) - как UNIQUE в swipes. Лайки не архивируются -
+-- они нужны для мэтчей и входящих лайков.
+
+CREATE TABLE IF NOT EXISTS swipe_archive (
+    user_id BIGINT NOT NULL,
+    target_profile_id BIGINT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, target_profile_id)
+);
+
+-- Для каскадного удаления при удалении профиля
+CREATE INDEX IF NOT EXISTS idx_swipe_archive_target ON swipe_archive(target_profile_id);
+
+-- Поиск старых пассов для архивации; по created_at swipes ищутся только пассы,
+-- поэтому частичный индекс заменяет полный idx_swipes_created_at
+CREATE INDEX IF NOT EXISTS idx_swipes_pass_created_at ON swipes(created_at) WHERE action = 'pass';
+
+-- Избыточные индексы swipes: каждая вставка свайпа обновляет все индексы таблицы
+DROP INDEX IF EXISTS idx_swipes_user_target;  -- дубль UNIQUE(user_id, target_profile_id)
+DROP INDEX IF EXISTS idx_swipes_user_id;  -- префикс того же UNIQUE
+DROP INDEX IF EXISTS idx_swipes_created_at;  -- заменен idx_swipes_pass_created_at
+DROP INDEX IF EXISTS idx_swipes_action;  -- два значения; action ищется только вместе с user_id или target_profile_id
+
+COMMENT ON TABLE swipe_archive IS 'Архив старых пассов: строка на пасс, ключ (user_id, target_profile_id)';
@@ -31,6 +31,19 @@ CREATE INDEX IF NOT EXISTS idx_profiles_university ON profiles(university);
 CREATE INDEX IF NOT EXISTS idx_profiles_gender ON profiles(gender);
 CREATE INDEX IF NOT EXISTS idx_profiles_age ON profiles(age);
 
+-- Нормализованные интересы и цели профиля (по строке на тег)
+-- Заполняется приложением при сохранении профиля, используется для фильтрации ленты
+CREATE TABLE IF NOT EXISTS profile_tags (
+    profile_id BIGINT NOT NULL,
+    kind VARCHAR(10) NOT NULL CHECK (kind IN ('interest', 'goal')),
+    tag VARCHAR(100) NOT NULL,
+    PRIMARY KEY (profile_id, kind, tag),
+    FOREIGN KEY (profile_id) REFERENCES profiles(id) ON DELETE CASCADE
+);
+
+-- Индекс для поиска профилей по тегу: WHERE kind = ... AND tag IN (...)
+CREATE INDEX IF NOT EXISTS idx_profile_tags_kind_tag ON profile_tags(kind, tag, profile_id);
+
 -- Таблица свайпов (лайки и дизлайки)
 CREATE TABLE IF NOT EXISTS swipes (
     id BIGSERIAL PRIMARY KEY,
@@ -42,15 +55,22 @@ CREATE TABLE IF NOT EXISTS swipes (
     FOREIGN KEY (target_profile_id) REFERENCES profiles(id) ON DELETE CASCADE
 );
 
--- Индексы для таблицы swipes
-CREATE INDEX IF NOT EXISTS idx_swipes_user_id ON swipes(user_id);
+-- Индексы для таблицы swipes. Поиск по user_id и по (user_id, target_profile_id)
+-- идет по индексу UNIQUE - отдельные индексы для него не нужны
 CREATE INDEX IF NOT EXISTS idx_swipes_target_profile_id ON swipes(target_profile_id);
-CREATE INDEX IF NOT EXISTS idx_swipes_action ON swipes(action);
-CREATE INDEX IF NOT EXISTS idx_swipes_created_at ON swipes(created_at);
--- Составной индекс для частого запроса: поиск свайпов по user_id и target_profile_id
-CREATE INDEX IF NOT EXISTS idx_swipes_user_target ON swipes(user_id, target_profile_id);
 -- Составной индекс для поиска лайков на профиль
 CREATE INDEX IF NOT EXISTS idx_swipes_target_action ON swipes(target_profile_id, action) WHERE action = 'like';
+-- Поиск старых пассов для архивации
+CREATE INDEX IF NOT EXISTS idx_swipes_pass_created_at ON swipes(created_at) WHERE action = 'pass';
+
+-- Архив старых пассов (переносит задача архивации приложения)
+CREATE TABLE IF NOT EXISTS swipe_archive (
+    user_id BIGINT NOT NULL,
+    target_profile_id BIGINT NOT NULL REFERENCES profiles(id) ON DELETE CASCADE,
+    archived_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, target_profile_id)
+);
+CREATE INDEX IF NOT EXISTS idx_swipe_archive_target ON swipe_archive(target_profile_id);
 
 -- Таблица мэтчей (взаимные лайки)
 CREATE TABLE IF NOT EXISTS matches (
@@ -70,6 +90,9 @@ CREATE INDEX IF NOT EXISTS idx_matches_user2_id ON matches(user2_id);
 CREATE INDEX IF NOT EXISTS idx_matches_matched_at ON matches(matched_at);
 -- Составной индекс для поиска мэтчей (ускоряет запросы с OR условием)
 CREATE INDEX IF NOT EXISTS idx_matches_user1_user2 ON matches(user1_id, user2_id);
+-- Keyset-пагинация списка мэтчей пользователя (ORDER BY matched_at DESC, id DESC)
+CREATE INDEX IF NOT EXISTS idx_matches_user1_matched_at ON matches(user1_id, matched_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_matches_user2_matched_at ON matches(user2_id, matched_at DESC, id DESC);
 
 -- Таблица отметок полезности коннекта
 CREATE TABLE IF NOT EXISTS connection_feedbacks (
@@ -105,25 +128,37 @@ $$ language 'plpgsql';
 CREATE TRIGGER update_profiles_updated_at BEFORE UPDATE ON profiles
     FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
--- Представление для статистики
+-- Счетчики профилей (обновляются приложением на каждом свайпе и мэтче)
+CREATE TABLE IF NOT EXISTS profile_counters (
+    profile_id BIGINT PRIMARY KEY,
+    likes_received INTEGER NOT NULL DEFAULT 0,
+    likes_sent INTEGER NOT NULL DEFAULT 0,
+    matches_count INTEGER NOT NULL DEFAULT 0,
+    pending_incoming INTEGER NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    FOREIGN KEY (profile_id) REFERENCES profiles(id) ON DELETE CASCADE
+);
+
+-- Представление для статистики (читает готовые счетчики, без агрегатов по swipes)
 CREATE OR REPLACE VIEW profile_stats AS
 SELECT 
     p.id,
     p.user_id,
     p.name,
-    COUNT(DISTINCT s1.id) as likes_received,
-    COUNT(DISTINCT s2.id) as likes_sent,
-    COUNT(DISTINCT m.id) as matches_count
+    COALESCE(c.likes_received, 0) AS likes_received,
+    COALESCE(c.likes_sent, 0) AS likes_sent,
+    COALESCE(c.matches_count, 0) AS matches_count,
+    COALESCE(c.pending_incoming, 0) AS pending_incoming
 FROM profiles p
-LEFT JOIN swipes s1 ON s1.target_profile_id = p.id AND s1.action = 'like'
-LEFT JOIN swipes s2 ON s2.user_id = p.user_id AND s2.action = 'like'
-LEFT JOIN matches m ON (m.user1_id = p.user_id OR m.user2_id = p.user_id)
-GROUP BY p.id, p.user_id, p.name;
+LEFT JOIN profile_counters c ON c.profile_id = p.id;
 
 -- Комментарии к таблицам
 COMMENT ON TABLE profiles IS 'Профили пользователей';
 COMMENT ON TABLE swipes IS 'История свайпов (лайки и дизлайки)';
+COMMENT ON TABLE swipe_archive IS 'Архив старых пассов: строка на пасс, ключ (user_id, target_profile_id)';
 COMMENT ON TABLE matches IS 'Мэтчи между пользователями (взаимные лайки)';
+COMMENT ON TABLE profile_tags IS 'Нормализованные интересы и цели профилей (для фильтрации ленты)';
+COMMENT ON TABLE profile_counters IS 'Счетчики профилей, обновляются приложением на каждом свайпе и мэтче';
 COMMENT ON TABLE connection_feedbacks IS 'Отметки полезности коннекта между пользователями';
 
 COMMENT ON COLUMN profiles.interests IS 'JSON массив интересов: ["IT", "Дизайн"]';